@@ -3,6 +3,10 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+リアルタイム通知（/workflow/events/queue/ の Server-Sent Events）はASGIでのみ配信される。
+また、ダッシュボード・申請詳細・受付待ち・承認待ちは非同期版ビュー（config.urls_asgi）で配信する。
+    uvicorn config.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +16,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'config.urls_asgi')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,16 +42,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'workflow.middleware.MetricsMiddleware',  # 処理時間・SQLの実行回数（/metrics）
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'workflow.middleware.UserContextMiddleware',  # 権限の判定に使うユーザーコンテキスト（セッションに保存）
+    'workflow.middleware.ProfilingMiddleware',  # リクエストのプロファイル（?_profile=1・低速なリクエスト）
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'workflow.middleware.AuditContextMiddleware',  # 監査ログの操作者設定
+    'workflow.middleware.CacheVersionMiddleware',  # ロール・申請種別設定のキャッシュのバージョン確認
+    'workflow.middleware.ReplicaRoutingMiddleware',  # 参照系の画面の読み取りをレプリカへ振り分け
 ]
 
-ROOT_URLCONF = 'config.urls'
+# ASGI（config/asgi.py）では非同期ビュー用のURL設定に切り替える
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'config.urls')
 
 TEMPLATES = [
     {
@@ -63,6 +71,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'workflow.context_processors.inbox',
+                'workflow.context_processors.user_context',
             ],
         },
     },
@@ -83,11 +93,45 @@ DATABASES = {
         'HOST': 'localhost',
         'PORT': '5432',
         'OPTIONS': {
-            'options': '-c search_path=wkflowx'  # スキーマ指定
-        }
+            'options': '-c search_path=wkflowx'  # スキーマ指定（接続の確立時に1回だけ送られる）
+        },
+        # 接続をスレッドごとに持続する秒数と、再利用前の接続確認
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# 接続プール（workflow/backends/postgresql_pool）
+# DB_POOL_MAX_SIZE を指定した場合はワーカープロセスごとに最大その数の接続をプールし、
+# リクエスト終了時に接続を閉じずにプールへ返す（python manage.py benchmark_connections で効果を確認）
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '0'))
+if DB_POOL_MAX_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': 'workflow.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+    })
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    }
+
+# 読み取り専用レプリカ（参照系の画面の読み取り先。workflow/db_routing.py）
+# DB_REPLICA_HOSTS にカンマ区切りでホストを指定すると replica1, replica2, ... として追加する。
+# ローカルで確認する場合は DB_REPLICA_HOSTS=localhost とすれば default と同じDBをレプリカとして使う
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['workflow.db_routing.ReplicaRouter']
+
+# レプリカの許容遅延（秒）。超えたレプリカは使わずプライマリから読む
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+
+# 自分の書き込み後、読み取りをプライマリに固定する時間（秒）。REPLICA_MAX_LAG より長くする
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
 # SQLite使用時の設定例（コメントアウト）
 # DATABASES = {
 #     'default': {
@@ -97,6 +141,58 @@ DATABASES = {
 # }
 
 
+# キャッシュ（全ワーカーで共有）
+# WORKFLOW_CACHE_URL に redis:// を指定した場合は Redis互換サーバー（要 redis パッケージ）、
+# 未指定の場合は同一サーバー上の全ワーカーで共有するファイルベースのキャッシュを使用する
+WORKFLOW_CACHE_URL = os.environ.get('WORKFLOW_CACHE_URL', '')
+
+if WORKFLOW_CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': WORKFLOW_CACHE_URL,
+            'KEY_PREFIX': 'wkflowx',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('WORKFLOW_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'KEY_PREFIX': 'wkflowx',
+            'OPTIONS': {
+                'MAX_ENTRIES': 20000,
+            },
+        }
+    }
+
+
+# セッションの保存先（WORKFLOW_SESSION_STORAGE、workflow/sessions.py）
+# 'db': django_session テーブル（既定） / 'cached_db': 共有キャッシュ + DB / 'signed_cookies': 署名付きCookie
+# 切り替え後は python manage.py migrate_sessions でログイン中のセッションを移す
+WORKFLOW_SESSION_STORAGE = os.environ.get('WORKFLOW_SESSION_STORAGE', 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'workflow.sessions',
+}[WORKFLOW_SESSION_STORAGE]
+
+# 運用メトリクス（/metrics、workflow/metrics.py）の取得元の制限
+# METRICS_TOKEN を指定した場合は Authorization: Bearer <トークン> を要求し、
+# 指定しない場合は METRICS_ALLOWED_IPS からの取得のみ許可する
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# リクエストのプロファイル（workflow/profiling.py、管理画面の「リクエストプロファイル」）
+# スタッフは ?_profile=1（cProfile は ?_profile=cprofile）で指定する。指定がなくても
+# PROFILING_SAMPLE_RATE の割合のリクエストでスタックを採取し、PROFILING_SLOW_MS 以上かかったものを保存する
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_SLOW_MS = float(os.environ.get('PROFILING_SLOW_MS', '1000'))
+PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', '5'))
+
+# 画面遷移のメッセージ（messages.success など）はCookieに保存し、セッションを書き換えない
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -144,6 +240,10 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'workflow-system@example.com'
 SITE_URL = 'http://localhost:8000'
 
+# リアルタイム通知（SSE）の配信方式
+# 'local': プロセス内配信 / 'postgresql': LISTEN/NOTIFY で全ワーカーへ配信
+WORKFLOW_EVENT_BACKEND = 'local'
+
 # Login settings
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/workflow/'
@@ -8,11 +8,14 @@ from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from django.shortcuts import redirect
 
+from workflow.views import metrics_endpoint
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/login/', auth_views.LoginView.as_view(), name='login'),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('workflow/', include('workflow.urls')),
+    path('metrics', metrics_endpoint, name='metrics'),  # 運用メトリクス（Prometheus）
     path('', lambda request: redirect('workflow:dashboard')),  # ルートをダッシュボードにリダイレクト
 ]
 
@@ -0,0 +1,13 @@
+"""
+URL configuration for config project (ASGI).
+
+config/asgi.py から配信する場合のURL設定。
+ワークフローの参照系画面を非同期ビュー（workflow.urls_async）に差し替える。
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('workflow/', include('workflow.urls_async')),
+] + [pattern for pattern in wsgi_urlpatterns if str(pattern.pattern) != 'workflow/']
@@ -1,12 +1,75 @@
 """
 業務ワークフローシステムの管理画面設定（製造業・建設業向け）
 """
+import json
+
 from django.contrib import admin
-from django.utils.html import format_html
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
 from .models import (
     UserProfile, Application, WorkflowStep, Comment, Attachment,
-    WorkflowRole, RoleMember, ApplicationTypeConfig
+    WorkflowRole, RoleMember, ApplicationTypeConfig, AuditEvent, BackgroundTask, SLAEscalation,
+    ApplicationStatusCount, RequestProfile
 )
+from .db_routing import replica_reads
+from .forms import ApplicationAdminForm
+from .profiling import folded_stacks, hot_frames, load_data, pstats_dump, query_summary
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    件数の多い一覧用のページネーター
+    
+    PostgreSQL では実行計画の推定件数を使い、推定が EXACT_COUNT_LIMIT 件未満の場合のみ COUNT(*) を実行する
+    （絞り込み後の少ない件数は正確に、全件に近い件数は概数で表示する）。
+    """
+    EXACT_COUNT_LIMIT = 10000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            estimate = self._estimate(queryset, connection)
+            if estimate >= self.EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+    
+    def _estimate(self, queryset, connection):
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ReplicaChangelistMixin:
+    """一覧画面（changelist）の読み取りをレプリカへ送る"""
+    
+    @method_decorator(replica_reads)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
+
+
+class LargeTableAdminMixin(ReplicaChangelistMixin):
+    """
+    件数の多いテーブルの一覧画面
+    
+    レプリカから読み、全件数（絞り込みなしの COUNT(*)）は表示せず、ページ送り用の件数は推定値を使う。
+    部分一致検索はトライグラム索引（PostgreSQL、マイグレーション 0007）を使う。
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
 
 @admin.register(WorkflowRole)
@@ -30,15 +93,20 @@ class WorkflowRoleAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # メンバー数は一覧のクエリで集計する（行ごとの COUNT を避ける）
+        return super().get_queryset(request).annotate(member_total=Count('members'))
+    
     def member_count(self, obj):
-        count = obj.get_members_count()
-        return format_html('<strong>{}</strong> 人', count)
+        return format_html('<strong>{}</strong> 人', obj.member_total)
     member_count.short_description = 'メンバー数'
+    member_count.admin_order_field = 'member_total'
 
 
 @admin.register(RoleMember)
 class RoleMemberAdmin(admin.ModelAdmin):
     list_display = ['role', 'user', 'user_email', 'assigned_at', 'assigned_by']
+    list_select_related = ['role', 'user', 'assigned_by']
     list_filter = ['role', 'assigned_at']
     search_fields = ['user__username', 'user__email', 'role__name']
     readonly_fields = ['assigned_at']
@@ -68,6 +136,7 @@ class ApplicationTypeConfigAdmin(admin.ModelAdmin):
         'is_active',
         'updated_at'
     ]
+    list_select_related = ['receiver_role', 'approver_role']
     list_filter = ['is_active', 'receiver_role', 'approver_role']
     search_fields = ['application_type']
     readonly_fields = ['created_at', 'updated_at']
@@ -80,6 +149,16 @@ class ApplicationTypeConfigAdmin(admin.ModelAdmin):
         ('ロール設定', {
             'fields': ('receiver_role', 'approver_role')
         }),
+        ('SLA', {
+            'fields': (
+                ('receive_reminder_hours', 'receive_escalation_hours'),
+                ('approve_reminder_hours', 'approve_escalation_hours'),
+            ),
+            'description': '期限を過ぎた受付待ち・承認待ちの申請は escalate_sla コマンドで通知されます'
+        }),
+        ('通知', {
+            'fields': ('urgent_notifications',)
+        }),
         ('ステータス', {
             'fields': ('is_active',)
         }),
@@ -97,14 +176,18 @@ class ApplicationTypeConfigAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'role', 'company_name', 'department', 'phone_number']
-    list_filter = ['role']
+    list_display = ['user', 'role', 'company_name', 'department', 'phone_number', 'notification_frequency']
+    list_select_related = ['user']
+    list_filter = ['role', 'notification_frequency']
+    readonly_fields = ['unread_notifications']
     search_fields = ['user__username', 'company_name', 'department']
     ordering = ['company_name', 'user__username']
 
 
 @admin.register(Application)
-class ApplicationAdmin(admin.ModelAdmin):
+class ApplicationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    form = ApplicationAdminForm
+    list_select_related = ['applicant']
     list_display = [
         'application_number',
         'get_application_type_display',
@@ -176,7 +259,7 @@ class ApplicationAdmin(admin.ModelAdmin):
 
 
 @admin.register(WorkflowStep)
-class WorkflowStepAdmin(admin.ModelAdmin):
+class WorkflowStepAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = [
         'application',
         'step_type',
@@ -185,6 +268,7 @@ class WorkflowStepAdmin(admin.ModelAdmin):
         'processed_at',
         'created_at'
     ]
+    list_select_related = ['application', 'processor']
     list_filter = ['step_type', 'status', 'processed_at']
     search_fields = ['application__application_number', 'processor__username']
     readonly_fields = ['created_at']
@@ -192,8 +276,9 @@ class WorkflowStepAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['application', 'user', 'content_preview', 'created_at']
+    list_select_related = ['application', 'user']
     list_filter = ['created_at']
     search_fields = ['application__application_number', 'user__username', 'content']
     readonly_fields = ['created_at']
@@ -205,7 +290,7 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Attachment)
-class AttachmentAdmin(admin.ModelAdmin):
+class AttachmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = [
         'filename',
         'application',
@@ -213,6 +298,7 @@ class AttachmentAdmin(admin.ModelAdmin):
         'uploaded_by',
         'uploaded_at'
     ]
+    list_select_related = ['application', 'uploaded_by']
     list_filter = ['uploaded_at']
     search_fields = ['filename', 'application__application_number', 'uploaded_by__username']
     readonly_fields = ['file_size', 'uploaded_at']
@@ -223,6 +309,181 @@ class AttachmentAdmin(admin.ModelAdmin):
     file_size_display_admin.short_description = 'ファイルサイズ'
 
 
+@admin.register(AuditEvent)
+class AuditEventAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['occurred_at', 'event_type', 'source', 'target_model', 'target_id', 'application', 'actor']
+    list_filter = ['event_type', 'source', 'target_model']
+    search_fields = ['application__application_number', 'actor__username']
+    list_select_related = ['application', 'actor']
+    date_hierarchy = 'occurred_at'
+    readonly_fields = [
+        'event_type', 'source', 'target_model', 'target_id',
+        'application', 'actor', 'changes', 'occurred_at', 'month'
+    ]
+    
+    # 監査ログは追記専用のため、管理画面からの追加・変更・削除は不可
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'locked_by']
+    date_hierarchy = 'created_at'
+    readonly_fields = ['attempts', 'locked_by', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry_tasks']
+    
+    @admin.action(description='選択したタスクを再実行する')
+    def retry_tasks(self, request, queryset):
+        updated = queryset.exclude(status='queued').update(
+            status='queued', run_at=timezone.now(), attempts=0, locked_by='', finished_at=None
+        )
+        self.message_user(request, f'{updated}件のタスクを再実行待ちにしました。')
+
+
+
+@admin.register(SLAEscalation)
+class SLAEscalationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['application', 'stage', 'level', 'stage_started_at', 'notified_at']
+    list_filter = ['stage', 'level']
+    search_fields = ['application__application_number']
+    list_select_related = ['application']
+    date_hierarchy = 'notified_at'
+    readonly_fields = ['application', 'stage', 'level', 'stage_started_at', 'notified_at']
+    
+    # 通知履歴はスケジューラのみが記録する
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ApplicationStatusCount)
+class ApplicationStatusCountAdmin(admin.ModelAdmin):
+    list_display = ['application_type', 'status', 'count']
+    list_filter = ['application_type', 'status']
+    
+    # 申請の保存時に増減する集計値（ずれた場合は python manage.py rebuild_status_counts）
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = [
+        'created_at', 'method', 'path', 'view_name', 'user', 'status_code',
+        'duration_ms', 'query_count', 'query_ms', 'trigger', 'mode'
+    ]
+    list_filter = ['trigger', 'mode', 'view_name']
+    search_fields = ['path', 'user__username']
+    list_select_related = ['user']
+    date_hierarchy = 'created_at'
+    fields = [
+        'created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'trigger', 'mode',
+        'sample_count', 'query_count', 'query_ms', 'raw_size', 'downloads', 'repeated_queries', 'frames',
+        'pstats_text', 'queries'
+    ]
+    readonly_fields = fields
+    
+    # プロファイルはミドルウェアのみが記録する（削除は可）
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/<str:kind>/', self.admin_site.admin_view(self.download_view),
+                 name='workflow_requestprofile_download'),
+        ] + super().get_urls()
+    
+    def download_view(self, request, pk, kind):
+        """折りたたみ形式のスタック（flamegraph.pl・speedscope）・pstats・SQLの一覧をダウンロードする"""
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise Http404
+        data = self._data(profile)
+        if kind == 'folded':
+            content, content_type, extension = folded_stacks(data), 'text/plain; charset=utf-8', 'folded'
+        elif kind == 'pstats' and 'pstats' in data:
+            content, content_type, extension = pstats_dump(data), 'application/octet-stream', 'prof'
+        elif kind == 'sql':
+            content = json.dumps(data['queries'], ensure_ascii=False, indent=1)
+            content_type, extension = 'application/json', 'json'
+        else:
+            raise Http404
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="profile_{profile.pk}.{extension}"'
+        return response
+    
+    def _data(self, obj):
+        # 詳細画面の各項目で1回だけ展開する
+        if getattr(obj, '_profile_data', None) is None:
+            obj._profile_data = load_data(obj)
+        return obj._profile_data
+    
+    def downloads(self, obj):
+        kinds = [('folded', 'フレームグラフ用（折りたたみ形式）'), ('sql', 'SQL一覧（JSON）')]
+        if obj.mode == 'cprofile':
+            kinds = [('pstats', 'cProfile（pstats）')] + kinds
+        return format_html_join(
+            ' / ', '<a href="{}">{}</a>',
+            ((reverse('admin:workflow_requestprofile_download', args=[obj.pk, kind]), label) for kind, label in kinds)
+        )
+    downloads.short_description = 'ダウンロード'
+    
+    def repeated_queries(self, obj):
+        # format_html_join は引数をエスケープした文字列にするため、書式指定は事前に済ませる
+        rows = [(count, f'{total_ms:.1f}', sql) for sql, count, total_ms in query_summary(self._data(obj))]
+        return format_html(
+            '<table><tr><th>回数</th><th>合計（ms）</th><th>SQL</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>', rows)
+        )
+    repeated_queries.short_description = '実行回数の多いSQL'
+    
+    def frames(self, obj):
+        rows = [
+            (f'{ratio:.0%}', own, inclusive, label)
+            for label, own, inclusive, ratio in hot_frames(self._data(obj))
+        ]
+        if not rows:
+            return '-'
+        return format_html(
+            '<table><tr><th>割合</th><th>自身</th><th>呼び出し先を含む</th><th>関数</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td><code>{}</code></td></tr>', rows)
+        )
+    frames.short_description = '時間のかかった関数（スタック採取）'
+    
+    def pstats_text(self, obj):
+        text = self._data(obj).get('pstats_text')
+        return format_html('<pre>{}</pre>', text) if text else '-'
+    pstats_text.short_description = 'cProfile（累積時間の上位）'
+    
+    def queries(self, obj):
+        rows = [(query['ms'], query['db'], query['sql']) for query in self._data(obj)['queries']]
+        return format_html(
+            '<table><tr><th>ms</th><th>DB</th><th>SQL（実行順）</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td><code>{}</code></td></tr>', rows)
+        )
+    queries.short_description = 'SQL'
+
+
 # 管理画面のカスタマイズ
 admin.site.site_header = '業務ワークフローシステム 管理画面'
 admin.site.site_title = 'ワークフロー管理'
@@ -0,0 +1,455 @@
+"""
+業務ワークフローシステムのJSON API（ゲート警備タブレット・ERP連携向け）
+
+- スパースフィールドセット: ?fields=application_number,title,status
+  （content / entry_members は指定した場合のみ返す）
+- カーソルページネーション: ?cursor=...&limit=50
+- 強いETag: 更新日時から算出し、If-None-Match 一致時は304を返す
+- 立入者・持込工具の検索（警備向け）: /api/lookup/entry-members/?name=... / /api/lookup/tools/?name=...
+"""
+import base64
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_GET
+
+from .db_routing import replica_reads
+from .models import (
+    Application, WorkflowStep, Comment, Attachment,
+    ApplicationTool, ApplicationEntryMember, normalize_name
+)
+from .views import (
+    filter_dashboard_applications, filter_pending_approve, filter_pending_receive, get_accessible_applications
+)
+from .user_context import get_user_context
+
+
+# 1ページの件数
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class APIError(Exception):
+    """APIのリクエストエラー（400系のJSONレスポンスに変換する）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_view(view_func):
+    """
+    ログイン必須・GET専用・APIError をJSONレスポンスに変換するデコレータ
+
+    ETag算出（condition）より外側に適用し、未ログインのリクエストではETagを計算しない。
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'ログインが必要です。'}, status=401)
+        try:
+            return view_func(request, *args, **kwargs)
+        except APIError as e:
+            return JsonResponse({'error': e.message}, status=e.status)
+    return require_GET(wrapper)
+
+
+def _json(data):
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def _etag(*parts):
+    """値の並びから強いETagを作成する"""
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+# ---------------------------------------------------------------------------
+# スパースフィールドセット
+# ---------------------------------------------------------------------------
+
+def _username(user):
+    return user.username if user else None
+
+
+# APIフィールド名 → (only() で読み込むモデルフィールド, 値の取得関数)
+APPLICATION_FIELDS = {
+    'id': (['id'], lambda app: app.pk),
+    'application_number': (['application_number'], lambda app: app.application_number),
+    'application_type': (['application_type'], lambda app: app.application_type),
+    'application_type_display': (['application_type'], lambda app: app.get_application_type_display()),
+    'title': (['title'], lambda app: app.title),
+    'content': (['content'], lambda app: app.content),
+    'applicant': (['applicant__username'], lambda app: _username(app.applicant)),
+    'company_name': (['company_name'], lambda app: app.company_name),
+    'work_location': (['work_location'], lambda app: app.work_location),
+    'work_start_date': (['work_start_date'], lambda app: app.work_start_date),
+    'work_end_date': (['work_end_date'], lambda app: app.work_end_date),
+    'worker_count': (['worker_count'], lambda app: app.worker_count),
+    'tool_list': (['tool_list'], lambda app: app.tool_list),
+    'restricted_area': (['restricted_area'], lambda app: app.restricted_area),
+    'entry_purpose': (['entry_purpose'], lambda app: app.entry_purpose),
+    'entry_members': (['entry_members'], lambda app: app.entry_members),
+    'contractor_name': (['contractor_name'], lambda app: app.contractor_name),
+    'status': (['status'], lambda app: app.status),
+    'status_display': (['status'], lambda app: app.get_status_display()),
+    'created_at': (['created_at'], lambda app: app.created_at),
+    'updated_at': (['updated_at'], lambda app: app.updated_at),
+    'submitted_at': (['submitted_at'], lambda app: app.submitted_at),
+    'received_at': (['received_at'], lambda app: app.received_at),
+    'approved_at': (['approved_at'], lambda app: app.approved_at),
+}
+
+# 指定がない場合は大きなテキスト項目を返さない
+DEFAULT_APPLICATION_FIELDS = [
+    name for name in APPLICATION_FIELDS if name not in ('content', 'entry_members')
+]
+
+
+def parse_fields(request, available, default):
+    """?fields= を解析し、返却するフィールド名のリストを返す"""
+    value = request.GET.get('fields', '')
+    if not value:
+        return list(default)
+
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise APIError(f'不明なフィールドです: {", ".join(unknown)}')
+    return fields
+
+
+def project_applications(queryset, fields, extra=()):
+    """
+    指定フィールドの列だけを読み込むように only() / select_related を適用する
+
+    一覧画面用に射影したクエリセットではなく、絞り込みのみのクエリセットに適用する。
+    """
+    columns = {'id', 'updated_at', *extra}
+    for name in fields:
+        columns.update(APPLICATION_FIELDS[name][0])
+
+    if any(column.startswith('applicant__') for column in columns):
+        queryset = queryset.select_related('applicant')
+    return queryset.only(*columns)
+
+
+def serialize_application(application, fields):
+    return {name: APPLICATION_FIELDS[name][1](application) for name in fields}
+
+
+# ---------------------------------------------------------------------------
+# カーソルページネーション
+# ---------------------------------------------------------------------------
+
+def _encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError
+        return parsed, int(pk)
+    except (ValueError, TypeError):
+        raise APIError('カーソルが不正です。')
+
+
+def _parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise APIError('limit は整数で指定してください。')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def cursor_page(queryset, request, order_field, descending):
+    """
+    (order_field, id) をキーにしたカーソルページネーションを適用する
+
+    Returns:
+        (1ページ分のクエリセット, 次ページの有無を判定するための取得件数)
+    """
+    queryset = queryset.filter(**{f'{order_field}__isnull': False})
+    cursor = request.GET.get('cursor')
+    if cursor:
+        value, pk = _decode_cursor(cursor)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{order_field}__{op}': value}) |
+            Q(**{order_field: value, f'id__{op}': pk})
+        )
+
+    prefix = '-' if descending else ''
+    limit = _parse_limit(request)
+    return queryset.order_by(f'{prefix}{order_field}', f'{prefix}id')[:limit + 1], limit
+
+
+def _page_etag(page, order_field, fields):
+    """ページ内の (id, updated_at) だけを読み込んでETagを作る（本体は読み込まない）"""
+    keys = list(page.values_list('id', 'updated_at'))
+    return _etag(order_field, fields, keys)
+
+
+def _page_response(page, limit, order_field, fields):
+    items = list(page)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = _encode_cursor(getattr(last, order_field), last.pk)
+
+    return _json({
+        'results': [serialize_application(app, fields) for app in items],
+        'next_cursor': next_cursor,
+    })
+
+
+# ---------------------------------------------------------------------------
+# 申請一覧・キュー
+# ---------------------------------------------------------------------------
+
+# 一覧ごとの (絞り込んだクエリセットの取得関数, 並び順の項目, 降順)
+APPLICATION_LISTS = {
+    'applications': (lambda request: filter_dashboard_applications(request.user, request.GET), 'created_at', True),
+    'receive': (lambda request: filter_pending_receive(request.user), 'submitted_at', False),
+    'approve': (lambda request: filter_pending_approve(request.user), 'received_at', False),
+}
+
+
+def _list_page(request, list_name):
+    get_queryset, order_field, descending = APPLICATION_LISTS[list_name]
+    fields = parse_fields(request, APPLICATION_FIELDS, DEFAULT_APPLICATION_FIELDS)
+    queryset = project_applications(get_queryset(request), fields, extra=[order_field])
+    page, limit = cursor_page(queryset, request, order_field, descending)
+    return page, limit, order_field, fields
+
+
+def _list_etag(request, list_name):
+    try:
+        page, limit, order_field, fields = _list_page(request, list_name)
+    except APIError:
+        return None
+    return _page_etag(page, order_field, fields)
+
+
+@replica_reads
+@api_view
+@condition(etag_func=lambda request: _list_etag(request, 'applications'))
+def application_list(request):
+    """申請一覧（ダッシュボードと同じ範囲・検索条件 q / status / type）"""
+    return _page_response(*_list_page(request, 'applications'))
+
+
+def _queue_etag(request, queue):
+    if not _can_view_queue(request.user, queue):
+        return None
+    return _list_etag(request, queue)
+
+
+def _can_view_queue(user, queue):
+    roles = ['receiver', 'admin'] if queue == 'receive' else ['approver', 'admin']
+    return get_user_context(user).has_role(*roles)
+
+
+@replica_reads
+@api_view
+@condition(etag_func=_queue_etag)
+def queue_list(request, queue):
+    """受付待ち（receive）・承認待ち（approve）キュー"""
+    if not _can_view_queue(request.user, queue):
+        raise APIError('このキューを参照する権限がありません。', status=403)
+    return _page_response(*_list_page(request, queue))
+
+
+# ---------------------------------------------------------------------------
+# 申請詳細とサブリソース
+# ---------------------------------------------------------------------------
+
+def _accessible(request):
+    return get_accessible_applications(request.user).select_related(None).prefetch_related(None)
+
+
+def _get_accessible_application(request, pk, fields):
+    try:
+        return project_applications(_accessible(request), fields).get(pk=pk)
+    except Application.DoesNotExist:
+        raise APIError('申請が見つかりません。', status=404)
+
+
+def _detail_etag(request, pk):
+    updated_at = _accessible(request).filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return _etag('application', pk, updated_at, request.GET.get('fields', ''))
+
+
+@api_view
+@condition(etag_func=_detail_etag)
+def application_detail(request, pk):
+    """申請詳細"""
+    fields = parse_fields(request, APPLICATION_FIELDS, DEFAULT_APPLICATION_FIELDS)
+    application = _get_accessible_application(request, pk, fields)
+    return _json(serialize_application(application, fields))
+
+
+# サブリソースごとの (モデル, 作成日時の項目, select_related, 値の取得関数)
+SUB_RESOURCES = {
+    'steps': (WorkflowStep, 'created_at', ['processor'], lambda step: {
+        'id': step.pk,
+        'step_type': step.step_type,
+        'step_type_display': step.get_step_type_display(),
+        'processor': _username(step.processor),
+        'status': step.status,
+        'comment': step.comment,
+        'processed_at': step.processed_at,
+        'created_at': step.created_at,
+    }),
+    'comments': (Comment, 'created_at', ['user'], lambda comment: {
+        'id': comment.pk,
+        'user': _username(comment.user),
+        'content': comment.content,
+        'created_at': comment.created_at,
+    }),
+    'attachments': (Attachment, 'uploaded_at', ['uploaded_by'], lambda attachment: {
+        'id': attachment.pk,
+        'filename': attachment.file_name,
+        'file_size': attachment.file_size,
+        'url': attachment.file.url if attachment.file else None,
+        'uploaded_by': _username(attachment.uploaded_by),
+        'uploaded_at': attachment.uploaded_at,
+    }),
+}
+
+
+def _sub_resource_etag(request, pk, resource):
+    if not _accessible(request).filter(pk=pk).exists():
+        return None
+    model, time_field, _, _ = SUB_RESOURCES[resource]
+    summary = model.objects.filter(application_id=pk).aggregate(latest=Max(time_field), count=Count('id'))
+    return _etag(resource, pk, summary['latest'], summary['count'])
+
+
+@api_view
+@condition(etag_func=_sub_resource_etag)
+def application_sub_resource(request, pk, resource):
+    """申請のワークフロー履歴（steps）・コメント（comments）・添付ファイル（attachments）"""
+    if not _accessible(request).filter(pk=pk).exists():
+        raise APIError('申請が見つかりません。', status=404)
+
+    model, time_field, related, serialize = SUB_RESOURCES[resource]
+    items = model.objects.filter(application_id=pk).select_related(*related).order_by(time_field, 'id')
+    return _json({'results': [serialize(item) for item in items]})
+
+
+# ---------------------------------------------------------------------------
+# 立入者・持込工具の検索
+# ---------------------------------------------------------------------------
+
+# 検索結果の最大件数
+LOOKUP_LIMIT = 200
+
+# 検索できるロール（申請者は不可）
+LOOKUP_ROLES = ['receiver', 'approver', 'admin']
+
+
+def _parse_date_param(request, name, default):
+    value = request.GET.get(name)
+    if not value:
+        return default
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise APIError(f'{name} は YYYY-MM-DD 形式で指定してください。')
+    return parsed
+
+
+def _lookup(request, model, period_from, period_to, extra=lambda item: {}):
+    """
+    正規化した名称・ステータス・期間で明細行を検索する
+
+    (normalized_name, status, start_date) の索引で絞り込み、申請は必要な列だけを結合して読み込む。
+    """
+    if not get_user_context(request.user).has_role(*LOOKUP_ROLES):
+        raise APIError('検索する権限がありません。', status=403)
+
+    name = normalize_name(request.GET.get('name', ''))
+    if not name:
+        raise APIError('name を指定してください。')
+
+    statuses = [value for value in request.GET.get('status', 'approved').split(',') if value]
+    unknown = [value for value in statuses if value not in dict(Application.STATUS_CHOICES)]
+    if unknown:
+        raise APIError(f'不明なステータスです: {", ".join(unknown)}')
+
+    # 期間が重なる明細（開始日 <= 期間の終わり かつ 終了日 >= 期間の始め）
+    queryset = model.objects.filter(
+        normalized_name=name,
+        status__in=statuses,
+        start_date__lte=period_to,
+        end_date__gte=period_from,
+    )
+    application_type = request.GET.get('type')
+    if application_type:
+        queryset = queryset.filter(application_type=application_type)
+
+    items = queryset.select_related('application').only(
+        *[field.name for field in model._meta.concrete_fields],
+        'application__application_number', 'application__title', 'application__company_name',
+        'application__work_location', 'application__restricted_area',
+    ).order_by('start_date', 'id')[:LOOKUP_LIMIT]
+
+    return _json({
+        'from': period_from,
+        'to': period_to,
+        'results': [
+            dict({
+                'name': item.name,
+                'application_id': item.application_id,
+                'application_number': item.application.application_number,
+                'application_type': item.application_type,
+                'title': item.application.title,
+                'company_name': item.application.company_name,
+                'status': item.status,
+                'work_location': item.application.work_location,
+                'restricted_area': item.application.restricted_area,
+                'start_date': item.start_date,
+                'end_date': item.end_date,
+            }, **extra(item))
+            for item in items
+        ],
+    })
+
+
+@replica_reads
+@api_view
+def lookup_entry_members(request):
+    """立入者の検索（既定: 今週・承認済）"""
+    today = timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+    period_from = _parse_date_param(request, 'from', week_start)
+    period_to = _parse_date_param(request, 'to', week_start + timedelta(days=6))
+    return _lookup(
+        request, ApplicationEntryMember, period_from, period_to,
+        extra=lambda item: {'member_company_name': item.company_name}
+    )
+
+
+@replica_reads
+@api_view
+def lookup_tools(request):
+    """持込工具の検索（既定: 本日・承認済）"""
+    on = _parse_date_param(request, 'on', timezone.localdate())
+    return _lookup(request, ApplicationTool, on, on)
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
 
 
 class WorkflowConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workflow'
+
+    def ready(self):
+        from .audit import record_delete
+        from .metrics import install_query_counter
+        from .models import count_deleted_application
+        from .profiling import install_query_recorder
+
+        # リクエスト内のSQLの実行回数を数える（/metrics の workflow_db_queries_total）
+        connection_created.connect(install_query_counter)
+        # プロファイル中のリクエストのSQLと所要時間を記録する（workflow.profiling）
+        connection_created.connect(install_query_recorder)
+        # 監査ログ: 削除（QuerySet.delete() と CASCADE を含む）
+        post_delete.connect(record_delete, sender=self.get_model('Application'))
+        post_delete.connect(record_delete, sender=self.get_model('RoleMember'))
+        # 申請種別 × ステータスの件数: 削除（QuerySet.delete() と CASCADE を含む）
+        post_delete.connect(count_deleted_application, sender=self.get_model('Application'))
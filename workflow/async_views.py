@@ -0,0 +1,187 @@
+"""
+業務ワークフローシステムの非同期ビュー（ASGI用）
+
+参照頻度の高い画面（ダッシュボード・申請詳細・受付待ち・承認待ち）の非同期版。
+config/asgi.py から配信する場合に config.urls_asgi で同期版と差し替えられる。
+クエリセットの組み立ては同期版と共通の関数を使い、件数集計と一覧取得は asyncio.gather でまとめて待つ。
+
+Django 4.2 の非同期ORM（acount・aget・async for）は内部で sync_to_async(thread_sensitive=True) を使うため、
+asyncio.gather で束ねたクエリも1つのスレッドで1件ずつ順に実行される（SQLは並列にならない）。
+効果はクエリの待ち時間にイベントループを止めないことで、1リクエストの応答時間は同期版と変わらない。
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator, Page, InvalidPage
+from django.http import Http404
+from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from .db_routing import replica_reads
+from .forms import CommentForm, AttachmentForm
+from .models import Application
+from .occupancy import attach_conflicts
+from .rows import application_rows, make_rows
+from .user_context import get_user_context
+from .views import (
+    get_dashboard_queryset, get_dashboard_counters, get_accessible_applications,
+    get_action_permissions, get_detail_sections, get_pending_receive_queryset, get_pending_approve_queryset
+)
+
+
+def _load_user(request):
+    """リクエストユーザーとユーザーコンテキスト（役割・所属ロール）を読み込む"""
+    user = request.user
+    return user, get_user_context(user)
+
+
+async def fetch_page(queryset, page_number, per_page):
+    """
+    1ページ分の申請と総件数を取得する
+
+    ページ番号が数値の場合は件数取得と一覧取得を asyncio.gather で待つ（実行は順次。モジュールの説明を参照）。
+    ListView と同じく、範囲外のページは404とする。
+    """
+    paginator = Paginator(queryset, per_page)
+
+    if page_number == 'last':
+        paginator.count = await queryset.acount()
+        number = paginator.num_pages
+        bottom = (number - 1) * per_page
+        objects = [obj async for obj in queryset[bottom:bottom + per_page]]
+    else:
+        try:
+            number = int(page_number)
+        except (TypeError, ValueError):
+            raise Http404('ページ番号が不正です。')
+        if number < 1:
+            raise Http404('ページ番号が不正です。')
+
+        bottom = (number - 1) * per_page
+
+        async def fetch_objects():
+            return [obj async for obj in queryset[bottom:bottom + per_page]]
+
+        paginator.count, objects = await asyncio.gather(queryset.acount(), fetch_objects())
+
+    try:
+        number = paginator.validate_number(number)
+    except InvalidPage as e:
+        raise Http404(f'ページが存在しません: {e}')
+
+    return Page(objects, number, paginator)
+
+
+def _list_context(page):
+    """ListView と同じ名前のページネーション用コンテキストを返す"""
+    return {
+        'applications': page.object_list,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'paginator': page.paginator,
+        'is_paginated': page.paginator.num_pages > 1,
+    }
+
+
+class AsyncLoginRequiredMixin:
+    """非同期ビュー用のログイン・役割チェック"""
+    required_roles = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        user, context = await sync_to_async(_load_user)(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        if self.required_roles is not None and not context.has_role(*self.required_roles):
+            raise PermissionDenied
+
+        return await super().dispatch(request, *args, **kwargs)
+
+
+@method_decorator(replica_reads, name='dispatch')
+class AsyncDashboardView(AsyncLoginRequiredMixin, View):
+    """ダッシュボード（非同期版）"""
+    template_name = 'workflow/dashboard.html'
+    paginate_by = 20
+
+    async def get(self, request):
+        user = request.user
+        queryset, counters = await sync_to_async(self._build_querysets)(user, request.GET)
+
+        # 一覧取得と各統計件数をまとめて待つ（同じスレッドで順に実行される）
+        names = list(counters)
+        page, *counts = await asyncio.gather(
+            fetch_page(queryset, request.GET.get('page') or 1, self.paginate_by),
+            *(counters[name].acount() for name in names)
+        )
+
+        page.object_list = make_rows(page.object_list)
+        context = _list_context(page)
+        context.update(zip(names, counts))
+
+        # フィルター用の選択肢
+        context['status_choices'] = Application.STATUS_CHOICES
+        context['type_choices'] = Application.APPLICATION_TYPE_CHOICES
+
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    def _build_querysets(self, user, params):
+        return application_rows(get_dashboard_queryset(user, params)), get_dashboard_counters(user)
+
+
+class AsyncApplicationDetailView(AsyncLoginRequiredMixin, View):
+    """申請詳細（非同期版）"""
+    template_name = 'workflow/application_detail.html'
+
+    async def get(self, request, pk):
+        user = request.user
+        queryset = await sync_to_async(get_accessible_applications)(user)
+
+        try:
+            application = await queryset.aget(pk=pk)
+        except Application.DoesNotExist:
+            raise Http404('申請が見つかりません。')
+
+        context = {
+            'application': application,
+            'object': application,
+            'comment_form': CommentForm(),
+            'attachment_form': AttachmentForm(),
+        }
+        context.update(await sync_to_async(get_detail_sections)(application))
+        # アクション権限の判定
+        context.update(await sync_to_async(get_action_permissions)(application, user))
+
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+@method_decorator(replica_reads, name='dispatch')
+class AsyncPendingReceiveView(AsyncLoginRequiredMixin, View):
+    """受付待ち一覧（非同期版）"""
+    template_name = 'workflow/pending_receive.html'
+    paginate_by = 20
+    required_roles = ['receiver', 'admin']
+
+    async def get(self, request):
+        queryset = await sync_to_async(get_pending_receive_queryset)(request.user)
+        page = await fetch_page(application_rows(queryset), request.GET.get('page') or 1, self.paginate_by)
+        page.object_list = make_rows(page.object_list)
+        await sync_to_async(attach_conflicts)(page.object_list)
+        return await sync_to_async(render)(request, self.template_name, _list_context(page))
+
+
+@method_decorator(replica_reads, name='dispatch')
+class AsyncPendingApproveView(AsyncLoginRequiredMixin, View):
+    """承認待ち一覧（非同期版）"""
+    template_name = 'workflow/pending_approve.html'
+    paginate_by = 20
+    required_roles = ['approver', 'admin']
+
+    async def get(self, request):
+        queryset = await sync_to_async(get_pending_approve_queryset)(request.user)
+        page = await fetch_page(application_rows(queryset), request.GET.get('page') or 1, self.paginate_by)
+        page.object_list = make_rows(page.object_list)
+        return await sync_to_async(render)(request, self.template_name, _list_context(page))
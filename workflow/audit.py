@@ -0,0 +1,268 @@
+"""
+監査ログ（イベントログ）の記録と再生
+
+申請のフィールド変更・ステータス遷移・削除とロール割当を追記専用の AuditEvent として記録する。
+イベントはトランザクション（セーブポイント）単位でバッファし、コミット後に bulk_create でまとめて書き込む。
+
+記録する操作:
+- save(): 各モデルの save() で作成・差分を記録する
+- QuerySet.update(): AuditedQuerySet（objects）が更新前後の値を読み、行ごとに差分を記録する
+- delete(): post_delete（apps.py で接続）で記録する。QuerySet.delete() や、ユーザー削除による
+  CASCADE も行ごとに記録される（シグナルがあるため Django が1件ずつ読み込んで削除する）
+
+記録しない操作: 生SQL、bulk_create（呼び出し側で record_event を呼ぶ。importer 参照）、
+_base_manager 経由の update()、削除時の SET_NULL（RoleMember.assigned_by など）。
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.utils import timezone
+
+
+# 操作者・操作元（リクエスト単位でミドルウェアが設定する）
+_current_actor = contextvars.ContextVar('audit_actor', default=None)
+_current_source = contextvars.ContextVar('audit_source', default='system')
+
+# コミット待ちのイベントバッファ（スレッド単位）
+_local = threading.local()
+
+
+def get_current_actor():
+    """現在の操作者を返す（未ログインの場合はNone）"""
+    actor = _current_actor.get()
+    if actor is None or not getattr(actor, 'is_authenticated', False):
+        return None
+    return actor
+
+
+def get_current_source():
+    """現在の操作元（web / admin / system）を返す"""
+    return _current_source.get()
+
+
+@contextmanager
+def audit_context(actor=None, source=None):
+    """ブロック内で記録されるイベントの操作者・操作元を設定する"""
+    actor_token = _current_actor.set(actor) if actor is not None else None
+    source_token = _current_source.set(source) if source is not None else None
+    try:
+        yield
+    finally:
+        if source_token is not None:
+            _current_source.reset(source_token)
+        if actor_token is not None:
+            _current_actor.reset(actor_token)
+
+
+def record_event(event_type, target, changes, application=None, using=DEFAULT_DB_ALIAS):
+    """
+    監査イベントを記録する
+
+    トランザクション内ではコミット時にまとめて bulk_create し、
+    ロールバックされたトランザクション・セーブポイントのイベントは破棄される。
+    """
+    AuditEvent = apps.get_model('workflow', 'AuditEvent')
+    now = timezone.now()
+    actor = get_current_actor()
+    event = AuditEvent(
+        event_type=event_type,
+        source=get_current_source(),
+        target_model=target._meta.model_name,
+        target_id=target.pk,
+        application_id=application.pk if application is not None else None,
+        actor_id=actor.pk if actor is not None else None,
+        changes=changes,
+        occurred_at=now,
+        month=now.year * 100 + now.month,
+    )
+
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        AuditEvent.objects.using(using).bulk_create([event])
+        return
+
+    _get_pending(connection, using).append(event)
+
+
+def _get_pending(connection, using):
+    """
+    現在のセーブポイントに対応するバッファを取得（なければ作成してコミット時の書き込みを登録）
+
+    書き込み処理はセーブポイントごとに登録するため、セーブポイントのロールバックで
+    Django が書き込み処理を取り除くと、そのセーブポイントのイベントも書き込まれない。
+    """
+    pending = getattr(_local, 'pending', {})
+    _local.pending = pending
+    key = (using, connection.savepoint_ids[-1] if connection.savepoint_ids else None)
+    entry = pending.get(key)
+
+    # ロールバックで書き込み処理が破棄されていれば、古いバッファごと捨てる
+    if entry is not None and not any(item[1] is entry[0] for item in connection.run_on_commit):
+        entry = None
+
+    if entry is None:
+        events = []
+
+        def flush():
+            if pending.get(key) is entry:
+                del pending[key]
+            if events:
+                AuditEvent = apps.get_model('workflow', 'AuditEvent')
+                AuditEvent.objects.using(using).bulk_create(events, batch_size=500)
+
+        entry = (flush, events)
+        pending[key] = entry
+        transaction.on_commit(flush, using=using)
+
+    return entry[1]
+
+
+def diff_fields(old_values, instance, field_names):
+    """ロード時の値と現在値を比較し、{フィールド名: [旧値, 新値]} を返す"""
+    changes = {}
+    for name in field_names:
+        attname = instance._meta.get_field(name).attname
+        if attname not in old_values:
+            # 遅延ロード（defer）されたフィールドは比較しない
+            continue
+        new_value = getattr(instance, attname)
+        if old_values[attname] != new_value:
+            changes[name] = [old_values[attname], new_value]
+    return changes
+
+
+def snapshot_fields(instance, field_names):
+    """作成時のスナップショット {フィールド名: [None, 値]} を返す"""
+    return {
+        name: [None, getattr(instance, instance._meta.get_field(name).attname)]
+        for name in field_names
+    }
+
+
+def deletion_fields(instance, field_names):
+    """削除時のスナップショット {フィールド名: [値, None]} を返す"""
+    return {
+        name: [getattr(instance, instance._meta.get_field(name).attname), None]
+        for name in field_names
+    }
+
+
+def remember_fields(instance, field_names):
+    """
+    保存後の値を次回の diff_fields の比較基準にする（同じインスタンスの再保存で差分を重複させない）
+
+    遅延ロード（defer / only）したまま読み込んでいないフィールドは読み込まずに除く。
+    """
+    attnames = [instance._meta.get_field(name).attname for name in field_names]
+    instance._loaded_values = {
+        attname: instance.__dict__[attname] for attname in attnames if attname in instance.__dict__
+    }
+
+
+def record_delete(sender, instance, using, **kwargs):
+    """post_delete のレシーバ（個別の削除・QuerySet.delete()・CASCADE のいずれも1件ずつ記録する）"""
+    instance.record_delete_event(using)
+
+
+class AuditedQuerySet(models.QuerySet):
+    """
+    update() の変更も監査ログに記録するクエリセット
+
+    モデルの AUDIT_FIELDS を更新する場合のみ、対象行を更新前にロックして値を読み、
+    更新後の値と比べて行ごとに model.record_change_event() で記録する（F式の結果も記録される）。
+    モデルに queryset_updated(rows, using) がある場合は、変更された行を
+    [(pk, {フィールド名: 更新前の値}, {フィールド名: 更新後の値}), ...] で渡す（save() と同じ後処理用）。
+    後処理に必要なフィールドは UPDATE_CONTEXT_FIELDS で指定し、更新しない場合も合わせて読む。
+    """
+
+    def update(self, **kwargs):
+        opts = self.model._meta
+        updated_fields = [
+            name for name in self.model.AUDIT_FIELDS
+            if name in kwargs or opts.get_field(name).attname in kwargs
+        ]
+        if not updated_fields:
+            return super().update(**kwargs)
+
+        fields = list(dict.fromkeys([*updated_fields, *getattr(self.model, 'UPDATE_CONTEXT_FIELDS', ())]))
+        attnames = [opts.get_field(name).attname for name in fields]
+        on_updated = getattr(self.model, 'queryset_updated', None)
+        with transaction.atomic(using=self.db):
+            before = {
+                row[0]: dict(zip(fields, row[1:]))
+                for row in self.select_for_update(of=('self',)).order_by('pk').values_list('pk', *attnames)
+            }
+            updated = super().update(**kwargs)
+            after = self.model._base_manager.using(self.db).filter(pk__in=before).values_list('pk', *attnames)
+            rows = []
+            for pk, *values in after:
+                old, new = before[pk], dict(zip(fields, values))
+                changes = {name: [old[name], new[name]] for name in updated_fields if old[name] != new[name]}
+                if changes:
+                    self.model(pk=pk).record_change_event(changes, using=self.db)
+                    rows.append((pk, old, new))
+            if rows and on_updated is not None:
+                on_updated(rows, using=self.db)
+        return updated
+
+
+def application_history(application_id):
+    """申請の監査イベントを時系列で返す（(application, occurred_at) インデックスを使用）"""
+    AuditEvent = apps.get_model('workflow', 'AuditEvent')
+    return AuditEvent.objects.filter(application_id=application_id).select_related('actor').order_by('occurred_at', 'id')
+
+
+def user_history(user_id, since=None):
+    """ユーザーが操作した監査イベントを新しい順に返す（(actor, occurred_at) インデックスを使用）"""
+    AuditEvent = apps.get_model('workflow', 'AuditEvent')
+    events = AuditEvent.objects.filter(actor_id=user_id)
+    if since is not None:
+        events = events.filter(occurred_at__gte=since)
+    return events.order_by('-occurred_at', '-id')
+
+
+def replay_application(application_id, at=None):
+    """
+    監査ログを再生し、指定時点の申請の状態を復元する
+
+    Args:
+        application_id: 申請ID
+        at: 復元する時点（省略時は最新）
+
+    Returns:
+        {フィールド名: 値} の辞書。指定時点で申請が存在しない場合はNone。
+    """
+    AuditEvent = apps.get_model('workflow', 'AuditEvent')
+    Application = apps.get_model('workflow', 'Application')
+
+    events = AuditEvent.objects.filter(
+        application_id=application_id,
+        target_model=Application._meta.model_name,
+    )
+    if at is not None:
+        events = events.filter(occurred_at__lte=at)
+
+    state = None
+    for event_type, changes in events.order_by('occurred_at', 'id').values_list('event_type', 'changes').iterator():
+        if event_type == 'create':
+            state = {}
+        elif event_type == 'delete':
+            state = None
+            continue
+        elif state is None:
+            # 作成イベントより前の差分は再生できない
+            continue
+        for name, (old_value, new_value) in changes.items():
+            state[name] = new_value
+
+    if state is None:
+        return None
+
+    # JSONから各フィールドの型へ戻す
+    return {
+        name: Application._meta.get_field(name).to_python(value)
+        for name, value in state.items()
+    }
@@ -0,0 +1,208 @@
+"""
+接続プール付きの PostgreSQL バックエンド（ENGINE = 'workflow.backends.postgresql_pool'）
+
+Django 4.2 の PostgreSQL バックエンドに、ワーカープロセスごとの接続プールを加える。
+
+- リクエスト終了時（CONN_MAX_AGE = 0）に接続を閉じる代わりにプールへ返し、次のリクエストで再利用する
+- 同時に使う接続数を OPTIONS['pool']['max_size'] までに制限し、空きがなければ timeout 秒まで待つ
+- プールの接続は、前回の利用でエラーがあった場合・check_idle 秒以上使われていない場合のみ
+  取り出し時に SELECT 1 で確認し、max_lifetime 秒を過ぎたものは作り直す
+- search_path などの接続パラメータ（OPTIONS['options']）は接続の確立時に1回だけ送られる
+
+    OPTIONS = {
+        'options': '-c search_path=wkflowx',
+        'pool': {'max_size': 10, 'timeout': 10, 'check_idle': 30, 'max_lifetime': 1800},
+    }
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+
+logger = logging.getLogger(__name__)
+
+# libpq の PQTRANS_IDLE（psycopg2・psycopg 3 共通）
+TRANSACTION_STATUS_IDLE = 0
+
+POOL_DEFAULTS = {
+    'max_size': 10,
+    'timeout': 10,
+    'check_idle': 30,
+    'max_lifetime': 1800,
+}
+
+
+class ConnectionPool:
+    """
+    スレッド間で共有する接続プール
+
+    取り出し中と待機中の接続の合計を max_size までに制限する。待機中の接続は最後に返したものから使う
+    （使われ続ける接続を優先し、余った接続は check_idle を過ぎて次回の確認・max_lifetime で入れ替わる）。
+    """
+
+    def __init__(self, connect, max_size, timeout, check_idle, max_lifetime):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (接続, 返却時刻, 要確認)
+        self._idle = deque()
+        # id(接続) → 作成時刻
+        self._created = {}
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f'接続プールに空きがありません（上限 {self.max_size}、{self.timeout}秒待機）'
+            )
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._new()
+                connection, returned_at, needs_check = entry
+                if self._is_usable(connection, returned_at, needs_check):
+                    return connection
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection, needs_check=False):
+        """接続をプールへ返す（トランザクションが残っていればロールバックする）"""
+        try:
+            if connection.closed:
+                self._discard(connection)
+                return
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            with self._lock:
+                self._idle.append((connection, time.monotonic(), needs_check))
+        except base.Database.Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def discard(self, connection):
+        """取り出し中の接続をプールへ返さずに閉じる"""
+        try:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def close_idle(self):
+        """待機中の接続をすべて閉じる"""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._created), 'idle': len(self._idle), 'max_size': self.max_size}
+
+    def _new(self):
+        connection = self._connect()
+        with self._lock:
+            self._created[id(connection)] = time.monotonic()
+        return connection
+
+    def _is_usable(self, connection, returned_at, needs_check):
+        if connection.closed:
+            return False
+        now = time.monotonic()
+        if now - self._created.get(id(connection), now) >= self.max_lifetime:
+            return False
+        if not needs_check and now - returned_at < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            logger.info('接続プールの接続が切断されていたため作り直します')
+            return False
+        return True
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created.pop(id(connection), None)
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(wrapper, connect):
+    """接続先ごと・プロセスごとのプールを返す（fork 後の子プロセスは親のプールを使わない）"""
+    settings_dict = wrapper.settings_dict
+    key = (
+        os.getpid(), wrapper.alias, settings_dict['NAME'],
+        settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'],
+    )
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**POOL_DEFAULTS, **settings_dict['OPTIONS'].get('pool', {})}
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def close_pools(alias=None):
+    """このプロセスのプールの待機中の接続を閉じる"""
+    with _pools_lock:
+        pools = [
+            pool for (pid, pool_alias, *_), pool in _pools.items()
+            if pid == os.getpid() and alias in (None, pool_alias)
+        ]
+    for pool in pools:
+        pool.close_idle()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # プールに残ったテストDBへの接続を閉じてから削除する
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self, lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        connection = self.pool.acquire()
+        # 再利用した接続でも、接続時と同じく分離レベルを設定しておく
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (
+            IsolationLevel(isolation_level) if isolation_level is not None else IsolationLevel.READ_COMMITTED
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # トランザクション中に閉じた接続はこのラッパーが参照し続けるため、プールへ返さない
+                self.pool.discard(self.connection)
+            else:
+                self.pool.release(self.connection, needs_check=self.errors_occurred)
@@ -0,0 +1,303 @@
+"""
+共有キャッシュの読み書き（再計算の集中防止・ヒット率の計測）
+
+キャッシュは settings.CACHES の共有キャッシュ（Redis互換サーバーまたはファイル）を使う。
+
+get_or_compute() は値に「再計算時刻」を添えて保存し、期限切れ（ハードTTL）より前に
+1つのワーカーだけがロックを取って再計算する。他のワーカーはその間も古い値を返すため、
+1時間キャッシュが一斉に切れても同じ再計算が集中しない（thundering herd の防止）。
+
+TwoTierCache は共有キャッシュの前にプロセス内のLRU（短いTTL）を置く2層キャッシュ。
+ロール・申請種別設定のような小さく変更の少ない値を、通常は共有キャッシュへの通信なしで返す。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import cache
+
+from .db_routing import primary_reads
+
+
+logger = logging.getLogger(__name__)
+
+# 再計算時刻を過ぎてから値が消えるまでの猶予（秒）
+STALE_GRACE = 300
+
+# 再計算ロックの有効期間（秒）。再計算中のワーカーが落ちてもこの時間で解放される
+LOCK_TIMEOUT = 10
+
+# 値が存在せず他のワーカーが再計算中の場合に待つ最大時間（秒）と確認間隔
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+# 計測値を共有キャッシュへ反映する間隔（秒）
+METRICS_FLUSH_INTERVAL = 10
+
+_MISSING = object()
+
+
+class CacheMetrics:
+    """
+    キャッシュのヒット・ミスをキャッシュ名ごとに数える
+
+    プロセス内で集計し、一定間隔で共有キャッシュへ加算する（全ワーカーの合計を cache_stats で参照）。
+    """
+
+    OUTCOMES = ('local', 'hit', 'stale', 'miss', 'recompute', 'wait')
+    KEY_PREFIX = 'cache_metrics'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._pending = defaultdict(int)
+        self._last_flush = time.monotonic()
+
+    def record(self, name, outcome):
+        with self._lock:
+            self._counts[(name, outcome)] += 1
+            self._pending[(name, outcome)] += 1
+            due = time.monotonic() - self._last_flush >= METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        """このプロセスの集計値 {キャッシュ名: {結果: 件数}} を返す"""
+        with self._lock:
+            counts = dict(self._counts)
+        result = defaultdict(dict)
+        for (name, outcome), count in counts.items():
+            result[name][outcome] = count
+        return dict(result)
+
+    def flush(self):
+        """未反映の集計値を共有キャッシュへ加算する"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+
+        for (name, outcome), count in pending.items():
+            key = f'{self.KEY_PREFIX}:{name}:{outcome}'
+            try:
+                if not cache.add(key, count, timeout=None):
+                    cache.incr(key, count)
+            except ValueError:
+                # add と incr の間に削除された場合
+                cache.set(key, count, timeout=None)
+            except Exception:
+                logger.warning('キャッシュの計測値を反映できませんでした: %s', key, exc_info=True)
+
+        with self._lock:
+            names = {name for name, _ in self._counts}
+        if names:
+            registry_key = f'{self.KEY_PREFIX}:names'
+            registered = cache.get(registry_key, set())
+            if not names <= registered:
+                cache.set(registry_key, registered | names, timeout=None)
+
+    def shared_totals(self):
+        """全ワーカーの合計 {キャッシュ名: {結果: 件数}} を返す"""
+        names = cache.get(f'{self.KEY_PREFIX}:names', set())
+        keys = {
+            f'{self.KEY_PREFIX}:{name}:{outcome}': (name, outcome)
+            for name in names for outcome in self.OUTCOMES
+        }
+        values = cache.get_many(keys)
+        totals = {name: {outcome: 0 for outcome in self.OUTCOMES} for name in names}
+        for key, count in values.items():
+            name, outcome = keys[key]
+            totals[name][outcome] = count
+        return totals
+
+    def reset_shared(self):
+        names = cache.get(f'{self.KEY_PREFIX}:names', set())
+        cache.delete_many([
+            f'{self.KEY_PREFIX}:{name}:{outcome}' for name in names for outcome in self.OUTCOMES
+        ] + [f'{self.KEY_PREFIX}:names'])
+
+
+metrics = CacheMetrics()
+
+
+def get_or_compute(key, compute, timeout, name=None, lock_name=None):
+    """
+    キャッシュから値を取得し、なければ compute() で作成して保存する
+
+    Args:
+        key: キャッシュキー
+        compute: 値を作成する関数（None を返してもよい）
+        timeout: 再計算までの秒数（値自体は STALE_GRACE 秒長く保持する）
+        name: 計測用のキャッシュ名（省略時はキー）
+        lock_name: プロセス内の再計算ロックの名前（省略時はキー）。バージョンを含むキーでは
+            バージョンを除いた名前を渡す（バージョンごとにロックが増え続けないように）
+    """
+    name = name or key
+    lock_name = lock_name or key
+    entry = cache.get(key, _MISSING)
+
+    if entry is not _MISSING:
+        value, refresh_at = entry
+        if time.time() < refresh_at:
+            metrics.record(name, 'hit')
+            return value
+        # 再計算時刻を過ぎた: 1つのワーカーだけが再計算し、他は古い値を返す
+        if _acquire(key, lock_name):
+            metrics.record(name, 'recompute')
+            return _recompute(key, compute, timeout, lock_name)
+        metrics.record(name, 'stale')
+        return value
+
+    metrics.record(name, 'miss')
+    if _acquire(key, lock_name):
+        return _recompute(key, compute, timeout, lock_name)
+
+    # 他のワーカーが再計算中: 保存されるのを少し待つ
+    metrics.record(name, 'wait')
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key, _MISSING)
+        if entry is not _MISSING:
+            return entry[0]
+
+    # 再計算中のワーカーが応答しない場合は自分で計算する（保存はしない）
+    with primary_reads():
+        return compute()
+
+
+def invalidate(*keys):
+    """キャッシュを削除する（次回参照時に再計算）"""
+    cache.delete_many(keys)
+
+
+# プロセス内の再計算ロック（同じワーカーのスレッド間）。ロック名はバージョンを含まないため、
+# ユーザー数・申請種別数程度に収まる（invalidate_all() のたびに増えない）
+_process_locks = defaultdict(threading.Lock)
+_process_locks_guard = threading.Lock()
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _acquire(key, lock_name):
+    """再計算ロックを取得する（プロセス内 → 共有キャッシュの順）"""
+    with _process_locks_guard:
+        process_lock = _process_locks[lock_name]
+    if not process_lock.acquire(blocking=False):
+        return False
+
+    # add はキーが存在しない場合のみ成功する（Redis では SET NX で原子的。
+    # ファイルベースでは確認と書き込みの間に他プロセスと競合しうるが、重複はごく少数に収まる）
+    if cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+        return True
+    process_lock.release()
+    return False
+
+
+def _recompute(key, compute, timeout, lock_name):
+    try:
+        # 遅延のあるレプリカの値を timeout の間キャッシュしないよう、再計算はプライマリから読む
+        with primary_reads():
+            value = compute()
+        cache.set(key, (value, time.time() + timeout), timeout + STALE_GRACE)
+        return value
+    finally:
+        cache.delete(_lock_key(key))
+        _process_locks[lock_name].release()
+
+
+class LocalLRU:
+    """件数上限・TTL付きのプロセス内LRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    """
+    プロセス内LRU → 共有キャッシュ → 計算 の2層キャッシュ
+
+    全体のバージョン番号を共有キャッシュに1つだけ持ち、キーに含める。
+    invalidate_all() でバージョンを上げると、全ワーカーの古い値が参照されなくなる。
+    バージョンはリクエスト開始時に1回（CacheVersionMiddleware）、
+    リクエスト外では VERSION_CHECK_INTERVAL 秒ごとに共有キャッシュから読み直す。
+    """
+
+    VERSION_CHECK_INTERVAL = 5
+
+    def __init__(self, namespace, maxsize=1024, ttl=30):
+        self.namespace = namespace
+        self.version_key = f'{namespace}_cache_version'
+        self.local = LocalLRU(maxsize, ttl)
+        self._version = None
+        self._version_checked_at = 0.0
+
+    def refresh_version(self):
+        """共有キャッシュからバージョンを読み直す（変わっていればプロセス内の値を破棄）"""
+        version = cache.get(self.version_key)
+        if version is None:
+            # 追い出された場合に以前と同じ番号から始めると古い値が復活するため、時刻から作る
+            cache.add(self.version_key, time.time_ns(), timeout=None)
+            version = cache.get(self.version_key)
+        if version != self._version:
+            self.local.clear()
+            self._version = version
+        self._version_checked_at = time.monotonic()
+        return version
+
+    def version(self):
+        if self._version is None or time.monotonic() - self._version_checked_at >= self.VERSION_CHECK_INTERVAL:
+            return self.refresh_version()
+        return self._version
+
+    def get_or_compute(self, key, compute, timeout, name=None):
+        """プロセス内 → 共有キャッシュの順に参照し、なければ compute() で作成する"""
+        versioned_key = f'{key}_v{self.version()}'
+        value = self.local.get(versioned_key)
+        if value is not _MISSING:
+            metrics.record(name or key, 'local')
+            return value
+
+        value = get_or_compute(versioned_key, compute, timeout, name=name, lock_name=key)
+        self.local.set(versioned_key, value)
+        return value
+
+    def invalidate_all(self):
+        """全ワーカーのキャッシュを無効化する（バージョンを上げる）"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), timeout=None)
+        self.refresh_version()
+
+
+# ロール・申請種別設定（受付・承認の振り分け）用
+routing_cache = TwoTierCache('routing')
@@ -0,0 +1,22 @@
+"""
+テンプレートの共通コンテキスト
+"""
+from functools import cache
+
+from .notifications import unread_count
+
+
+def inbox(request):
+    """ナビゲーションバーの未読件数（テンプレートで使われた場合のみ、1リクエストに1回読み込む）"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'inbox_unread_count': cache(lambda: unread_count(user))}
+
+
+def user_context(request):
+    """ナビゲーションバーの役割・企業名（workflow.user_context、使われた場合のみ読み込む）"""
+    context = getattr(request, 'user_context', None)
+    if context is None:
+        return {}
+    return {'user_context': context}
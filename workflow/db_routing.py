@@ -0,0 +1,209 @@
+"""
+読み取り専用レプリカへの振り分け（DATABASE_ROUTERS）
+
+@replica_reads を付けた参照系の画面（ダッシュボード・一覧・管理画面の一覧など）の読み取りのみを
+settings.DATABASE_REPLICAS のレプリカへ送り、書き込みとそれ以外の読み取りはプライマリ（default）を使う。
+
+- 自分の書き込み直後: 書き込みのあったリクエストの応答で Cookie を設定し、
+  REPLICA_PIN_SECONDS 秒間はそのブラウザからの読み取りをすべてプライマリに固定する
+  （REPLICA_MAX_LAG より長くしておけば、固定が外れた時点で自分の書き込みはレプリカに反映済み）
+- レプリカの遅延: プロセスごとに LAG_CHECK_INTERVAL 秒間隔で遅延を確認し、
+  REPLICA_MAX_LAG 秒を超えたレプリカ・接続できないレプリカは使わない（すべて使えなければプライマリ）
+- トランザクション内とキャッシュの再計算中（caching.get_or_compute）は常にプライマリから読む
+
+ローカルでの確認は、default と同じDBを指す別名を DATABASES に追加して DATABASE_REPLICAS に指定する
+（settings.py の DB_REPLICA_HOSTS を参照）。
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# 自分の書き込み直後にプライマリへ固定する期限（UNIX時刻）を保持する Cookie
+PIN_COOKIE = 'wkflowx_primary_until'
+
+# レプリカの遅延を確認する間隔（秒）
+LAG_CHECK_INTERVAL = 5
+
+# PostgreSQL のレプリカの遅延（秒）。受信済みのWALをすべて適用済みの場合は0
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def measure_lag(alias):
+    """レプリカの遅延（秒）を返す（PostgreSQL 以外は0）"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+class ReplicaHealth:
+    """レプリカごとの利用可否（遅延・接続）をプロセス内で一定時間保持する"""
+
+    def __init__(self):
+        self._checked = {}
+
+    def is_usable(self, alias):
+        now = time.monotonic()
+        entry = self._checked.get(alias)
+        if entry is not None and now - entry[1] < LAG_CHECK_INTERVAL:
+            return entry[0]
+
+        try:
+            lag = measure_lag(alias)
+        except DatabaseError:
+            logger.warning('レプリカに接続できないためプライマリを使用します: %s', alias, exc_info=True)
+            connections[alias].close()
+            usable = False
+        else:
+            usable = lag <= settings.REPLICA_MAX_LAG
+            if not usable:
+                logger.warning('レプリカの遅延が%.1f秒のためプライマリを使用します: %s', lag, alias)
+
+        self._checked[alias] = (usable, now)
+        return usable
+
+    def reset(self):
+        self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """使用できるレプリカを1つ選ぶ（なければNone）"""
+    candidates = [alias for alias in replica_aliases() if health.is_usable(alias)]
+    return random.choice(candidates) if candidates else None
+
+
+class DatabaseState:
+    """リクエスト（またはブロック）単位の振り分け状態"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.use_replica = False
+        self.wrote = False
+        self._alias = None
+        self._lock = threading.Lock()
+
+    def read_alias(self):
+        """読み取り先を返す。件数と一覧が別のレプリカにならないよう、最初に選んだものを使い続ける"""
+        if not self.use_replica or self.pinned:
+            return None
+        with self._lock:
+            if self._alias is None:
+                self._alias = choose_replica() or DEFAULT_DB_ALIAS
+        return self._alias
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+_primary_only = contextvars.ContextVar('db_routing_primary_only', default=False)
+
+
+@contextmanager
+def database_state(pinned=False):
+    """ブロック内の振り分け状態を設定する（ミドルウェアがリクエストごとに使う）"""
+    state = DatabaseState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def reading_from_replica():
+    """ブロック内の読み取りをレプリカへ送る（管理コマンド・バッチの集計用）"""
+    with database_state() as state:
+        state.use_replica = True
+        yield state
+
+
+@contextmanager
+def primary_reads():
+    """ブロック内の読み取りを常にプライマリから行う"""
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def replica_reads(view_func):
+    """
+    ビューの読み取りをレプリカへ送る（csrf_exempt と同じくビューに印を付け、ReplicaRoutingMiddleware が参照する）
+
+    テンプレートの描画中の読み取りも対象になる。クラスベースビューには
+    method_decorator(replica_reads, name='dispatch') で付ける。
+    """
+    view_func.replica_reads = True
+    return view_func
+
+
+def pinned_until(request):
+    """Cookie に保存されたプライマリ固定の期限（UNIX時刻）を返す"""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def pin_to_primary(response):
+    """以降 REPLICA_PIN_SECONDS 秒間の読み取りをプライマリに固定する Cookie を設定する"""
+    seconds = settings.REPLICA_PIN_SECONDS
+    response.set_cookie(
+        PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax'
+    )
+    return response
+
+
+class ReplicaRouter:
+    """参照系の画面の読み取りのみレプリカへ送るルーター"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or _primary_only.get():
+            return None
+        # トランザクション内はプライマリの書き込みと同じ状態を読む
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製のため、どの組み合わせも同じDBとして扱う
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカはレプリケーションで更新するため、マイグレーションしない
+        if db in replica_aliases():
+            return False
+        return None
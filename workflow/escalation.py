@@ -0,0 +1,175 @@
+"""
+SLA超過の督促・エスカレーション
+
+申請種別設定（ApplicationTypeConfig）の時間を過ぎても受付・承認されていない申請を検出し、まとめて通知する。
+- レベル1（督促）: 受付待ちは受付ロール、承認待ちは承認ロールのメンバーへ
+- レベル2（エスカレーション）: 担当ロールのメンバーと管理者へ
+通知した申請は SLAEscalation に記録し、同じ段階・レベルでは1回だけ通知する。
+
+検出は (ステータス, 申請日時／受付日時) の索引の範囲検索で行う。申請種別 × 段階 × レベルごとに
+確認済みの時刻（SLACheckpoint）を持ち、前回から今回までに期限を超えた申請だけを読むため、
+毎分実行しても処理量は新たに期限を超えた申請の数に比例する。
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Application, ApplicationTypeConfig, SLACheckpoint, SLAEscalation
+from .notifications import notify
+
+
+logger = logging.getLogger(__name__)
+
+# 段階 → (待ちのステータス, 段階の開始日時のフィールド, 担当ロールのフィールド)
+STAGES = {
+    'receive': ('submitted', 'submitted_at', 'receiver_role'),
+    'approve': ('received', 'received_at', 'approver_role'),
+}
+
+# レベル → 申請種別設定の時間フィールドの接尾辞
+LEVELS = {
+    1: 'reminder_hours',
+    2: 'escalation_hours',
+}
+
+# 1回の確認で通知する申請の上限（初回実行などで大量にある場合は次回以降に持ち越す）
+BATCH_SIZE = 1000
+
+# 通知メールに一覧表示する申請の上限
+NOTIFY_LIST_LIMIT = 50
+
+
+def sla_hours(config, stage, level):
+    return getattr(config, f'{stage}_{LEVELS[level]}')
+
+
+def run_escalations(now=None, batch_size=BATCH_SIZE):
+    """
+    全申請種別のSLA超過を確認して通知する
+
+    Returns:
+        [(申請種別, 段階, レベル, 通知件数), ...]（SLAが設定されている組み合わせのみ）
+    """
+    now = now or timezone.now()
+    results = []
+    configs = ApplicationTypeConfig.objects.filter(is_active=True).select_related('receiver_role', 'approver_role')
+    for config in configs:
+        for stage in STAGES:
+            for level in LEVELS:
+                hours = sla_hours(config, stage, level)
+                if not hours:
+                    continue
+                count = escalate(config, stage, level, now - timedelta(hours=hours), batch_size)
+                results.append((config.application_type, stage, level, count))
+    return results
+
+
+def escalate(config, stage, level, deadline, batch_size=BATCH_SIZE):
+    """
+    段階の開始日時が deadline 以前の未通知の申請を通知する
+
+    確認済み時刻の行をロックするため、複数のスケジューラが同時に実行しても二重に通知しない。
+    """
+    status, since_field, _ = STAGES[stage]
+    checkpoint, _ = SLACheckpoint.objects.get_or_create(
+        application_type=config.application_type, stage=stage, level=level
+    )
+
+    with transaction.atomic():
+        checkpoint = SLACheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+        overdue = Application.objects.filter(
+            status=status, application_type=config.application_type, **{f'{since_field}__lte': deadline}
+        )
+        if checkpoint.checked_until is not None:
+            # 前回の境界と同じ時刻の申請は通知済みの記録で除外する
+            overdue = overdue.filter(**{f'{since_field}__gte': checkpoint.checked_until})
+        notified = SLAEscalation.objects.filter(
+            application=OuterRef('pk'), stage=stage, level=level, stage_started_at=OuterRef(since_field)
+        )
+        applications = list(
+            overdue.exclude(Exists(notified))
+            .order_by(since_field)
+            .only('id', 'application_number', 'application_type', 'title', 'company_name', since_field)
+            [:batch_size]
+        )
+
+        if len(applications) < batch_size:
+            checked_until = deadline
+        else:
+            checked_until = getattr(applications[-1], since_field)
+        if checkpoint.checked_until is None or checked_until > checkpoint.checked_until:
+            checkpoint.checked_until = checked_until
+            checkpoint.save(update_fields=['checked_until', 'updated_at'])
+
+        if not applications:
+            return 0
+
+        SLAEscalation.objects.bulk_create([
+            SLAEscalation(
+                application=application, stage=stage, level=level,
+                stage_started_at=getattr(application, since_field),
+            )
+            for application in applications
+        ], ignore_conflicts=True)
+        send_escalation_notice(config, stage, level, applications)
+
+    logger.info(
+        'SLA超過を通知しました: %s %s レベル%s %d件', config.application_type, stage, level, len(applications)
+    )
+    return len(applications)
+
+
+def escalation_recipients(config, stage, level):
+    role = getattr(config, STAGES[stage][2])
+    users = [member.user for member in role.members.filter(user__is_active=True).select_related('user__profile')]
+    if level >= 2:
+        users += User.objects.filter(profile__role='admin', is_active=True).select_related('profile')
+    return users
+
+
+def send_escalation_notice(config, stage, level, applications):
+    """
+    超過した申請の一覧を1通のメールで通知する（送信はコミット後）
+
+    督促は各自の通知設定（まとめ通知）に従い、エスカレーションはすぐに送る。
+    """
+    recipients = escalation_recipients(config, stage, level)
+    if not recipients:
+        logger.warning('SLA超過の通知先がありません: %s %s レベル%s', config.application_type, stage, level)
+        return
+
+    since_field = STAGES[stage][1]
+    stage_label = dict(SLAEscalation.STAGE_CHOICES)[stage]
+    level_label = dict(SLAEscalation.LEVEL_CHOICES)[level]
+    type_label = dict(Application.APPLICATION_TYPE_CHOICES).get(config.application_type, config.application_type)
+    since_label = Application._meta.get_field(since_field).verbose_name
+
+    lines = [
+        f'{application.application_number}  {application.title}（{application.company_name}）'
+        f'  {since_label}: {timezone.localtime(getattr(application, since_field)).strftime("%Y/%m/%d %H:%M")}'
+        f'\n  {settings.SITE_URL}/workflow/{application.pk}/'
+        for application in applications[:NOTIFY_LIST_LIMIT]
+    ]
+    if len(applications) > NOTIFY_LIST_LIMIT:
+        lines.append(f'ほか {len(applications) - NOTIFY_LIST_LIMIT}件')
+    listing = '\n'.join(lines)
+
+    subject = f'【{stage_label}{level_label}】{type_label} {len(applications)}件'
+    message = f'''
+{stage_label}の期限（{sla_hours(config, stage, level)}時間）を過ぎた申請が{len(applications)}件あります。
+
+{listing}
+
+{stage_label}待ちの一覧は以下のURLからご確認ください。
+{settings.SITE_URL}/workflow/pending-{stage}/
+'''
+    notify(
+        recipients, subject, message, url=reverse(f'workflow:pending_{stage}'),
+        urgent=level >= 2 or config.urgent_notifications
+    )
@@ -0,0 +1,274 @@
+"""
+受付・承認キューのリアルタイム通知（Pub/Sub）
+
+申請のステータス遷移を「キュー種別:申請種別」単位のチャネルへ配信し、
+Server-Sent Events（ASGI）で接続中のユーザーへプッシュする。
+
+配信方式は settings.WORKFLOW_EVENT_BACKEND で切り替える:
+    'local'      プロセス内配信（開発環境・単一ワーカー向け）
+    'postgresql' PostgreSQL LISTEN/NOTIFY 経由で全ワーカーへ配信
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+
+logger = logging.getLogger(__name__)
+
+# キュー種別
+RECEIVE_QUEUE = 'receive'
+APPROVE_QUEUE = 'approve'
+
+# 申請ステータス → 所属するキュー
+QUEUE_BY_STATUS = {
+    'submitted': RECEIVE_QUEUE,
+    'received': APPROVE_QUEUE,
+}
+
+# キープアライブの送信間隔（秒）
+HEARTBEAT_INTERVAL = 15
+
+# 1接続の最大継続時間（秒）。経過後は切断し、EventSourceの自動再接続に任せる
+MAX_STREAM_DURATION = 300
+
+
+def channel_name(queue, application_type):
+    """チャネル名を返す（例: receive:work）"""
+    return f'{queue}:{application_type}'
+
+
+class LocalBroker:
+    """プロセス内Pub/Sub（購読者ごとに asyncio.Queue へ配信）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channels, loop, queue):
+        """チャネルを購読する"""
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add((loop, queue))
+
+    def unsubscribe(self, loop, queue):
+        """全チャネルの購読を解除する"""
+        with self._lock:
+            for channel in list(self._subscribers):
+                subscribers = self._subscribers[channel]
+                subscribers.discard((loop, queue))
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, message):
+        """メッセージを配信する"""
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        """このプロセスの購読者へメッセージを渡す（任意のスレッドから呼び出し可能）"""
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # イベントループが既に終了している購読者
+                self.unsubscribe(loop, queue)
+
+
+class PostgresBroker(LocalBroker):
+    """PostgreSQL LISTEN/NOTIFY 経由で全ワーカープロセスへ配信するPub/Sub"""
+
+    PG_CHANNEL = 'workflow_queue_events'
+
+    # 受信スレッドの再接続待ち時間（秒）
+    RECONNECT_DELAY = 5
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__()
+        self.using = using
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channels, loop, queue):
+        self._ensure_listener()
+        super().subscribe(channels, loop, queue)
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, cls=DjangoJSONEncoder)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.PG_CHANNEL, payload])
+
+    def _ensure_listener(self):
+        """受信スレッドをプロセスごとに1本だけ起動する"""
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen_forever,
+                    name='workflow-event-listener',
+                    daemon=True,
+                )
+                self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception('キューイベントの受信に失敗しました。%s秒後に再接続します。', self.RECONNECT_DELAY)
+                time.sleep(self.RECONNECT_DELAY)
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        params = connections[self.using].get_connection_params()
+        conn = psycopg2.connect(**params)
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.PG_CHANNEL}')
+
+            while True:
+                if select.select([conn], [], [], HEARTBEAT_INTERVAL) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        data = json.loads(notify.payload)
+                    except ValueError:
+                        logger.warning('不正なキューイベントを無視しました: %s', notify.payload)
+                        continue
+                    self.dispatch(data['channel'], data['message'])
+        finally:
+            conn.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """設定に応じたブローカーを返す（プロセス内で共有）"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            backend = getattr(settings, 'WORKFLOW_EVENT_BACKEND', 'local')
+            if backend == 'postgresql':
+                _broker = PostgresBroker()
+            elif backend == 'local':
+                _broker = LocalBroker()
+            else:
+                raise ValueError(f'未対応のイベント配信方式です: {backend}')
+        return _broker
+
+
+def publish_status_change(application, old_status, new_status):
+    """
+    ステータス遷移に伴うキューの増減を配信する
+
+    コミット後に配信するため、ロールバックされた遷移は通知されない。
+    """
+    old_queue = QUEUE_BY_STATUS.get(old_status)
+    new_queue = QUEUE_BY_STATUS.get(new_status)
+    if old_queue == new_queue:
+        return
+
+    base = {
+        'application_id': application.pk,
+        'application_type': application.application_type,
+        'applicant_id': application.applicant_id,
+    }
+    messages = []
+    if old_queue:
+        messages.append((
+            channel_name(old_queue, application.application_type),
+            dict(base, event='removed', queue=old_queue, delta=-1),
+        ))
+    if new_queue:
+        messages.append((
+            channel_name(new_queue, application.application_type),
+            dict(
+                base,
+                event='new_item',
+                queue=new_queue,
+                delta=1,
+                application_number=application.application_number,
+                title=application.title,
+                company_name=application.company_name,
+            ),
+        ))
+
+    def send():
+        broker = get_broker()
+        for channel, message in messages:
+            try:
+                broker.publish(channel, message)
+            except Exception:
+                # 通知の失敗で業務処理を止めない
+                logger.exception('キューイベントの配信に失敗しました: %s', channel)
+
+    transaction.on_commit(send)
+
+
+def publish_bulk_added(queue, application_type, count, applicant_id):
+    """一括取込でキューに追加された件数をまとめて配信する（コミット後）"""
+    message = {
+        'event': 'bulk_added',
+        'queue': queue,
+        'application_type': application_type,
+        'applicant_id': applicant_id,
+        'delta': count,
+    }
+
+    def send():
+        try:
+            get_broker().publish(channel_name(queue, application_type), message)
+        except Exception:
+            logger.exception('キューイベントの配信に失敗しました: %s', queue)
+
+    transaction.on_commit(send)
+
+
+def format_sse(event, data):
+    """Server-Sent Events 形式の1メッセージを返す"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n'
+
+
+async def stream_queue_events(user_id, channels, counts):
+    """
+    購読チャネルのイベントをSSE形式で送出する非同期ジェネレータ
+
+    接続直後に現在の件数（counts）を送り、以降は件数の増減と新着を送る。
+    自分の申請に関するイベントは除外する。
+    """
+    broker = get_broker()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    broker.subscribe(channels, loop, queue)
+    deadline = loop.time() + MAX_STREAM_DURATION
+
+    try:
+        yield f'retry: {HEARTBEAT_INTERVAL * 1000}\n\n'
+        yield format_sse('counts', counts)
+
+        while loop.time() < deadline:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+
+            if message.get('applicant_id') == user_id:
+                continue
+            yield format_sse('queue', message)
+    finally:
+        broker.unsubscribe(loop, queue)
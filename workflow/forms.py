@@ -2,7 +2,8 @@
 業務ワークフローシステムのフォーム（製造業・建設業向け）
 """
 from django import forms
-from .models import Application, Comment, Attachment
+from .models import Application, Comment, Attachment, UserProfile
+from .validation import application_validator
 
 
 class ApplicationForm(forms.ModelForm):
@@ -64,67 +65,27 @@ class ApplicationForm(forms.ModelForm):
     
     def clean(self):
         cleaned_data = super().clean()
-        application_type = cleaned_data.get('application_type')
         
-        # 作業申請
-        if application_type == 'work':
-            if not cleaned_data.get('work_location'):
-                self.add_error('work_location', '作業申請の場合、作業場所は必須です。')
-            if not cleaned_data.get('work_start_date'):
-                self.add_error('work_start_date', '作業申請の場合、作業開始予定日は必須です。')
-            if not cleaned_data.get('worker_count'):
-                self.add_error('worker_count', '作業申請の場合、作業人数は必須です。')
+        # 申請種別ごとの必須項目・日付の妥当性チェック
+        for field, message in application_validator.validate(cleaned_data):
+            self.add_error(field, message)
         
-        # 工事申請
-        elif application_type == 'construction':
-            if not cleaned_data.get('work_location'):
-                self.add_error('work_location', '工事申請の場合、工事場所は必須です。')
-            if not cleaned_data.get('work_start_date'):
-                self.add_error('work_start_date', '工事申請の場合、工事開始予定日は必須です。')
-            if not cleaned_data.get('work_end_date'):
-                self.add_error('work_end_date', '工事申請の場合、工事終了予定日は必須です。')
-            if not cleaned_data.get('contractor_name'):
-                self.add_error('contractor_name', '工事申請の場合、施工業者名は必須です。')
-            if not cleaned_data.get('worker_count'):
-                self.add_error('worker_count', '工事申請の場合、工事人数は必須です。')
-        
-        # 工具持込申請
-        elif application_type == 'tool_bringin':
-            if not cleaned_data.get('tool_list'):
-                self.add_error('tool_list', '工具持込申請の場合、持込工具リストは必須です。')
-            if not cleaned_data.get('work_start_date'):
-                self.add_error('work_start_date', '工具持込申請の場合、使用開始予定日は必須です。')
-            if not cleaned_data.get('work_end_date'):
-                self.add_error('work_end_date', '工具持込申請の場合、返却予定日は必須です。')
-        
-        # 制限エリア立入申請
-        elif application_type == 'restricted_entry':
-            if not cleaned_data.get('restricted_area'):
-                self.add_error('restricted_area', '制限エリア立入申請の場合、エリア名は必須です。')
-            if not cleaned_data.get('entry_purpose'):
-                self.add_error('entry_purpose', '制限エリア立入申請の場合、立入目的は必須です。')
-            if not cleaned_data.get('entry_members'):
-                self.add_error('entry_members', '制限エリア立入申請の場合、立入者リストは必須です。')
-            if not cleaned_data.get('work_start_date'):
-                self.add_error('work_start_date', '制限エリア立入申請の場合、立入予定日は必須です。')
-        
-        # 制限エリア工具持込申請
-        elif application_type == 'restricted_tool':
-            if not cleaned_data.get('restricted_area'):
-                self.add_error('restricted_area', '制限エリア工具持込申請の場合、エリア名は必須です。')
-            if not cleaned_data.get('tool_list'):
-                self.add_error('tool_list', '制限エリア工具持込申請の場合、持込工具リストは必須です。')
-            if not cleaned_data.get('entry_members'):
-                self.add_error('entry_members', '制限エリア工具持込申請の場合、立入者リストは必須です。')
-            if not cleaned_data.get('work_start_date'):
-                self.add_error('work_start_date', '制限エリア工具持込申請の場合、使用開始予定日は必須です。')
+        return cleaned_data
+
+
+class ApplicationAdminForm(forms.ModelForm):
+    """管理画面の申請フォーム（画面と同じ申請種別ごとのルールで検証）"""
+    
+    class Meta:
+        model = Application
+        fields = '__all__'
+    
+    def clean(self):
+        cleaned_data = super().clean()
         
-        # 日付の妥当性チェック
-        work_start_date = cleaned_data.get('work_start_date')
-        work_end_date = cleaned_data.get('work_end_date')
-        if work_start_date and work_end_date:
-            if work_end_date < work_start_date:
-                self.add_error('work_end_date', '終了日は開始日より後の日付を指定してください。')
+        for field, message in application_validator.validate(cleaned_data):
+            if field in self.fields:
+                self.add_error(field, message)
         
         return cleaned_data
 
@@ -144,6 +105,17 @@ class CommentForm(forms.ModelForm):
         }
 
 
+class NotificationSettingsForm(forms.ModelForm):
+    """メール通知の受け取り方の設定フォーム"""
+    
+    class Meta:
+        model = UserProfile
+        fields = ['notification_frequency']
+        widgets = {
+            'notification_frequency': forms.RadioSelect(attrs={'class': 'form-check-input'}),
+        }
+
+
 class AttachmentForm(forms.ModelForm):
     """添付ファイルフォーム"""
     
@@ -172,3 +144,27 @@ class AttachmentForm(forms.ModelForm):
                 raise forms.ValidationError(f'許可されていないファイル形式です。許可形式: {", ".join(allowed_extensions)}')
         
         return file
+
+
+class ApplicationImportForm(forms.Form):
+    """申請一括取込フォーム"""
+    file = forms.FileField(
+        label='取込ファイル',
+        help_text='CSV（UTF-8 / Shift_JIS）またはExcel（.xlsx）。1行目は見出し行としてください。',
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+    submit = forms.BooleanField(
+        label='取込後にまとめて提出する',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        
+        if file:
+            file_ext = file.name.lower()[file.name.rfind('.'):]
+            if file_ext not in ['.csv', '.xlsx']:
+                raise forms.ValidationError('CSVまたはExcel（.xlsx）ファイルを指定してください。')
+        
+        return file
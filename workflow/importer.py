@@ -0,0 +1,293 @@
+"""
+申請の一括取込（CSV / Excel）
+
+大規模工事の立ち上げ時などに、作業申請・工具持込申請をまとめて登録する。
+各行は ApplicationForm のフィールド定義で型変換し（行ごとにフォームは生成しない）、
+申請種別ごとのルールは全行をまとめて列単位で検証する。検証を通過した行のみ申請番号をブロック単位で採番して bulk_create でチャンク単位に登録する。
+"""
+import csv
+import io
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.urls import reverse
+from django.utils import timezone
+
+from .audit import record_event, snapshot_fields
+from .events import RECEIVE_QUEUE, publish_bulk_added
+from .forms import ApplicationForm
+from .metrics import record_transition
+from .models import Application, WorkflowStep, adjust_status_counts, is_urgent_application_type
+from .notifications import notify
+from .user_context import get_user_context
+from .validation import application_validator, to_columns
+
+
+# 1回の bulk_create で登録する件数
+CHUNK_SIZE = 500
+
+# 申請番号の採番が他の登録と衝突した場合の再試行回数
+MAX_NUMBER_RETRIES = 3
+
+# 一括提出の通知メールに記載する申請番号の最大件数
+NOTIFICATION_LIST_LIMIT = 50
+
+
+class ApplicationImportError(Exception):
+    """取込ファイル自体を処理できない場合のエラー"""
+
+
+@dataclass
+class ImportResult:
+    """取込結果"""
+    created: int = 0
+    submitted: int = 0
+    # (行番号, フィールド名, エラーメッセージ)
+    errors: list = field(default_factory=list)
+
+    @property
+    def failed_rows(self):
+        return len({row_number for row_number, _, _ in self.errors})
+
+    def report_rows(self):
+        """(行番号, 項目名, エラーメッセージ) を返す"""
+        for row_number, field_name, message in self.errors:
+            yield row_number, _field_label(field_name), message
+
+
+def read_rows(file, filename):
+    """CSV / Excel を読み込み、(行番号, {見出し: 値}) を順に返す"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return _read_excel(file)
+    return _read_csv(file)
+
+
+def _read_csv(file):
+    raw = file.read()
+    if isinstance(raw, bytes):
+        try:
+            raw = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            # Excelで保存したCSV（Shift_JIS）
+            raw = raw.decode('cp932')
+
+    reader = csv.DictReader(io.StringIO(raw))
+    if not reader.fieldnames:
+        raise ApplicationImportError('見出し行がありません。')
+    # 1行目は見出し
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, row
+
+
+def _read_excel(file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ApplicationImportError('Excelファイルの取込には openpyxl が必要です。CSVで取り込んでください。')
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            raise ApplicationImportError('見出し行がありません。')
+        header = [str(name).strip() if name is not None else '' for name in header]
+
+        for row_number, values in enumerate(rows, start=2):
+            if all(value is None for value in values):
+                continue
+            yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def write_error_report(result, stream):
+    """失敗した行のみのエラーレポートをCSVで書き出す"""
+    writer = csv.writer(stream)
+    writer.writerow(['行番号', '項目', 'エラー内容'])
+    writer.writerows(result.report_rows())
+
+
+def _field_label(field_name):
+    if field_name == '__all__':
+        return ''
+    return str(Application._meta.get_field(field_name).verbose_name)
+
+
+def _is_number_collision(error):
+    """申請番号の一意制約の違反か（PostgreSQL は制約名、その他のDBはエラーメッセージで判定する）"""
+    column = Application._meta.get_field('application_number').column
+    constraint = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+    if constraint:
+        return column in constraint
+    return column in str(error)
+
+
+class ApplicationImporter:
+    """申請の一括取込"""
+
+    def __init__(self, user, submit=False, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.submit = submit
+        self.chunk_size = chunk_size
+        self.company_name = get_user_context(user).company_name
+
+        # フォームは生成せず、フィールド定義（検証・型変換）だけを使い回す
+        self.fields = {name: ApplicationForm.base_fields[name] for name in ApplicationForm._meta.fields}
+
+        # 見出しはフィールド名・項目名（verbose_name）のどちらでも指定可能
+        self.header_map = {}
+        for name in self.fields:
+            self.header_map[name] = name
+            self.header_map[str(Application._meta.get_field(name).verbose_name)] = name
+
+        # 申請種別は値・表示名のどちらでも指定可能
+        self.type_values = {label: value for value, label in Application.APPLICATION_TYPE_CHOICES}
+
+    def clean_row(self, row):
+        """1行の各項目を型変換・検証し、(値の辞書, (フィールド名, エラーメッセージ) のリスト) を返す"""
+        raw = {}
+        for header, value in row.items():
+            name = self.header_map.get(header.strip()) if header else None
+            if name is None:
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            if name == 'application_type':
+                value = self.type_values.get(value, value)
+            raw[name] = value
+
+        data = {}
+        errors = []
+        for name, form_field in self.fields.items():
+            try:
+                data[name] = form_field.clean(raw.get(name))
+            except ValidationError as e:
+                errors.extend((name, message) for message in e.messages)
+        return data, errors
+
+    def run(self, rows):
+        """取込を実行する（エラーのない行のみ登録し、エラー行はレポートに残す）"""
+        result = ImportResult()
+        row_numbers, records, row_errors = [], [], []
+        for row_number, row in rows:
+            data, errors = self.clean_row(row)
+            row_numbers.append(row_number)
+            records.append(data)
+            row_errors.append(errors)
+
+        # 申請種別ごとのルールは全行まとめて検証する
+        columns = to_columns(records, application_validator.fields + ['application_type'])
+        for index, errors in application_validator.validate_columns(columns).items():
+            row_errors[index].extend(errors)
+
+        valid_rows = []
+        for row_number, data, errors in zip(row_numbers, records, row_errors):
+            if errors:
+                result.errors.extend((row_number, name, message) for name, message in errors)
+            else:
+                valid_rows.append(data)
+
+        submitted_by_type = defaultdict(list)
+        for start in range(0, len(valid_rows), self.chunk_size):
+            applications = self._insert_chunk(valid_rows[start:start + self.chunk_size])
+            result.created += len(applications)
+            if self.submit:
+                for application in applications:
+                    submitted_by_type[application.application_type].append(application)
+
+        # 一括提出: 申請種別ごとに1通の通知・1件のキュー更新にまとめる
+        for application_type, applications in submitted_by_type.items():
+            result.submitted += len(applications)
+            self._notify_receivers(application_type, applications)
+            publish_bulk_added(RECEIVE_QUEUE, application_type, len(applications), self.user.pk)
+
+        return result
+
+    def _insert_chunk(self, rows):
+        """1チャンク分を bulk_create で登録する（申請番号はチャンク単位で採番）"""
+        now = timezone.now()
+        for attempt in range(MAX_NUMBER_RETRIES):
+            applications = [
+                Application(
+                    applicant=self.user,
+                    company_name=self.company_name,
+                    status='submitted' if self.submit else 'draft',
+                    submitted_at=now if self.submit else None,
+                    **data
+                )
+                for data in rows
+            ]
+            try:
+                with transaction.atomic():
+                    numbers = Application.allocate_application_numbers(len(applications))
+                    for application, number in zip(applications, numbers):
+                        application.application_number = number
+                    Application.objects.bulk_create(applications)
+                    Application.rebuild_line_items(applications, delete_existing=False)
+                    created = Counter((application.application_type, application.status) for application in applications)
+                    adjust_status_counts(created)
+                    for (application_type, status), count in created.items():
+                        record_transition(application_type, None, status, count)
+
+                    if self.submit:
+                        WorkflowStep.objects.bulk_create([
+                            WorkflowStep(
+                                application=application,
+                                step_type='submit',
+                                processor=self.user,
+                                status='completed',
+                                comment='一括取込',
+                                processed_at=now,
+                            )
+                            for application in applications
+                        ])
+
+                    # 監査ログ（コミット時にまとめて書き込まれる）
+                    for application in applications:
+                        record_event(
+                            'create', application,
+                            snapshot_fields(application, Application.AUDIT_FIELDS),
+                            application=application
+                        )
+                return applications
+            except IntegrityError as error:
+                # 同時に登録された申請と申請番号が衝突した場合のみ採番し直す（他の制約違反はそのまま送出する）
+                if not _is_number_collision(error) or attempt == MAX_NUMBER_RETRIES - 1:
+                    raise
+
+    def _notify_receivers(self, application_type, applications):
+        """一括提出した申請を受付担当へ1通にまとめて通知する"""
+        receivers = Application.get_receivers(application_type)
+        if not receivers:
+            return
+
+        type_display = dict(Application.APPLICATION_TYPE_CHOICES).get(application_type, application_type)
+        lines = [
+            f'{application.application_number}  {application.title}'
+            for application in applications[:NOTIFICATION_LIST_LIMIT]
+        ]
+        if len(applications) > NOTIFICATION_LIST_LIMIT:
+            lines.append(f'ほか {len(applications) - NOTIFICATION_LIST_LIMIT}件')
+
+        subject = f'【新規申請（一括）】{type_display} {len(applications)}件'
+        message = f'''
+申請が一括で提出されました。
+
+申請種別: {type_display}
+件数: {len(applications)}件
+申請企業: {self.company_name}
+申請者: {self.user.get_full_name() or self.user.username}
+
+{chr(10).join(lines)}
+
+受付待ち一覧からご確認ください。
+{settings.SITE_URL}/workflow/pending-receive/
+'''
+        notify(
+            receivers, subject, message, url=reverse('workflow:pending_receive'),
+            urgent=is_urgent_application_type(application_type)
+        )
@@ -0,0 +1,47 @@
+"""
+既存の申請の持込工具リスト・立入者リストから子テーブル（持込工具・立入者）を作成するコマンド
+
+    python manage.py backfill_line_items --batch-size 1000
+何度実行しても同じ結果になる（対象の申請ごとに作り直す）。
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from workflow.models import Application
+
+
+class Command(BaseCommand):
+    help = '持込工具・立入者の子テーブルを既存の申請から作成'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='1トランザクションで処理する申請数')
+        parser.add_argument('--start-id', type=int, default=0, help='このIDより大きい申請から処理する（中断後の再開用）')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = options['start_id']
+        queryset = Application.objects.exclude(
+            tool_list='', entry_members=''
+        ).only(
+            'id', 'tool_list', 'entry_members',
+            *Application.LINE_ITEM_COPIED_FIELDS
+        ).order_by('id')
+        
+        total_applications = total_tools = total_members = 0
+        while True:
+            applications = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not applications:
+                break
+            
+            with transaction.atomic():
+                tools, members = Application.rebuild_line_items(applications)
+            
+            last_id = applications[-1].id
+            total_applications += len(applications)
+            total_tools += tools
+            total_members += members
+            self.stdout.write(f'  ID {last_id} まで処理しました（{total_applications}件）')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'申請{total_applications}件から 持込工具{total_tools}件・立入者{total_members}件を作成しました'
+        ))
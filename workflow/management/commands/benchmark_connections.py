@@ -0,0 +1,89 @@
+"""
+DB接続の確立方法ごとのリクエスト処理時間を計測するコマンド
+
+1リクエスト分（ダッシュボードの件数集計クエリ + リクエスト終了時の接続の後処理）を繰り返し、
+毎回新規接続（CONN_MAX_AGE=0）・持続接続（CONN_MAX_AGE）・接続プール（PostgreSQLのみ）を比較する。
+    python manage.py benchmark_connections --iterations 200
+"""
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+
+from workflow.models import Application
+
+
+POSTGRESQL_ENGINE = 'django.db.backends.postgresql'
+POOL_ENGINE = 'workflow.backends.postgresql_pool'
+
+
+class Command(BaseCommand):
+    help = 'DB接続（新規接続／持続接続／接続プール）ごとの1リクエストあたりの処理時間を比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='計測回数')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='計測するDBの別名')
+
+    def handle(self, *args, **options):
+        settings_dict = connections.settings[options['database']]
+        vendor = connections[options['database']].vendor
+        engine = POSTGRESQL_ENGINE if settings_dict['ENGINE'] == POOL_ENGINE else settings_dict['ENGINE']
+
+        modes = [
+            ('新規接続（CONN_MAX_AGE=0）', {'ENGINE': engine, 'CONN_MAX_AGE': 0}),
+            ('持続接続（CONN_MAX_AGE=600）', {'ENGINE': engine, 'CONN_MAX_AGE': 600}),
+        ]
+        if vendor == 'postgresql':
+            modes.append(('接続プール', {'ENGINE': POOL_ENGINE, 'CONN_MAX_AGE': 0}))
+        else:
+            self.stdout.write(self.style.WARNING('接続プールは PostgreSQL の場合のみ計測します。'))
+
+        sql = f'SELECT COUNT(*) FROM {Application._meta.db_table} WHERE status = %s'
+        self.stdout.write(f'回数: {options["iterations"]}  クエリ: {sql}\n')
+
+        results = {}
+        for label, overrides in modes:
+            wrapper = self._make_wrapper(settings_dict, overrides, options['database'])
+            try:
+                results[label] = self._measure(wrapper, sql, options['iterations'])
+            finally:
+                wrapper.close()
+            self.stdout.write(
+                f'  {label}: {results[label]["median"]:.2f}ms（中央値） '
+                f'p95 {results[label]["p95"]:.2f}ms  接続 {results[label]["connects"]}回'
+            )
+
+        baseline = results[modes[0][0]]['median']
+        for label, result in list(results.items())[1:]:
+            self.stdout.write(f'  {label}の短縮: {baseline - result["median"]:.2f}ms／リクエスト')
+
+    def _make_wrapper(self, settings_dict, overrides, alias):
+        settings_dict = copy.deepcopy(settings_dict)
+        settings_dict.update(overrides)
+        if overrides['ENGINE'] != POOL_ENGINE:
+            settings_dict['OPTIONS'].pop('pool', None)
+        backend = load_backend(settings_dict['ENGINE'])
+        return backend.DatabaseWrapper(settings_dict, alias=f'benchmark_{alias}')
+
+    def _measure(self, wrapper, sql, iterations):
+        timings = []
+        connects = 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            if wrapper.connection is None:
+                connects += 1
+            with wrapper.cursor() as cursor:
+                cursor.execute(sql, ['submitted'])
+                cursor.fetchone()
+            # リクエスト終了時（request_finished）と同じ後処理
+            wrapper.close_if_unusable_or_obsolete()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            'median': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'connects': connects,
+        }
@@ -0,0 +1,107 @@
+"""
+フラグメントキャッシュの効果を計測するコマンド
+
+ダッシュボードと申請詳細を、フラグメントキャッシュなし（毎回破棄）とキャッシュヒット時で比較する。
+    python manage.py benchmark_fragments --username receiver1 --iterations 100
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from workflow.models import DETAIL_SECTIONS, get_section_versions
+from workflow.views import get_dashboard_queryset, get_accessible_applications, get_action_permissions
+
+
+class Command(BaseCommand):
+    help = 'ダッシュボード・申請詳細のフラグメントキャッシュのヒット時／ミス時の描画時間を比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='リクエストを発行するユーザー名')
+        parser.add_argument('--iterations', type=int, default=50, help='計測回数')
+        parser.add_argument('--application', type=int, help='詳細画面を計測する申請ID（既定: 閲覧可能な最新の申請）')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'ユーザーが見つかりません: {options["username"]}')
+
+        client = Client()
+        client.force_login(user)
+        iterations = options['iterations']
+
+        # ダッシュボード: 1ページ目の各行のフラグメント
+        rows = list(get_dashboard_queryset(user, {}).values_list('pk', 'updated_at')[:20])
+        dashboard_keys = [
+            make_template_fragment_key('dashboard_row', [pk, updated_at.timestamp()])
+            for pk, updated_at in rows
+        ]
+        self._compare('ダッシュボード', client, reverse('workflow:dashboard'), dashboard_keys, iterations)
+
+        # 申請詳細: 申請情報と添付・コメント・履歴の各セクション
+        accessible = get_accessible_applications(user)
+        application = (
+            accessible.get(pk=options['application']) if options['application']
+            else accessible.order_by('-updated_at').first()
+        )
+        if application is None:
+            self.stdout.write(self.style.WARNING('閲覧可能な申請がないため、申請詳細は計測しません。'))
+            return
+
+        versions = get_section_versions(application.pk)
+        can_edit = get_action_permissions(application, user)['can_edit']
+        detail_keys = [
+            make_template_fragment_key('detail_application', [application.pk, application.updated_at.timestamp()]),
+            make_template_fragment_key('detail_attachments', [application.pk, versions['attachments'], can_edit]),
+            make_template_fragment_key('detail_comments', [application.pk, versions['comments']]),
+            make_template_fragment_key('detail_workflow_steps', [application.pk, versions['workflow_steps']]),
+        ]
+        self._compare(
+            f'申請詳細（{application.application_number}）', client,
+            reverse('workflow:detail', args=[application.pk]), detail_keys, iterations,
+            version_keys=[f'application_section_version_{application.pk}_{section}' for section in DETAIL_SECTIONS]
+        )
+
+    def _compare(self, label, client, url, fragment_keys, iterations, version_keys=()):
+        self.stdout.write(self.style.SUCCESS(f'=== {label} {url} ==='))
+
+        def miss():
+            cache.delete_many(list(fragment_keys) + list(version_keys))
+
+        miss_result = self._measure(client, url, iterations, before=miss)
+        client.get(url)
+        hit_result = self._measure(client, url, iterations)
+
+        self._report('キャッシュなし', miss_result)
+        self._report('キャッシュヒット', hit_result)
+        if miss_result['median']:
+            saving = (1 - hit_result['median'] / miss_result['median']) * 100
+            self.stdout.write(f'  削減率: {saving:.1f}%')
+
+    def _measure(self, client, url, iterations, before=None):
+        timings, queries = [], []
+        for _ in range(iterations):
+            if before:
+                before()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - started)
+            queries.append(len(context.captured_queries))
+            if response.status_code != 200:
+                raise CommandError(f'{url} が {response.status_code} を返しました。')
+        return {
+            'median': statistics.median(timings) * 1000,
+            'queries': statistics.median(queries),
+        }
+
+    def _report(self, label, result):
+        self.stdout.write(f'  {label}: {result["median"]:.2f}ms（中央値）  クエリ {result["queries"]:.0f}件')
@@ -0,0 +1,95 @@
+"""
+一覧画面の列の射影（only）による転送量・メモリ・処理時間の違いを計測するコマンド
+
+申請内容などのテキスト列が大きい申請を一時的に作成し（計測後にロールバック）、
+全列を読み込む場合と一覧の表示に使う列だけを読み込む場合を比較する。
+    python manage.py benchmark_list_columns --rows 2000 --text-size 10240
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from workflow.models import Application
+from workflow.views import get_my_applications_queryset
+
+
+class Command(BaseCommand):
+    help = '一覧画面の列の射影による転送量・メモリ・処理時間を比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='作成する申請数')
+        parser.add_argument('--text-size', type=int, default=10240, help='テキスト列1つあたりの文字数')
+        parser.add_argument('--page-size', type=int, default=20, help='1ページの件数')
+        parser.add_argument('--repeat', type=int, default=20, help='計測回数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._create_applications(options['rows'], options['text_size'])
+            self.stdout.write(
+                f'申請 {options["rows"]}件（テキスト列4つ × {options["text_size"]}文字）  '
+                f'1ページ {options["page_size"]}件・{options["repeat"]}回\n'
+            )
+
+            full = Application.objects.filter(applicant=user).select_related(
+                'applicant', 'applicant__profile'
+            ).order_by('-created_at')
+            projected = get_my_applications_queryset(user)
+
+            for label, size in [('1ページ', options['page_size']), ('全件', options['rows'])]:
+                self.stdout.write(f'{label}（{size}件）')
+                results = {}
+                for name, queryset in [('全列', full), ('射影', projected)]:
+                    results[name] = self._measure(queryset[:size], options['repeat'])
+                    self.stdout.write(
+                        f'  {name}: {results[name]["median"]:.2f}ms（中央値）  '
+                        f'転送 {results[name]["bytes"] / 1024:.0f}KB  メモリ {results[name]["memory"] / 1024:.0f}KB'
+                    )
+                self.stdout.write(
+                    f'  削減: 転送 {1 - results["射影"]["bytes"] / results["全列"]["bytes"]:.1%}  '
+                    f'メモリ {1 - results["射影"]["memory"] / results["全列"]["memory"]:.1%}  '
+                    f'時間 {1 - results["射影"]["median"] / results["全列"]["median"]:.1%}'
+                )
+
+            transaction.set_rollback(True)
+
+    def _create_applications(self, count, text_size):
+        user = User.objects.create_user(f'benchmark_list_{time.time_ns()}')
+        text = ('工事内容の詳細説明。' * (text_size // 10 + 1))[:text_size]
+        numbers = Application.allocate_application_numbers(count)
+        Application.objects.bulk_create([
+            Application(
+                application_number=number, application_type='work', title=f'ベンチマーク申請{i}',
+                applicant=user, company_name='ベンチマーク', status='submitted',
+                content=text, tool_list=text, entry_purpose=text, entry_members=text,
+            )
+            for i, number in enumerate(numbers)
+        ], batch_size=500)
+        return user
+
+    def _measure(self, queryset, repeat):
+        # 転送量: DBから受け取る値の大きさ（UTF-8のバイト数）
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            transferred = sum(
+                len(str(value).encode('utf-8')) for row in cursor.fetchall() for value in row if value is not None
+            )
+
+        # メモリ: モデルのインスタンスにしたときの確保量の最大値
+        tracemalloc.start()
+        rows = list(queryset.all())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rows
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return {'median': statistics.median(timings), 'bytes': transferred, 'memory': peak}
@@ -0,0 +1,131 @@
+"""
+一覧・CSV出力のモデルのインスタンスと行（workflow.rows）の処理時間・メモリを比較するコマンド
+
+申請を一時的に作成し（計測後にロールバック）、表示に使う値（表示名を含む）を取り出すまでを
+Application のインスタンスの場合と values_list の行の場合で計測する。
+    python manage.py benchmark_rows --rows 20000
+"""
+import csv
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from workflow.models import Application
+from workflow.rows import CSV_COLUMNS, application_rows, csv_lines, iter_rows, make_rows
+from workflow.views import PENDING_RECEIVE_COLUMNS, get_my_applications_queryset
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def model_listing(queryset):
+    """モデルのインスタンスで一覧の表示に使う値を取り出す（テンプレートと同じ参照）"""
+    return [
+        (app.application_number, app.get_application_type_display(), app.title, app.company_name,
+         app.applicant.username, app.get_status_display(), app.submitted_at)
+        for app in queryset
+    ]
+
+
+def row_listing(queryset):
+    return [
+        (row.application_number, row.application_type_label, row.title, row.company_name,
+         row.applicant_username, row.status_label, row.submitted_at)
+        for row in make_rows(application_rows(queryset))
+    ]
+
+
+def model_csv(queryset):
+    """モデルのインスタンスからCSVを作る（行の経路と同じ列）"""
+    displays = {
+        'application_type_label': lambda app: app.get_application_type_display(),
+        'status_label': lambda app: app.get_status_display(),
+        'applicant_username': lambda app: app.applicant.username,
+    }
+    writer = csv.writer(_Echo())
+    lines = [writer.writerow([heading for heading, _ in CSV_COLUMNS])]
+    # CSVの列（作業場所・期間）も読み込む（遅延読み込みで申請ごとに問い合わせないように）
+    for app in queryset.only(*PENDING_RECEIVE_COLUMNS).iterator(chunk_size=2000):
+        lines.append(writer.writerow([
+            displays[attribute](app) if attribute in displays else getattr(app, attribute)
+            for _, attribute in CSV_COLUMNS
+        ]))
+    return lines
+
+
+def row_csv(queryset):
+    return list(csv_lines(iter_rows(queryset)))
+
+
+class Command(BaseCommand):
+    help = '一覧・CSV出力のモデルのインスタンスと行の処理時間・メモリを比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='作成する申請数')
+        parser.add_argument('--page-size', type=int, default=20, help='1ページの件数')
+        parser.add_argument('--repeat', type=int, default=5, help='計測回数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self._create_applications(options['rows'])
+            queryset = get_my_applications_queryset(user)
+            self.stdout.write(f'申請 {options["rows"]}件  {options["repeat"]}回\n')
+
+            cases = [
+                (f'1ページ（{options["page_size"]}件）', queryset[:options['page_size']],
+                 model_listing, row_listing),
+                (f'一覧 全件（{options["rows"]}件）', queryset, model_listing, row_listing),
+                (f'CSV出力（{options["rows"]}件）', queryset, model_csv, row_csv),
+            ]
+            for label, target, by_model, by_row in cases:
+                self.stdout.write(label)
+                results = {}
+                for name, func in [('モデル', by_model), ('行', by_row)]:
+                    results[name] = self._measure(func, target, options['repeat'])
+                    self.stdout.write(
+                        f'  {name}: {results[name]["median"]:.2f}ms（中央値）  '
+                        f'メモリ {results[name]["memory"] / 1024:.0f}KB'
+                    )
+                self.stdout.write(
+                    f'  削減: 時間 {1 - results["行"]["median"] / results["モデル"]["median"]:.1%}  '
+                    f'メモリ {1 - results["行"]["memory"] / results["モデル"]["memory"]:.1%}'
+                )
+
+            transaction.set_rollback(True)
+
+    def _create_applications(self, count):
+        user = User.objects.create_user(f'benchmark_rows_{time.time_ns()}')
+        numbers = Application.allocate_application_numbers(count)
+        statuses = [value for value, _ in Application.STATUS_CHOICES]
+        types = [value for value, _ in Application.APPLICATION_TYPE_CHOICES]
+        Application.objects.bulk_create([
+            Application(
+                application_number=number, application_type=types[i % len(types)], title=f'ベンチマーク申請{i}',
+                applicant=user, company_name='ベンチマーク', status=statuses[i % len(statuses)],
+                work_location=f'第{i % 10}工場',
+            )
+            for i, number in enumerate(numbers)
+        ], batch_size=500)
+        return user
+
+    def _measure(self, func, queryset, repeat):
+        # メモリ: 結果を作るまでの確保量の最大値
+        tracemalloc.start()
+        result = func(queryset.all())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return {'median': statistics.median(timings), 'memory': peak}
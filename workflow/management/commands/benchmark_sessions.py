@@ -0,0 +1,87 @@
+"""
+セッションの保存先・メッセージの保存先ごとに、1リクエストあたりのDBの往復回数を比較するコマンド
+
+一時的に作成したユーザー・申請（計測後にロールバック）で、一覧・詳細の表示と
+コメント追加（messages.success → リダイレクト → 詳細でメッセージを表示）を繰り返し、
+django_session への問い合わせと全クエリの回数を数える。
+    python manage.py benchmark_sessions --rounds 20
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from workflow.models import Application, UserProfile
+
+
+# (表示名, SESSION_ENGINE, MESSAGE_STORAGE)
+CONFIGURATIONS = [
+    ('db + fallback（変更前）', 'django.contrib.sessions.backends.db',
+     'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('db + cookie', 'django.contrib.sessions.backends.db',
+     'django.contrib.messages.storage.cookie.CookieStorage'),
+    ('cached_db + cookie', 'django.contrib.sessions.backends.cached_db',
+     'django.contrib.messages.storage.cookie.CookieStorage'),
+    ('signed_cookies + cookie', 'workflow.sessions',
+     'django.contrib.messages.storage.cookie.CookieStorage'),
+]
+
+
+class Command(BaseCommand):
+    help = 'セッション・メッセージの保存先ごとの1リクエストあたりのDB往復回数を比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20, help='一覧・詳細・コメント追加の繰り返し回数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, application = self._create_fixtures()
+            requests = [
+                ('get', reverse('workflow:dashboard'), {}),
+                ('get', reverse('workflow:detail', args=[application.pk]), {}),
+                ('post', reverse('workflow:add_comment', args=[application.pk]), {'content': 'ベンチマーク'}),
+                ('get', reverse('workflow:detail', args=[application.pk]), {}),
+            ]
+            self.stdout.write(f'{options["rounds"]}回 × {len(requests)}リクエスト（一覧・詳細・コメント追加・詳細）\n')
+
+            session_table = connection.ops.quote_name(Session._meta.db_table)
+            for label, engine, message_storage in CONFIGURATIONS:
+                with override_settings(SESSION_ENGINE=engine, MESSAGE_STORAGE=message_storage):
+                    client = Client()
+                    client.force_login(user)
+                    # 初回の読み込み（ユーザーコンテキストのセッションへの保存など）は計測しない
+                    for method, url, data in requests:
+                        getattr(client, method)(url, data)
+
+                    session_queries, total_queries, timings = [], [], []
+                    for _ in range(options['rounds']):
+                        for method, url, data in requests:
+                            with CaptureQueriesContext(connection) as context:
+                                started = time.perf_counter()
+                                getattr(client, method)(url, data)
+                                timings.append((time.perf_counter() - started) * 1000)
+                            sqls = [query['sql'] for query in context.captured_queries]
+                            session_queries.append(sum(session_table in sql for sql in sqls))
+                            total_queries.append(len(sqls))
+
+                self.stdout.write(
+                    f'  {label}: セッション {statistics.mean(session_queries):.2f}回/リクエスト  '
+                    f'全クエリ {statistics.mean(total_queries):.2f}回/リクエスト  '
+                    f'{statistics.median(timings):.2f}ms（中央値）'
+                )
+
+            transaction.set_rollback(True)
+
+    def _create_fixtures(self):
+        user = User.objects.create_user(f'benchmark_sessions_{time.time_ns()}')
+        UserProfile.objects.create(user=user, role='vendor', company_name='ベンチマーク')
+        application = Application.objects.create(
+            application_type='work', title='ベンチマーク申請', applicant=user, company_name='ベンチマーク'
+        )
+        return user, application
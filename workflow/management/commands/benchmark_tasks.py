@@ -0,0 +1,54 @@
+"""
+バックグラウンドタスクキューのスループットを計測するコマンド
+
+何もしないタスク（workflow.tasks.noop）を登録し、ワーカー数ごとに全件を実行し終えるまでの時間を計測する。
+    python manage.py benchmark_tasks --tasks 5000 --workers 1 2 4 8
+PostgreSQL では SKIP LOCKED、SQLite では条件付き UPDATE による取得を計測する（SQLite は書き込みが直列化される）。
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from workflow.models import BackgroundTask
+from workflow.tasks import Worker, noop
+
+
+class Command(BaseCommand):
+    help = 'バックグラウンドタスクキューのワーカー数ごとのスループットを計測'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000, help='登録するタスク数')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='計測するワーカー（スレッド）数')
+        parser.add_argument('--batch-size', type=int, default=10, help='1回に取得するタスク数')
+
+    def handle(self, *args, **options):
+        claim = 'SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else '条件付き UPDATE'
+        self.stdout.write(f'DB: {connection.vendor}（取得方式: {claim}）  タスク数: {options["tasks"]}\n')
+
+        for count in options['workers']:
+            BackgroundTask.objects.filter(name=noop.task_name).delete()
+            BackgroundTask.objects.bulk_create(
+                [BackgroundTask(name=noop.task_name, args=[i]) for i in range(options['tasks'])],
+                batch_size=1000,
+            )
+
+            workers = [Worker(batch_size=options['batch_size'], poll_interval=0.01) for _ in range(count)]
+            threads = [threading.Thread(target=worker.run, kwargs={'drain': True}) for worker in workers]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            processed = sum(worker.processed for worker in workers)
+            remaining = BackgroundTask.objects.filter(name=noop.task_name, status='queued').count()
+            duplicated = processed - BackgroundTask.objects.filter(name=noop.task_name, status='done').count()
+            self.stdout.write(
+                f'  ワーカー{count}: {elapsed:.2f}秒  {processed / elapsed if elapsed else 0:,.0f}件/秒'
+                f'（未実行 {remaining}件、重複実行 {duplicated}件）'
+            )
+
+        BackgroundTask.objects.filter(name=noop.task_name).delete()
@@ -0,0 +1,85 @@
+"""
+申請種別ごとの入力ルール検証のベンチマーク
+
+ApplicationForm を1件ずつ検証する場合と、コンパイル済みの検証器（1件ずつ・列指向のまとめて）を比較する。
+    python manage.py benchmark_validation --records 5000
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from workflow.forms import ApplicationForm
+from workflow.models import Application
+from workflow.validation import application_validator, to_columns
+
+
+class Command(BaseCommand):
+    help = '申請の入力ルール検証（フォーム／検証器）の処理時間を比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=5000, help='検証する件数')
+        parser.add_argument('--seed', type=int, default=0, help='テストデータ生成の乱数シード')
+
+    def handle(self, *args, **options):
+        records = self._make_records(options['records'], random.Random(options['seed']))
+        self.stdout.write(f'件数: {len(records)}\n')
+
+        # フォームに渡す値は文字列（画面からのPOSTと同じ）
+        form_data = [
+            {name: '' if value is None else str(value) for name, value in record.items()}
+            for record in records
+        ]
+
+        started = time.perf_counter()
+        form_invalid = sum(1 for data in form_data if not ApplicationForm(data=data).is_valid())
+        self._report('ApplicationForm（1件ずつ）', time.perf_counter() - started, len(records), form_invalid)
+
+        started = time.perf_counter()
+        single_invalid = sum(1 for record in records if application_validator.validate(record))
+        self._report('検証器（1件ずつ）', time.perf_counter() - started, len(records), single_invalid)
+
+        started = time.perf_counter()
+        columns = to_columns(records, application_validator.fields + ['application_type'])
+        batch_invalid = len(application_validator.validate_columns(columns))
+        self._report('検証器（列指向まとめて）', time.perf_counter() - started, len(records), batch_invalid)
+
+        if not form_invalid == single_invalid == batch_invalid:
+            self.stdout.write(self.style.ERROR('検証結果の件数が一致しません。'))
+
+    def _make_records(self, count, rng):
+        """申請種別・欠損・日付の逆転を混ぜたテストデータを作成する"""
+        types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
+        optional = [
+            'work_location', 'worker_count', 'tool_list', 'restricted_area',
+            'entry_purpose', 'entry_members', 'contractor_name', 'work_end_date'
+        ]
+        records = []
+        for i in range(count):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(365))
+            record = {
+                'application_type': rng.choice(types),
+                'title': f'ベンチマーク申請{i}',
+                'content': '内容',
+                'work_location': 'A棟3階',
+                'work_start_date': start,
+                'work_end_date': start + timedelta(days=rng.randrange(-3, 10)),
+                'worker_count': rng.randrange(1, 20),
+                'tool_list': '電動ドライバー\nハンマー',
+                'restricted_area': 'クリーンルームA',
+                'entry_purpose': '設備点検',
+                'entry_members': '山田太郎 (ABC株式会社)',
+                'contractor_name': 'ABC建設',
+            }
+            # 一部の行は必須項目を欠損させる
+            if rng.random() < 0.2:
+                record[rng.choice(optional)] = None
+            records.append(record)
+        return records
+
+    def _report(self, label, elapsed, count, invalid):
+        self.stdout.write(
+            f'  {label}: {elapsed * 1000:.1f}ms  '
+            f'（{count / elapsed if elapsed else 0:,.0f}件/秒, エラー{invalid}件）'
+        )
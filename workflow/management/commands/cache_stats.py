@@ -0,0 +1,41 @@
+"""
+共有キャッシュのヒット率を表示するコマンド（全ワーカーの合計）
+
+    python manage.py cache_stats
+    python manage.py cache_stats --reset
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from workflow.caching import metrics
+
+
+class Command(BaseCommand):
+    help = '共有キャッシュのキャッシュ名ごとのヒット・ミス件数を表示'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='集計値をリセットする')
+    
+    def handle(self, *args, **options):
+        if options['reset']:
+            metrics.reset_shared()
+            self.stdout.write(self.style.SUCCESS('キャッシュの集計値をリセットしました'))
+            return
+        
+        self.stdout.write(f'キャッシュ: {settings.CACHES["default"]["BACKEND"]}')
+        totals = metrics.shared_totals()
+        if not totals:
+            self.stdout.write('集計値はまだありません')
+            return
+        
+        self.stdout.write(
+            f'{"キャッシュ名":<28}{"プロセス内":>10}{"ヒット":>8}{"期限後":>8}{"ミス":>8}{"再計算":>8}{"待機":>8}{"ヒット率":>10}'
+        )
+        for name, counts in sorted(totals.items()):
+            served = counts['local'] + counts['hit'] + counts['stale'] + counts['recompute'] + counts['miss']
+            # プロセス内・期限後（古い値を返した）もヒットとして扱う
+            hit_rate = (counts['local'] + counts['hit'] + counts['stale']) / served * 100 if served else 0
+            self.stdout.write(
+                f'{name:<28}{counts["local"]:>10}{counts["hit"]:>8}{counts["stale"]:>8}{counts["miss"]:>8}'
+                f'{counts["recompute"]:>8}{counts["wait"]:>8}{hit_rate:>9.1f}%'
+            )
@@ -0,0 +1,42 @@
+"""
+SLA超過の申請を督促・エスカレーションするコマンド
+
+    python manage.py escalate_sla                     1回確認して終了（cron で毎分実行）
+    python manage.py escalate_sla --loop              --interval 秒ごとに確認を続ける
+SLAの時間は管理画面の申請種別設定で設定する。通知メールはタスクキュー（runworkers）から送信される。
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from workflow.escalation import BATCH_SIZE, run_escalations
+
+
+class Command(BaseCommand):
+    help = 'SLAを超過した受付待ち・承認待ちの申請を通知'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='終了せずに --interval 秒ごとに確認する')
+        parser.add_argument('--interval', type=float, default=60.0, help='--loop の確認間隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='1回に通知する申請数の上限（申請種別・段階・レベルごと）')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self._run_once(options['batch_size'])
+            return
+
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+        self.stdout.write(f'{options["interval"]}秒ごとにSLA超過を確認します')
+        while not stopping.is_set():
+            close_old_connections()
+            self._run_once(options['batch_size'])
+            stopping.wait(options['interval'])
+
+    def _run_once(self, batch_size):
+        for application_type, stage, level, count in run_escalations(batch_size=batch_size):
+            if count:
+                self.stdout.write(f'  {application_type} {stage} レベル{level}: {count}件を通知しました')
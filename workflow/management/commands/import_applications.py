@@ -0,0 +1,54 @@
+"""
+CSV / Excel から申請を一括取込するコマンド
+
+    python manage.py import_applications permits.csv --username vendor1 --submit --errors errors.csv
+"""
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workflow.audit import audit_context
+from workflow.importer import (
+    ApplicationImporter, ApplicationImportError, CHUNK_SIZE, read_rows, write_error_report
+)
+
+
+class Command(BaseCommand):
+    help = 'CSV / Excel から申請を一括取込'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='取込ファイル（.csv / .xlsx）')
+        parser.add_argument('--username', required=True, help='申請者とするユーザー名')
+        parser.add_argument('--submit', action='store_true', help='取込後にまとめて提出する')
+        parser.add_argument('--errors', help='エラーレポートの出力先CSV（省略時は標準出力）')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1回の一括登録件数')
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.select_related('profile').get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'ユーザーが見つかりません: {options["username"]}')
+        
+        importer = ApplicationImporter(user, submit=options['submit'], chunk_size=options['chunk_size'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as file, audit_context(actor=user, source='system'):
+                result = importer.run(read_rows(file, options['path']))
+        except (OSError, ApplicationImportError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created}件を登録しました（提出: {result.submitted}件, {elapsed:.2f}秒）'
+        ))
+        
+        if result.errors:
+            self.stdout.write(self.style.WARNING(f'{result.failed_rows}行にエラーがあります'))
+            if options['errors']:
+                with open(options['errors'], 'w', encoding='utf-8-sig', newline='') as stream:
+                    write_error_report(result, stream)
+                self.stdout.write(f'エラーレポート: {options["errors"]}')
+            else:
+                write_error_report(result, sys.stdout)
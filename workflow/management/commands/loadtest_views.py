@@ -0,0 +1,116 @@
+"""
+同期ビュー（WSGI）と非同期ビュー（ASGI）のスループット・レイテンシを比較するコマンド
+
+同じ同時実行数で、同期版はスレッド、非同期版は asyncio タスクからリクエストを発行する。
+    python manage.py loadtest_views --username receiver1 --url /workflow/ --requests 500 --concurrency 8
+"""
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, AsyncClient, override_settings
+
+
+def _percentile(values, percent):
+    """パーセンタイル値を返す（最近傍法）"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = '同期ビューと非同期ビューのスループット・p99レイテンシを比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='リクエストを発行するユーザー名')
+        parser.add_argument('--url', action='append', help='計測するURL（複数指定可、既定: ダッシュボードと受付待ち）')
+        parser.add_argument('--requests', type=int, default=200, help='URLごとのリクエスト数')
+        parser.add_argument('--concurrency', type=int, default=8, help='同時実行数（スレッド数／タスク数）')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'ユーザーが見つかりません: {options["username"]}')
+
+        urls = options['url'] or ['/workflow/', '/workflow/pending-receive/']
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        # ログイン済みセッションを共有する
+        login_client = Client()
+        login_client.force_login(user)
+        session_cookie = login_client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        self.stdout.write(f'リクエスト数: {total} / 同時実行数: {concurrency}\n')
+        for url in urls:
+            self.stdout.write(self.style.SUCCESS(f'=== {url} ==='))
+
+            sync_result = self._run_sync(url, session_cookie, total, concurrency)
+            self._report('同期（WSGI）', sync_result)
+
+            with override_settings(ROOT_URLCONF='config.urls_asgi'):
+                async_result = asyncio.run(self._run_async(url, session_cookie, total, concurrency))
+            self._report('非同期（ASGI）', async_result)
+
+    def _run_sync(self, url, session_cookie, total, concurrency):
+        def worker(count):
+            client = Client()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_cookie
+            latencies, errors = [], 0
+            for _ in range(count):
+                start = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(worker, self._split(total, concurrency)))
+        return self._collect(results, time.perf_counter() - started)
+
+    async def _run_async(self, url, session_cookie, total, concurrency):
+        async def worker(count):
+            client = AsyncClient()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_cookie
+            latencies, errors = [], 0
+            for _ in range(count):
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+            return latencies, errors
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker(count) for count in self._split(total, concurrency)))
+        return self._collect(results, time.perf_counter() - started)
+
+    def _split(self, total, concurrency):
+        """リクエスト数をワーカーに均等に割り振る"""
+        base, extra = divmod(total, concurrency)
+        return [base + (1 if i < extra else 0) for i in range(concurrency) if base or i < extra]
+
+    def _collect(self, results, elapsed):
+        latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+        errors = sum(worker_errors for _, worker_errors in results)
+        return {
+            'count': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / elapsed if elapsed else 0,
+            'p50': statistics.median(latencies) * 1000,
+            'p99': _percentile(latencies, 99) * 1000,
+        }
+
+    def _report(self, label, result):
+        self.stdout.write(
+            f'  {label}: {result["throughput"]:.1f} req/s  '
+            f'p50 {result["p50"]:.1f}ms  p99 {result["p99"]:.1f}ms  '
+            f'（{result["count"]}件, エラー{result["errors"]}件）'
+        )
@@ -0,0 +1,56 @@
+"""
+セッションの保存先（WORKFLOW_SESSION_STORAGE）を切り替えたときに、ログイン中のセッションを移すコマンド
+
+    python manage.py migrate_sessions              現在の保存先へ移す
+    python manage.py migrate_sessions --dry-run    件数の確認のみ
+
+- cached_db: DBの有効なセッションを共有キャッシュへ読み込む（切り替え直後のDB読み取りの集中を防ぐ）
+- signed_cookies: ブラウザのCookieは書き換えられないため、各ユーザーの次のリクエストで
+  workflow.sessions が署名付きCookieへ移す。ここでは移行待ちの件数を表示する
+- db: cached_db から戻す場合はDBに全件あるため不要。signed_cookies から戻すとセッションは引き継げない
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'ログイン中のセッションを現在のセッションの保存先へ移す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='件数の確認のみ行う')
+        parser.add_argument('--batch-size', type=int, default=1000, help='DBから1回に読み込む件数')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        active = Session.objects.filter(expire_date__gt=now)
+        count = active.count()
+        storage = settings.WORKFLOW_SESSION_STORAGE
+        self.stdout.write(f'セッションの保存先: {storage}（{settings.SESSION_ENGINE}）  DBの有効なセッション: {count}件')
+
+        if storage == 'cached_db':
+            if not options['dry_run']:
+                copied = self._copy_to_cache(active, now, options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'{copied}件を共有キャッシュへ読み込みました'))
+        elif storage == 'signed_cookies':
+            self.stdout.write(
+                f'{count}件は各ユーザーの次のリクエストで署名付きCookieへ移ります（移したDBの行は削除）。'
+                '期限切れの行は python manage.py clearsessions で削除してください'
+            )
+        else:
+            self.stdout.write('DBのセッションをそのまま使います（移行は不要です）')
+
+    def _copy_to_cache(self, sessions, now, batch_size):
+        session_cache = caches[settings.SESSION_CACHE_ALIAS]
+        store = SessionStore()
+        copied = 0
+        for session in sessions.iterator(chunk_size=batch_size):
+            # cached_db の SessionStore.load() と同じキー・値・有効期間（セッションごとに残り時間が異なる）
+            timeout = max(int((session.expire_date - now).total_seconds()), 1)
+            session_cache.set(KEY_PREFIX + session.session_key, store.decode(session.session_data), timeout)
+            copied += 1
+        return copied
@@ -0,0 +1,22 @@
+"""
+古い受信箱の通知を削除するコマンド
+
+    python manage.py prune_inbox                     90日より前の通知を削除（cron で1日1回実行）
+    python manage.py prune_inbox --days 30 --batch-size 5000
+1回のトランザクションで batch_size 件ずつ削除し、未読のまま削除した分は未読件数から引く。
+"""
+from django.core.management.base import BaseCommand
+
+from workflow.notifications import INBOX_RETENTION_DAYS, PRUNE_BATCH_SIZE, prune_inbox
+
+
+class Command(BaseCommand):
+    help = '古い受信箱の通知を削除'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=INBOX_RETENTION_DAYS, help='この日数より前の通知を削除する')
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help='1回のトランザクションで削除する件数')
+
+    def handle(self, *args, **options):
+        deleted = prune_inbox(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted}件の通知を削除しました'))
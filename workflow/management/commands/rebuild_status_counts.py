@@ -0,0 +1,19 @@
+"""
+申請種別 × ステータスの件数（/metrics のキューの深さ）を申請から数え直すコマンド
+
+件数は申請の保存・削除・一括取込で増減する。SQLでの直接更新などでずれた場合に実行する。
+    python manage.py rebuild_status_counts
+"""
+from django.core.management.base import BaseCommand
+
+from workflow.models import ApplicationStatusCount, rebuild_status_counts
+
+
+class Command(BaseCommand):
+    help = '申請種別 × ステータスの件数を数え直す'
+
+    def handle(self, *args, **options):
+        rebuild_status_counts()
+        for row in ApplicationStatusCount.objects.all():
+            self.stdout.write(f'  {row.application_type:<20}{row.status:<12}{row.count:>8}')
+        self.stdout.write(self.style.SUCCESS('件数を数え直しました'))
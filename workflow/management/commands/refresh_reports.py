@@ -0,0 +1,33 @@
+"""
+レポート用の日次集計（リードタイム・滞留）を更新するコマンド
+
+    python manage.py refresh_reports              前回の最終集計日以降を差分更新
+    python manage.py refresh_reports --since 2026-04-01
+    python manage.py refresh_reports --full       全期間を作り直す
+滞留のスナップショットは実行時点の状態を当日分として記録するため、1日1回以上（cron 等で）実行する。
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from workflow.reporting import refresh_reports
+
+
+class Command(BaseCommand):
+    help = 'リードタイム・滞留の日次集計を更新'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='この日（YYYY-MM-DD）以降の集計を作り直す')
+        parser.add_argument('--full', action='store_true', help='全期間の集計を作り直す')
+
+    def handle(self, *args, **options):
+        date_from = None
+        if options['since']:
+            date_from = parse_date(options['since'])
+            if date_from is None:
+                raise CommandError(f'日付の形式が正しくありません: {options["since"]}')
+
+        result = refresh_reports(date_from=date_from, full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["date_from"]}〜{result["date_to"]} のリードタイム集計{result["lead_time_rows"]}行、'
+            f'滞留スナップショット{result["backlog_rows"]}行を作成しました'
+        ))
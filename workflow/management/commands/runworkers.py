@@ -0,0 +1,114 @@
+"""
+バックグラウンドタスク（workflow.tasks）のワーカーを起動するコマンド
+
+    python manage.py runworkers --workers 4                 4プロセスで常駐
+    python manage.py runworkers --workers 4 --threads       4スレッドで常駐（1プロセス）
+    python manage.py runworkers --drain                     実行できるタスクがなくなったら終了
+SIGTERM / SIGINT を受けると、実行中のタスクを終えてから終了する。
+"""
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from workflow.tasks import VISIBILITY_TIMEOUT, Worker, purge_finished_tasks
+
+
+# 完了したタスクを削除する間隔（秒）
+PURGE_INTERVAL = 3600
+
+
+def _run_worker(worker_options, drain):
+    """子プロセスでワーカーを実行する"""
+    worker = Worker(**worker_options)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: worker.stop())
+    worker.run(drain=drain)
+
+
+class Command(BaseCommand):
+    help = 'バックグラウンドタスクのワーカーを起動'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='ワーカー数')
+        parser.add_argument('--threads', action='store_true', help='プロセスではなくスレッドで実行する')
+        parser.add_argument('--batch-size', type=int, default=10, help='1回に取得するタスク数')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='タスクがない場合の確認間隔（秒）')
+        parser.add_argument(
+            '--visibility-timeout', type=int, default=VISIBILITY_TIMEOUT,
+            help='取得したタスクを他のワーカーから隠す時間（秒）。これを過ぎても終わらないタスクは再実行される'
+        )
+        parser.add_argument('--drain', action='store_true', help='実行できるタスクがなくなったら終了する')
+
+    def handle(self, *args, **options):
+        worker_options = {
+            'batch_size': options['batch_size'],
+            'poll_interval': options['poll_interval'],
+            'visibility_timeout': options['visibility_timeout'],
+        }
+        self.stdout.write(
+            f'ワーカーを{options["workers"]}{"スレッド" if options["threads"] else "プロセス"}で起動します'
+        )
+        if options['threads']:
+            self._run_threads(options['workers'], worker_options, options['drain'])
+        else:
+            self._run_processes(options['workers'], worker_options, options['drain'])
+
+    def _run_threads(self, count, worker_options, drain):
+        workers = [Worker(**worker_options) for _ in range(count)]
+        threads = [threading.Thread(target=worker.run, kwargs={'drain': drain}) for worker in workers]
+        stopping = threading.Event()
+
+        def stop(*args):
+            stopping.set()
+            for worker in workers:
+                worker.stop()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, stop)
+        for thread in threads:
+            thread.start()
+        self._supervise(lambda: any(thread.is_alive() for thread in threads), stopping)
+        for thread in threads:
+            thread.join()
+        self.stdout.write(self.style.SUCCESS(f'{sum(worker.processed for worker in workers)}件のタスクを実行しました'))
+
+    def _run_processes(self, count, worker_options, drain):
+        # 親プロセスのDB接続を子プロセスへ引き継がない
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=_run_worker, args=(worker_options, drain), daemon=True)
+            for _ in range(count)
+        ]
+        stopping = threading.Event()
+
+        def stop(*args):
+            stopping.set()
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, stop)
+        for process in processes:
+            process.start()
+        self._supervise(lambda: any(process.is_alive() for process in processes), stopping)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('ワーカーを終了しました'))
+
+    def _supervise(self, is_running, stopping):
+        """ワーカーの終了を待ちながら、完了したタスクを定期的に削除する"""
+        next_purge = time.monotonic()
+        while is_running() and not stopping.is_set():
+            if time.monotonic() >= next_purge:
+                deleted = purge_finished_tasks()
+                connections.close_all()
+                if deleted:
+                    self.stdout.write(f'完了したタスクを{deleted}件削除しました')
+                next_purge = time.monotonic() + PURGE_INTERVAL
+            stopping.wait(1.0)
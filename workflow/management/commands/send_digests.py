@@ -0,0 +1,43 @@
+"""
+まとめ通知（1時間ごと・1日1回）を送信するコマンド
+
+    python manage.py send_digests                     1回送信して終了（cron で数分おきに実行）
+    python manage.py send_digests --loop              --interval 秒ごとに送信を続ける
+区切りの時刻（毎時0分・毎日 NOTIFICATION_DIGEST_HOUR 時）を過ぎた宛先ごとに1通にまとめ、
+1つのSMTP接続で送信する。
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from workflow.notifications import DIGEST_BATCH_SIZE, send_digests
+
+
+class Command(BaseCommand):
+    help = 'まとめ通知を送信'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='終了せずに --interval 秒ごとに送信する')
+        parser.add_argument('--interval', type=float, default=60.0, help='--loop の確認間隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=DIGEST_BATCH_SIZE, help='1回のトランザクションで処理する通知数')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self._run_once(options['batch_size'])
+            return
+
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+        self.stdout.write(f'{options["interval"]}秒ごとにまとめ通知を送信します')
+        while not stopping.is_set():
+            close_old_connections()
+            self._run_once(options['batch_size'])
+            stopping.wait(options['interval'])
+
+    def _run_once(self, batch_size):
+        sent = send_digests(batch_size=batch_size)
+        if sent:
+            self.stdout.write(f'  まとめ通知を{sent}通送信しました')
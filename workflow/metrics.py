@@ -0,0 +1,234 @@
+"""
+運用メトリクス（Prometheus のテキスト形式で /metrics から取得）
+
+- workflow_http_request_duration_seconds: URL名 × メソッドごとの処理時間（ヒストグラム）
+- workflow_http_responses_total: URL名 × ステータスコードごとのレスポンス数
+- workflow_db_queries_total: URL名 × DBごとのSQLの実行回数（リクエスト内のみ）
+- workflow_email_send_duration_seconds / workflow_email_send_failures_total: メール送信の時間と失敗数
+- workflow_transitions_total: 申請種別ごとのステータス遷移数
+- workflow_cache_requests_total / workflow_cache_hit_ratio: 共有キャッシュのヒット・ミス（workflow.caching）
+- workflow_applications: 申請種別 × ステータスの件数（受付待ちは submitted、承認待ちは received）
+
+カウンタ・ヒストグラムはプロセス内で集計して一定間隔で MetricCounter へ F 式で加算し、取得時は全ワーカーの合計を返す
+（共有キャッシュの incr は FileBasedCache では読み込みと書き込みが別のため、同時に加算すると値が失われる）。
+申請の件数は ApplicationStatusCount（保存時に増減）を読むため、取得時に申請を COUNT しない。
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+from .caching import metrics as cache_metrics
+
+
+logger = logging.getLogger(__name__)
+
+# 処理時間のヒストグラムの区間（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 集計値をDBへ反映する間隔（秒）
+FLUSH_INTERVAL = 10
+
+# メトリクス名 → (種類, 説明)
+METRICS = {
+    'workflow_http_request_duration_seconds': ('histogram', 'リクエストの処理時間（URL名・メソッド別）'),
+    'workflow_http_responses_total': ('counter', 'レスポンス数（URL名・ステータスコード別）'),
+    'workflow_db_queries_total': ('counter', 'リクエスト内で実行したSQLの数（URL名・DB別）'),
+    'workflow_email_send_duration_seconds': ('histogram', 'メール送信の所要時間（送信元別）'),
+    'workflow_email_send_failures_total': ('counter', 'メール送信の失敗数（送信元別）'),
+    'workflow_transitions_total': ('counter', '申請のステータス遷移数（申請種別・遷移前後のステータス別）'),
+    'workflow_cache_requests_total': ('counter', '共有キャッシュの参照数（キャッシュ名・結果別）'),
+    'workflow_cache_hit_ratio': ('gauge', '共有キャッシュのヒット率（プロセス内・期限後の値もヒットとする）'),
+    'workflow_applications': ('gauge', '申請の件数（申請種別・ステータス別。submitted は受付待ち、received は承認待ち）'),
+}
+
+# リクエスト内のSQLの実行回数（DB別）。MetricsMiddleware がリクエストごとに設定する
+_query_counts = ContextVar('workflow_metrics_query_counts', default=None)
+
+
+class MetricsRegistry:
+    """
+    カウンタ・ヒストグラムの値をプロセス内で集計し、一定間隔で MetricCounter へ加算する
+
+    系列（メトリクス名 + ラベル）ごとに整数で数える。ヒストグラムの合計はマイクロ秒で持つ。
+    トランザクション内では反映しない（ロールバックで失われる・カウンタの行ロックを保持し続けるため）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._last_flush = time.monotonic()
+
+    def inc(self, name, labels=None, value=1):
+        series = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._pending[series] += value
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            self.flush()
+
+    def observe(self, name, labels, seconds, buckets=LATENCY_BUCKETS):
+        """ヒストグラムに1件記録する（区間ごとの累積件数・件数・合計）"""
+        for upper in buckets:
+            if seconds <= upper:
+                self.inc(f'{name}_bucket', dict(labels, le=str(upper)))
+        self.inc(f'{name}_bucket', dict(labels, le='+Inf'))
+        self.inc(f'{name}_count', labels)
+        self.inc(f'{name}_sum_us', labels, int(seconds * 1_000_000))
+
+    def flush(self):
+        """未反映の集計値を MetricCounter へ加算する（失敗した場合は次回に持ち越す）"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        MetricCounter = apps.get_model('workflow', 'MetricCounter')
+        try:
+            with transaction.atomic():
+                # 行ロックの取得順を揃える（複数のワーカーが同時に反映してもデッドロックしないように）
+                for key, (name, labels), value in sorted((self._key(series), series, value)
+                                                         for series, value in pending.items()):
+                    counters = MetricCounter.objects.filter(key=key)
+                    if not counters.update(value=F('value') + value):
+                        # 系列を登録してから加算する
+                        MetricCounter.objects.get_or_create(key=key, defaults={'name': name, 'labels': dict(labels)})
+                        counters.update(value=F('value') + value)
+        except Exception:
+            logger.warning('メトリクスを反映できませんでした', exc_info=True)
+            with self._lock:
+                for series, value in pending.items():
+                    self._pending[series] += value
+
+    def shared_totals(self):
+        """全ワーカーの合計 {(メトリクス名, ラベル): 値} を返す"""
+        MetricCounter = apps.get_model('workflow', 'MetricCounter')
+        return {
+            (name, tuple(sorted(labels.items()))): value
+            for name, labels, value in MetricCounter.objects.values_list('name', 'labels', 'value')
+        }
+
+    def reset_shared(self):
+        apps.get_model('workflow', 'MetricCounter').objects.all().delete()
+
+    def _key(self, series):
+        return hashlib.md5(repr(series).encode()).hexdigest()
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def counting_queries():
+    """ブロック内で実行したSQLの数を {DBのエイリアス: 回数} で返す（MetricsMiddleware 用）"""
+    counts = defaultdict(int)
+    token = _query_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        _query_counts.reset(token)
+
+
+def count_query(execute, sql, params, many, context):
+    """DB接続の execute_wrapper（connection_created で全接続に登録する）"""
+    counts = _query_counts.get()
+    if counts is not None:
+        counts[context['connection'].alias] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@contextmanager
+def track_email(source):
+    """メール送信の所要時間と失敗を記録する（例外はそのまま送出する）"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc('workflow_email_send_failures_total', {'source': source})
+        raise
+    finally:
+        registry.observe('workflow_email_send_duration_seconds', {'source': source}, time.perf_counter() - started)
+
+
+def record_transition(application_type, old_status, new_status, count=1):
+    """ステータス遷移を数える（コミット後。ロールバックされた遷移は数えない。新規作成は遷移前が空）"""
+    labels = {'application_type': application_type, 'from_status': old_status or '', 'to_status': new_status}
+    transaction.on_commit(lambda: registry.inc('workflow_transitions_total', labels, count))
+
+
+def collect():
+    """全ワーカーの合計と申請の件数を {メトリクス名: [(ラベル, 値), ...]} で返す"""
+    samples = defaultdict(list)
+    for (name, labels), value in registry.shared_totals().items():
+        labels = dict(labels)
+        if name.endswith('_sum_us'):
+            samples[name[:-len('_us')]].append((labels, value / 1_000_000))
+        else:
+            samples[name].append((labels, value))
+
+    for cache_name, counts in cache_metrics.shared_totals().items():
+        for outcome, count in counts.items():
+            samples['workflow_cache_requests_total'].append(({'cache': cache_name, 'outcome': outcome}, count))
+        served = sum(counts[outcome] for outcome in ('local', 'hit', 'stale', 'recompute', 'miss'))
+        if served:
+            hits = counts['local'] + counts['hit'] + counts['stale']
+            samples['workflow_cache_hit_ratio'].append(({'cache': cache_name}, hits / served))
+
+    ApplicationStatusCount = apps.get_model('workflow', 'ApplicationStatusCount')
+    for application_type, status, count in ApplicationStatusCount.objects.values_list(
+        'application_type', 'status', 'count'
+    ):
+        samples['workflow_applications'].append(({'application_type': application_type, 'status': status}, count))
+    return samples
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+        return f'{name}{{{label_text}}} {value}'
+    return f'{name} {value}'
+
+
+def _bucket_order(sample):
+    labels, _ = sample
+    le = labels.get('le', '+Inf')
+    return (sorted((key, value) for key, value in labels.items() if key != 'le'),
+            float('inf') if le == '+Inf' else float(le))
+
+
+def render_text(samples):
+    """Prometheus のテキスト形式（version 0.0.4）にする"""
+    lines = []
+    for family, (metric_type, help_text) in METRICS.items():
+        if metric_type == 'histogram':
+            parts = [
+                (f'{family}_bucket', sorted(samples.get(f'{family}_bucket', []), key=_bucket_order)),
+                (f'{family}_sum', samples.get(f'{family}_sum', [])),
+                (f'{family}_count', samples.get(f'{family}_count', [])),
+            ]
+        else:
+            parts = [(family, samples.get(family, []))]
+        if not any(values for _, values in parts):
+            continue
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {metric_type}')
+        for name, values in parts:
+            lines.extend(_format_sample(name, labels, value) for labels, value in values)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+"""
+業務ワークフローシステムのミドルウェア
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.middleware import get_user
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from .audit import audit_context
+from .caching import routing_cache
+from .db_routing import database_state, pin_to_primary, pinned_until
+from .metrics import counting_queries, registry
+from .profiling import finish_profiler, profile_requested, requested_mode, start_profiler
+from .user_context import bind_session, get_user_context
+
+
+class MetricsMiddleware:
+    """
+    リクエストの処理時間・SQLの実行回数を workflow.metrics に記録する（同期・非同期両対応）
+    
+    MIDDLEWARE の先頭に置く。ラベルはURL名（一致しない場合は unmatched）。
+    """
+    sync_capable = True
+    async_capable = True
+    
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with counting_queries() as queries:
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, queries)
+        return response
+    
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with counting_queries() as queries:
+            response = await self.get_response(request)
+        # 集計値のDBへの反映（FLUSH_INTERVAL ごと）は同期コンテキストで行う
+        await sync_to_async(self._record)(request, response, time.perf_counter() - started, queries)
+        return response
+    
+    def _record(self, request, response, elapsed, queries):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        # 任意のメソッド名で系列が増えないようにまとめる
+        method = request.method if request.method in self.METHODS else 'other'
+        registry.observe('workflow_http_request_duration_seconds', {'view': view, 'method': method}, elapsed)
+        registry.inc('workflow_http_responses_total', {'view': view, 'status': str(response.status_code)})
+        for alias, count in queries.items():
+            registry.inc('workflow_db_queries_total', {'view': view, 'db': alias}, count)
+
+
+class UserContextMiddleware:
+    """
+    権限の判定に使うユーザーコンテキスト（workflow.user_context）をセッションに保存する（同期・非同期両対応）
+    
+    AuthenticationMiddleware の後に置く。request.user の読み込み時にセッションを結び付けるだけで、
+    コンテキストは権限の判定で初めて読み込む。
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._bind(request)
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        self._bind(request)
+        return await self.get_response(request)
+    
+    def _bind(self, request):
+        request.user = SimpleLazyObject(lambda: bind_session(get_user(request), request.session))
+        request.user_context = SimpleLazyObject(lambda: get_user_context(request.user))
+
+
+class ProfilingMiddleware:
+    """
+    リクエストのプロファイルを記録する（workflow.profiling、同期・非同期両対応）
+    
+    UserContextMiddleware の後に置く。スタッフの指定（?_profile=1）と、
+    PROFILING_SAMPLE_RATE の割合で採取して PROFILING_SLOW_MS 以上かかったリクエストを保存する。
+    指定されたリクエストのレスポンスには、管理画面のプロファイルのURLを X-Workflow-Profile で返す。
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profiler = start_profiler(requested_mode(request))
+        if profiler is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        profile = finish_profiler(profiler, request, response, (time.perf_counter() - started) * 1000)
+        return self._link(profiler, profile, response)
+    
+    async def __acall__(self, request):
+        mode = None
+        if profile_requested(request):
+            mode = await sync_to_async(requested_mode)(request)
+        profiler = start_profiler(mode, is_async=True)
+        if profiler is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        profile = await sync_to_async(finish_profiler)(
+            profiler, request, response, (time.perf_counter() - started) * 1000
+        )
+        return self._link(profiler, profile, response)
+    
+    def _link(self, profiler, profile, response):
+        if profile is not None and profiler.trigger == 'requested':
+            response['X-Workflow-Profile'] = reverse('admin:workflow_requestprofile_change', args=[profile.pk])
+        return response
+
+
+class AuditContextMiddleware:
+    """リクエストの操作者・操作元を監査ログのコンテキストに設定する（同期・非同期両対応）"""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._admin_prefix = None
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with audit_context(actor=request.user, source=self._get_source(request)):
+            return self.get_response(request)
+    
+    async def __acall__(self, request):
+        with audit_context(actor=request.user, source=self._get_source(request)):
+            return await self.get_response(request)
+    
+    def _get_source(self, request):
+        if self._admin_prefix is None:
+            self._admin_prefix = reverse('admin:index')
+        return 'admin' if request.path.startswith(self._admin_prefix) else 'web'
+
+
+class CacheVersionMiddleware:
+    """リクエスト開始時に2層キャッシュのバージョンを1回だけ確認する（同期・非同期両対応）"""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing_cache.refresh_version()
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        await sync_to_async(routing_cache.refresh_version)()
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    参照系の画面の読み取りをレプリカへ振り分ける（同期・非同期両対応）
+    
+    @replica_reads の付いたビューのみレプリカを使い、自分の書き込み直後は Cookie でプライマリに固定する。
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with database_state(pinned=self._is_pinned(request)) as state:
+            request.db_state = state
+            response = self.get_response(request)
+        return self._finish(state, response)
+    
+    async def __acall__(self, request):
+        with database_state(pinned=self._is_pinned(request)) as state:
+            request.db_state = state
+            response = await self.get_response(request)
+        return self._finish(state, response)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # 一覧画面の一括操作（POST）などはプライマリから読む
+        request.db_state.use_replica = (
+            request.method in ('GET', 'HEAD') and getattr(view_func, 'replica_reads', False)
+        )
+    
+    def _is_pinned(self, request):
+        return pinned_until(request) > time.time()
+    
+    def _finish(self, state, response):
+        if state.wrote:
+            pin_to_primary(response)
+        return response
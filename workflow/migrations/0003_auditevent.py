@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:55
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workflow', '0002_add_workflow_roles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('create', '作成'), ('update', '更新'), ('transition', 'ステータス遷移'), ('role_assign', 'ロール割当'), ('role_update', 'ロール割当変更'), ('role_unassign', 'ロール割当解除')], max_length=20, verbose_name='イベント種別')),
+                ('source', models.CharField(choices=[('web', '画面'), ('admin', '管理画面'), ('system', 'システム')], default='system', max_length=10, verbose_name='操作元')),
+                ('target_model', models.CharField(max_length=50, verbose_name='対象モデル')),
+                ('target_id', models.BigIntegerField(null=True, verbose_name='対象ID')),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='変更内容')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='発生日時')),
+                ('month', models.PositiveIntegerField(verbose_name='年月')),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='audit_events', to=settings.AUTH_USER_MODEL, verbose_name='操作者')),
+                ('application', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='audit_events', to='workflow.application', verbose_name='申請')),
+            ],
+            options={
+                'verbose_name': '監査イベント',
+                'verbose_name_plural': '監査イベント',
+                'ordering': ['occurred_at', 'id'],
+                'indexes': [models.Index(fields=['application', 'occurred_at'], name='auditevent_app_time_idx'), models.Index(fields=['actor', 'occurred_at'], name='auditevent_actor_time_idx'), models.Index(fields=['target_model', 'target_id', 'occurred_at'], name='auditevent_target_time_idx'), models.Index(fields=['month', 'event_type'], name='auditevent_month_type_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0003_auditevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationTool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.PositiveSmallIntegerField(verbose_name='行番号')),
+                ('name', models.CharField(max_length=200, verbose_name='名称')),
+                ('normalized_name', models.CharField(max_length=200, verbose_name='検索用名称')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=30, verbose_name='申請種別')),
+                ('status', models.CharField(choices=[('draft', '下書き'), ('submitted', '申請中'), ('received', '受付済'), ('approved', '承認済'), ('rejected', '却下'), ('returned', '差し戻し')], max_length=20, verbose_name='ステータス')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='開始日')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='終了日')),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tool_items', to='workflow.application', verbose_name='申請')),
+            ],
+            options={
+                'verbose_name': '持込工具',
+                'verbose_name_plural': '持込工具',
+                'ordering': ['application', 'line_number'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['normalized_name', 'status', 'start_date'], name='apptool_name_status_date_idx'), models.Index(fields=['start_date', 'end_date'], name='apptool_period_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ApplicationEntryMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.PositiveSmallIntegerField(verbose_name='行番号')),
+                ('name', models.CharField(max_length=200, verbose_name='名称')),
+                ('normalized_name', models.CharField(max_length=200, verbose_name='検索用名称')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=30, verbose_name='申請種別')),
+                ('status', models.CharField(choices=[('draft', '下書き'), ('submitted', '申請中'), ('received', '受付済'), ('approved', '承認済'), ('rejected', '却下'), ('returned', '差し戻し')], max_length=20, verbose_name='ステータス')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='開始日')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='終了日')),
+                ('company_name', models.CharField(blank=True, max_length=200, verbose_name='所属')),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entry_member_items', to='workflow.application', verbose_name='申請')),
+            ],
+            options={
+                'verbose_name': '立入者',
+                'verbose_name_plural': '立入者',
+                'ordering': ['application', 'line_number'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['normalized_name', 'status', 'start_date'], name='appmember_name_status_date_idx'), models.Index(fields=['start_date', 'end_date'], name='appmember_period_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+# 作業場所 + 期間（daterange）の GiST 索引（PostgreSQLのみ）
+# workflow.occupancy.occupying_applications の daterange と同じ式にすること
+GIST_INDEX_SQL = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+CREATE INDEX IF NOT EXISTS app_location_period_gist
+    ON workflow_application
+    USING gist (work_location, daterange(work_start_date, COALESCE(work_end_date, work_start_date), '[]'))
+    WHERE application_type IN ('work', 'construction')
+      AND status IN ('received', 'approved')
+      AND work_start_date IS NOT NULL;
+"""
+
+
+def create_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(GIST_INDEX_SQL)
+
+
+def drop_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS app_location_period_gist;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0004_line_items'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['work_location', 'work_end_date'], name='app_location_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['work_location', 'work_start_date'], name='app_location_start_idx'),
+        ),
+        migrations.RunPython(create_gist_index, drop_gist_index),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0005_occupancy_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BacklogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='集計日')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=20, verbose_name='申請種別')),
+                ('role_name', models.CharField(blank=True, max_length=100, verbose_name='担当ロール')),
+                ('company_name', models.CharField(max_length=200, verbose_name='申請企業名')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='件数')),
+                ('total_seconds', models.FloatField(default=0, verbose_name='合計時間（秒）')),
+                ('max_seconds', models.FloatField(default=0, verbose_name='最大時間（秒）')),
+                ('histogram', models.JSONField(default=list, verbose_name='時間の分布')),
+                ('queue', models.CharField(choices=[('receive', '受付待ち'), ('approve', '承認待ち')], max_length=10, verbose_name='キュー')),
+            ],
+            options={
+                'verbose_name': '滞留日次スナップショット',
+                'verbose_name_plural': '滞留日次スナップショット',
+                'ordering': ['date', 'queue', 'application_type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeadTimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='集計日')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=20, verbose_name='申請種別')),
+                ('role_name', models.CharField(blank=True, max_length=100, verbose_name='担当ロール')),
+                ('company_name', models.CharField(max_length=200, verbose_name='申請企業名')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='件数')),
+                ('total_seconds', models.FloatField(default=0, verbose_name='合計時間（秒）')),
+                ('max_seconds', models.FloatField(default=0, verbose_name='最大時間（秒）')),
+                ('histogram', models.JSONField(default=list, verbose_name='時間の分布')),
+                ('stage', models.CharField(choices=[('receive', '申請→受付'), ('approve', '受付→承認'), ('total', '申請→承認')], max_length=10, verbose_name='段階')),
+            ],
+            options={
+                'verbose_name': 'リードタイム日次集計',
+                'verbose_name_plural': 'リードタイム日次集計',
+                'ordering': ['date', 'stage', 'application_type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='workflowstep',
+            index=models.Index(fields=['processed_at'], name='workflowstep_processed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workflowstep',
+            index=models.Index(fields=['application', 'processed_at'], name='workflowstep_app_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leadtimerollup',
+            constraint=models.UniqueConstraint(fields=('date', 'stage', 'application_type', 'role_name', 'company_name'), name='leadtime_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='backlogsnapshot',
+            constraint=models.UniqueConstraint(fields=('date', 'queue', 'application_type', 'role_name', 'company_name'), name='backlog_snapshot_unique'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:32
+
+from django.db import migrations
+
+
+# 管理画面の部分一致検索（icontains: UPPER(列::text) LIKE UPPER('%...%')）用のトライグラム索引（PostgreSQLのみ）
+# 索引の式は Django が icontains で生成する式と同じにすること
+TRIGRAM_INDEXES = [
+    ('app_number_trgm', 'workflow_application', 'application_number'),
+    ('app_title_trgm', 'workflow_application', 'title'),
+    ('app_company_trgm', 'workflow_application', 'company_name'),
+    ('comment_content_trgm', 'workflow_comment', 'content'),
+    ('attachment_filename_trgm', 'workflow_attachment', 'filename'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops);'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0006_report_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:21
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0007_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='タスク名')),
+                ('args', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='位置引数')),
+                ('kwargs', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='キーワード引数')),
+                ('status', models.CharField(choices=[('queued', '待機中'), ('done', '完了'), ('failed', '失敗')], default='queued', max_length=10, verbose_name='ステータス')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='優先度')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='実行予定日時')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='実行回数')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='最大実行回数')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='実行中のワーカー')),
+                ('last_error', models.TextField(blank=True, verbose_name='最後のエラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+            ],
+            options={
+                'verbose_name': 'バックグラウンドタスク',
+                'verbose_name_plural': 'バックグラウンドタスク',
+                'ordering': ['-priority', 'run_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['-priority', 'run_at'], name='task_queued_idx'), models.Index(fields=['status', 'finished_at'], name='task_finished_idx')],
+            },
+        ),
+    ]
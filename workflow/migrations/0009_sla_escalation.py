@@ -0,0 +1,86 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0008_background_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SLACheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=30, verbose_name='申請種別')),
+                ('stage', models.CharField(choices=[('receive', '受付'), ('approve', '承認')], max_length=10, verbose_name='段階')),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, '督促'), (2, 'エスカレーション')], verbose_name='レベル')),
+                ('checked_until', models.DateTimeField(blank=True, null=True, verbose_name='確認済みの開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'SLA確認状況',
+                'verbose_name_plural': 'SLA確認状況',
+            },
+        ),
+        migrations.CreateModel(
+            name='SLAEscalation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(choices=[('receive', '受付'), ('approve', '承認')], max_length=10, verbose_name='段階')),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, '督促'), (2, 'エスカレーション')], verbose_name='レベル')),
+                ('stage_started_at', models.DateTimeField(verbose_name='段階の開始日時')),
+                ('notified_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='通知日時')),
+            ],
+            options={
+                'verbose_name': 'SLA超過の通知',
+                'verbose_name_plural': 'SLA超過の通知',
+                'ordering': ['-notified_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='applicationtypeconfig',
+            name='approve_escalation_hours',
+            field=models.PositiveIntegerField(blank=True, help_text='受付から承認までにこの時間を超えると管理者へエスカレーション', null=True, verbose_name='承認のエスカレーション（時間）'),
+        ),
+        migrations.AddField(
+            model_name='applicationtypeconfig',
+            name='approve_reminder_hours',
+            field=models.PositiveIntegerField(blank=True, help_text='受付から承認までにこの時間を超えると承認ロールへ督促', null=True, verbose_name='承認の督促（時間）'),
+        ),
+        migrations.AddField(
+            model_name='applicationtypeconfig',
+            name='receive_escalation_hours',
+            field=models.PositiveIntegerField(blank=True, help_text='申請から受付までにこの時間を超えると管理者へエスカレーション', null=True, verbose_name='受付のエスカレーション（時間）'),
+        ),
+        migrations.AddField(
+            model_name='applicationtypeconfig',
+            name='receive_reminder_hours',
+            field=models.PositiveIntegerField(blank=True, help_text='申請から受付までにこの時間を超えると受付ロールへ督促', null=True, verbose_name='受付の督促（時間）'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['status', 'submitted_at'], name='app_status_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['status', 'received_at'], name='app_status_received_idx'),
+        ),
+        migrations.AddField(
+            model_name='slaescalation',
+            name='application',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sla_escalations', to='workflow.application', verbose_name='申請'),
+        ),
+        migrations.AddConstraint(
+            model_name='slacheckpoint',
+            constraint=models.UniqueConstraint(fields=('application_type', 'stage', 'level'), name='unique_sla_checkpoint'),
+        ),
+        migrations.AddConstraint(
+            model_name='slaescalation',
+            constraint=models.UniqueConstraint(fields=('application', 'stage', 'level', 'stage_started_at'), name='unique_sla_escalation'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workflow', '0009_sla_escalation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applicationtypeconfig',
+            name='urgent_notifications',
+            field=models.BooleanField(default=False, help_text='まとめ通知を選んでいる担当者にも、この申請種別の通知はすぐに送る', verbose_name='即時通知'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='notification_frequency',
+            field=models.CharField(choices=[('immediate', 'すぐに通知'), ('hourly', '1時間ごとにまとめて通知'), ('daily', '1日1回まとめて通知')], default='immediate', max_length=10, verbose_name='メール通知'),
+        ),
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(choices=[('immediate', 'すぐに通知'), ('hourly', '1時間ごとにまとめて通知'), ('daily', '1日1回まとめて通知')], max_length=10, verbose_name='通知間隔')),
+                ('subject', models.CharField(max_length=255, verbose_name='件名')),
+                ('message', models.TextField(verbose_name='本文')),
+                ('dedup_key', models.CharField(blank=True, max_length=100, verbose_name='重複キー')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='登録日時')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to=settings.AUTH_USER_MODEL, verbose_name='宛先')),
+            ],
+            options={
+                'verbose_name': 'まとめ通知待ちのメール',
+                'verbose_name_plural': 'まとめ通知待ちのメール',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['frequency', 'created_at'], name='notification_due_idx'), models.Index(fields=['recipient', 'created_at'], name='notification_recipient_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pendingnotification',
+            constraint=models.UniqueConstraint(condition=models.Q(('dedup_key', ''), _negated=True), fields=('recipient', 'dedup_key'), name='unique_pending_notification'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workflow', '0010_notification_digests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, verbose_name='未読の通知'),
+        ),
+        migrations.CreateModel(
+            name='InboxNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='件名')),
+                ('message', models.TextField(blank=True, verbose_name='本文')),
+                ('url', models.CharField(blank=True, max_length=255, verbose_name='リンク先')),
+                ('is_read', models.BooleanField(default=False, verbose_name='既読')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='通知日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_notifications', to=settings.AUTH_USER_MODEL, verbose_name='宛先')),
+            ],
+            options={
+                'verbose_name': '受信箱の通知',
+                'verbose_name_plural': '受信箱の通知',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'is_read', '-created_at'], name='inbox_user_unread_idx'), models.Index(fields=['created_at'], name='inbox_created_idx')],
+            },
+        ),
+    ]
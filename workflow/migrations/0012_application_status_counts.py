@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:44
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_applications(apps, schema_editor):
+    # 既存の申請の件数（以降は workflow.models.adjust_status_counts で増減する）
+    Application = apps.get_model('workflow', 'Application')
+    ApplicationStatusCount = apps.get_model('workflow', 'ApplicationStatusCount')
+    counts = Application.objects.values_list('application_type', 'status').annotate(count=Count('id')).order_by()
+    ApplicationStatusCount.objects.bulk_create([
+        ApplicationStatusCount(application_type=application_type, status=status, count=count)
+        for application_type, status, count in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0011_inbox_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('application_type', models.CharField(choices=[('work', '作業申請'), ('construction', '工事申請'), ('tool_bringin', '工具持込申請'), ('restricted_entry', '制限エリア立入申請'), ('restricted_tool', '制限エリア工具持込申請')], max_length=30, verbose_name='申請種別')),
+                ('status', models.CharField(choices=[('draft', '下書き'), ('submitted', '申請中'), ('received', '受付済'), ('approved', '承認済'), ('rejected', '却下'), ('returned', '差し戻し')], max_length=20, verbose_name='ステータス')),
+                ('count', models.IntegerField(default=0, verbose_name='件数')),
+            ],
+            options={
+                'verbose_name': '申請件数',
+                'verbose_name_plural': '申請件数',
+                'ordering': ['application_type', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='applicationstatuscount',
+            constraint=models.UniqueConstraint(fields=('application_type', 'status'), name='unique_application_status_count'),
+        ),
+        migrations.RunPython(count_applications, migrations.RunPython.noop),
+    ]
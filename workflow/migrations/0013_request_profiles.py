@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('workflow', '0012_application_status_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='記録日時')),
+                ('method', models.CharField(max_length=10, verbose_name='メソッド')),
+                ('path', models.CharField(max_length=500, verbose_name='パス')),
+                ('view_name', models.CharField(blank=True, max_length=200, verbose_name='URL名')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='ステータスコード')),
+                ('duration_ms', models.FloatField(verbose_name='処理時間（ms）')),
+                ('trigger', models.CharField(choices=[('requested', '指定'), ('slow', '低速')], max_length=10, verbose_name='契機')),
+                ('mode', models.CharField(choices=[('sample', 'スタック採取'), ('cprofile', 'cProfile')], max_length=10, verbose_name='方式')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='採取回数')),
+                ('query_count', models.PositiveIntegerField(default=0, verbose_name='SQL数')),
+                ('query_ms', models.FloatField(default=0, verbose_name='SQLの時間（ms）')),
+                ('data', models.BinaryField(verbose_name='プロファイル（圧縮）')),
+                ('raw_size', models.PositiveIntegerField(default=0, verbose_name='圧縮前のサイズ')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'リクエストプロファイル',
+                'verbose_name_plural': 'リクエストプロファイル',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='request_profile_created_idx')],
+            },
+        ),
+    ]
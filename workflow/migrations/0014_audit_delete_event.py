@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0013_request_profiles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditevent',
+            name='event_type',
+            field=models.CharField(choices=[('create', '作成'), ('update', '更新'), ('transition', 'ステータス遷移'), ('delete', '削除'), ('role_assign', 'ロール割当'), ('role_update', 'ロール割当変更'), ('role_unassign', 'ロール割当解除')], max_length=20, verbose_name='イベント種別'),
+        ),
+    ]
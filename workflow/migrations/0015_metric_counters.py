@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflow', '0014_audit_delete_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32, unique=True, verbose_name='系列キー')),
+                ('name', models.CharField(max_length=100, verbose_name='メトリクス名')),
+                ('labels', models.JSONField(default=dict, verbose_name='ラベル')),
+                ('value', models.BigIntegerField(default=0, verbose_name='値')),
+            ],
+            options={
+                'verbose_name': 'メトリクスのカウンタ',
+                'verbose_name_plural': 'メトリクスのカウンタ',
+            },
+        ),
+    ]
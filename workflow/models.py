@@ -1,12 +1,28 @@
 """
 業務ワークフローシステムのモデル定義（製造業・建設業向け）
 """
-from django.db import models
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, models, transaction
 from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
 from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Length
+
+from .audit import (
+    AuditedQuerySet, deletion_fields, diff_fields, record_event, remember_fields, snapshot_fields
+)
+from .caching import routing_cache
+from .events import publish_status_change
+from .metrics import record_transition
+from .notifications import notify
+from .user_context import get_user_context
 
 
 class WorkflowRole(models.Model):
@@ -31,6 +47,11 @@ class WorkflowRole(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_role_type_display()})"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # 有効・無効の切り替えは受付・承認の振り分けに影響する
+        transaction.on_commit(routing_cache.invalidate_all)
+    
     def get_members_count(self):
         """メンバー数を取得"""
         return self.members.count()
@@ -49,6 +70,9 @@ class RoleMember(models.Model):
         verbose_name='割当者'
     )
     
+    # update() の変更も監査ログに記録する
+    objects = AuditedQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'ロールメンバー'
         verbose_name_plural = 'ロールメンバー'
@@ -58,18 +82,43 @@ class RoleMember(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role.name}"
     
+    # 監査ログで差分を記録するフィールド
+    AUDIT_FIELDS = ['role', 'user', 'assigned_by']
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 監査ログの差分計算用にロード時の値を保持
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
         super().save(*args, **kwargs)
-        # キャッシュをクリア
-        cache.delete(f'user_receivable_types_{self.user.id}')
-        cache.delete(f'user_approvable_types_{self.user.id}')
+        # キャッシュをクリア（全ワーカーのロール・申請種別設定のキャッシュ、コミット後）
+        transaction.on_commit(routing_cache.invalidate_all)
+        
+        # 監査ログ: ロール割当・割当変更
+        if is_new:
+            record_event('role_assign', self, snapshot_fields(self, self.AUDIT_FIELDS))
+        else:
+            changes = diff_fields(getattr(self, '_loaded_values', {}), self, self.AUDIT_FIELDS)
+            if changes:
+                self.record_change_event(changes)
+        remember_fields(self, self.AUDIT_FIELDS)
     
     def delete(self, *args, **kwargs):
-        user_id = self.user.id
-        super().delete(*args, **kwargs)
-        # キャッシュをクリア
-        cache.delete(f'user_receivable_types_{user_id}')
-        cache.delete(f'user_approvable_types_{user_id}')
+        # 監査ログのロール割当解除は post_delete で記録する（record_delete_event）
+        result = super().delete(*args, **kwargs)
+        # キャッシュをクリア（全ワーカーのロール・申請種別設定のキャッシュ、コミット後）
+        transaction.on_commit(routing_cache.invalidate_all)
+        return result
+    
+    def record_change_event(self, changes, using=DEFAULT_DB_ALIAS):
+        record_event('role_update', self, changes, using=using)
+    
+    def record_delete_event(self, using):
+        record_event('role_unassign', self, deletion_fields(self, self.AUDIT_FIELDS), using=using)
 
 
 class ApplicationTypeConfig(models.Model):
@@ -89,6 +138,22 @@ class ApplicationTypeConfig(models.Model):
         verbose_name='承認ロール',
         limit_choices_to={'role_type': 'approver', 'is_active': True}
     )
+    # SLA（空欄の場合は督促・エスカレーションしない）
+    receive_reminder_hours = models.PositiveIntegerField(
+        '受付の督促（時間）', null=True, blank=True, help_text='申請から受付までにこの時間を超えると受付ロールへ督促'
+    )
+    receive_escalation_hours = models.PositiveIntegerField(
+        '受付のエスカレーション（時間）', null=True, blank=True, help_text='申請から受付までにこの時間を超えると管理者へエスカレーション'
+    )
+    approve_reminder_hours = models.PositiveIntegerField(
+        '承認の督促（時間）', null=True, blank=True, help_text='受付から承認までにこの時間を超えると承認ロールへ督促'
+    )
+    approve_escalation_hours = models.PositiveIntegerField(
+        '承認のエスカレーション（時間）', null=True, blank=True, help_text='受付から承認までにこの時間を超えると管理者へエスカレーション'
+    )
+    urgent_notifications = models.BooleanField(
+        '即時通知', default=False, help_text='まとめ通知を選んでいる担当者にも、この申請種別の通知はすぐに送る'
+    )
     is_active = models.BooleanField('有効', default=True)
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
     updated_at = models.DateTimeField('更新日時', auto_now=True)
@@ -103,8 +168,88 @@ class ApplicationTypeConfig(models.Model):
     
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        # 関連するキャッシュをクリア
-        cache.delete(f'application_type_config_{self.application_type}')
+        # 関連するキャッシュをクリア（担当ロールの変更はユーザーごとの申請種別にも影響する）
+        transaction.on_commit(routing_cache.invalidate_all)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(routing_cache.invalidate_all)
+        return result
+
+
+# ロール・申請種別設定のキャッシュ期間（秒）
+ROUTING_CACHE_TIMEOUT = 3600
+
+
+def get_application_type_config(application_type):
+    """有効な申請種別設定を返す（受付・承認ロールを含む、キャッシュ付き）。設定がない場合は None"""
+    def compute():
+        return ApplicationTypeConfig.objects.select_related('receiver_role', 'approver_role').filter(
+            application_type=application_type,
+            is_active=True
+        ).first()
+    
+    return routing_cache.get_or_compute(
+        f'application_type_config_{application_type}', compute, ROUTING_CACHE_TIMEOUT,
+        name='application_type_config'
+    )
+
+
+def is_urgent_application_type(application_type):
+    """まとめ通知にせず、すぐに通知する申請種別か"""
+    type_config = get_application_type_config(application_type)
+    return type_config is not None and type_config.urgent_notifications
+
+
+def get_role_recipients(application_type, role_field, fallback_role):
+    """申請種別の担当ロール（受付・承認）のメンバーを、通知設定（プロファイル）とともに返す"""
+    type_config = get_application_type_config(application_type)
+    
+    if type_config is None:
+        # 設定がない場合はフォールバック（既存ロジック）
+        return list(User.objects.filter(profile__role=fallback_role, is_active=True).select_related('profile'))
+    
+    members = getattr(type_config, role_field).members.filter(
+        user__is_active=True
+    ).select_related('user__profile')
+    
+    return [member.user for member in members]
+
+
+def _get_user_role_types(user, role_type):
+    """ユーザーが所属するロール（受付・承認）が担当する申請種別のリスト"""
+    # ユーザーが所属するロール（ユーザーコンテキストで読み込み済み）
+    role_ids = get_user_context(user).role_ids(role_type)
+    
+    # それらのロールが担当する申請種別を取得
+    role_filter = 'receiver_role__in' if role_type == 'receiver' else 'approver_role__in'
+    configs = ApplicationTypeConfig.objects.filter(
+        **{role_filter: role_ids},
+        is_active=True
+    )
+    types = [config.application_type for config in configs]
+    
+    # フォールバック: 設定がない場合は全種別
+    if not types:
+        types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
+    
+    return types
+
+
+def get_user_receivable_types(user):
+    """ユーザーが受付可能な申請種別のリストを取得（キャッシュ付き）"""
+    return routing_cache.get_or_compute(
+        f'user_receivable_types_{user.id}', lambda: _get_user_role_types(user, 'receiver'),
+        ROUTING_CACHE_TIMEOUT, name='user_receivable_types'
+    )
+
+
+def get_user_approvable_types(user):
+    """ユーザーが承認可能な申請種別のリストを取得（キャッシュ付き）"""
+    return routing_cache.get_or_compute(
+        f'user_approvable_types_{user.id}', lambda: _get_user_role_types(user, 'approver'),
+        ROUTING_CACHE_TIMEOUT, name='user_approvable_types'
+    )
 
 
 class UserProfile(models.Model):
@@ -115,12 +260,22 @@ class UserProfile(models.Model):
         ('approver', '承認者'),
         ('admin', '管理者'),
     ]
+    NOTIFICATION_FREQUENCY_CHOICES = [
+        ('immediate', 'すぐに通知'),
+        ('hourly', '1時間ごとにまとめて通知'),
+        ('daily', '1日1回まとめて通知'),
+    ]
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     role = models.CharField('役割', max_length=20, choices=ROLE_CHOICES, default='vendor')
     company_name = models.CharField('企業名', max_length=200)
     department = models.CharField('部署', max_length=100, blank=True)
     phone_number = models.CharField('電話番号', max_length=20, blank=True)
+    notification_frequency = models.CharField(
+        'メール通知', max_length=10, choices=NOTIFICATION_FREQUENCY_CHOICES, default='immediate'
+    )
+    # 受信箱の未読件数（InboxNotification の未読数を非正規化、workflow.notifications が更新）
+    unread_notifications = models.PositiveIntegerField('未読の通知', default=0)
     
     class Meta:
         verbose_name = 'ユーザープロファイル'
@@ -128,6 +283,56 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.company_name} ({self.get_role_display()})"
+    
+    # セッションに保存したユーザーコンテキスト（workflow.user_context）に含まれるフィールド
+    CONTEXT_FIELDS = {'user', 'role', 'company_name'}
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.CONTEXT_FIELDS & set(update_fields):
+            transaction.on_commit(routing_cache.invalidate_all)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(routing_cache.invalidate_all)
+        return result
+
+
+# 行頭の箇条書き記号
+LINE_BULLETS = '・-*●○■□'
+
+# 「山田太郎 (ABC株式会社)」形式の立入者
+ENTRY_MEMBER_PATTERN = re.compile(r'^(?P<name>.+?)\s*[(（](?P<company>[^()（）]*)[)）]$')
+
+# 「山田太郎、ABC株式会社」形式の立入者
+ENTRY_MEMBER_SEPARATORS = re.compile(r'[、,，]')
+
+
+def normalize_name(value):
+    """検索用に名称を正規化する（全角・半角、大文字・小文字、空白の違いを吸収）"""
+    return ''.join(unicodedata.normalize('NFKC', value).casefold().split())
+
+
+def split_lines(text):
+    """改行区切りのテキストを空行・箇条書き記号を除いた行のリストにする"""
+    lines = []
+    for line in (text or '').splitlines():
+        line = line.strip().lstrip(LINE_BULLETS).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def parse_entry_member(line):
+    """立入者の1行を (氏名, 所属) に分割する"""
+    match = ENTRY_MEMBER_PATTERN.match(line)
+    if match:
+        return match.group('name').strip(), match.group('company').strip()
+    parts = ENTRY_MEMBER_SEPARATORS.split(line, maxsplit=1)
+    if len(parts) == 2:
+        return parts[0].strip(), parts[1].strip()
+    return line, ''
 
 
 class Application(models.Model):
@@ -186,6 +391,9 @@ class Application(models.Model):
     received_at = models.DateTimeField('受付日時', null=True, blank=True)
     approved_at = models.DateTimeField('承認日時', null=True, blank=True)
     
+    # update() の変更も監査ログに記録する
+    objects = AuditedQuerySet.as_manager()
+    
     class Meta:
         verbose_name = '申請'
         verbose_name_plural = '申請'
@@ -194,32 +402,212 @@ class Application(models.Model):
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['application_number']),
             models.Index(fields=['applicant', '-created_at']),
+            # 作業場所の占有状況・重複検出（PostgreSQLでは daterange の GiST 索引を使用）
+            models.Index(fields=['work_location', 'work_end_date'], name='app_location_end_idx'),
+            models.Index(fields=['work_location', 'work_start_date'], name='app_location_start_idx'),
+            # SLA超過の検出（workflow.escalation）: 受付待ち・承認待ちを待ち始めた日時の範囲で検索
+            models.Index(fields=['status', 'submitted_at'], name='app_status_submitted_idx'),
+            models.Index(fields=['status', 'received_at'], name='app_status_received_idx'),
         ]
     
+    # 監査ログで差分を記録するフィールド
+    AUDIT_FIELDS = [
+        'application_number', 'application_type', 'title', 'content',
+        'applicant', 'company_name',
+        'work_location', 'work_start_date', 'work_end_date', 'worker_count',
+        'tool_list', 'restricted_area', 'entry_purpose', 'entry_members',
+        'contractor_name', 'status',
+        'submitted_at', 'received_at', 'approved_at',
+    ]
+    
+    # 子テーブル（持込工具・立入者）の作り直しが必要なフィールド
+    LINE_ITEM_SOURCE_FIELDS = ['tool_list', 'entry_members']
+    
+    # 子テーブルに複製しているフィールド
+    LINE_ITEM_COPIED_FIELDS = ['application_type', 'status', 'work_start_date', 'work_end_date']
+    
+    # QuerySet.update() で更新しない場合も更新前後の値を読むフィールド（queryset_updated で使う）
+    UPDATE_CONTEXT_FIELDS = LINE_ITEM_COPIED_FIELDS
+    
     def __str__(self):
         return f"{self.application_number} - {self.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 監査ログの差分計算用にロード時の値を保持
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    @classmethod
+    def allocate_application_numbers(cls, count=1):
+        """
+        本日の申請番号を連番でまとめて採番する（例: APP20241227001）
+        
+        一括取込では件数分のブロックを1回のクエリで確保する。
+        1日1000件を超えても桁数で正しく最大値を判定する。
+        """
+        prefix = f"APP{timezone.now().strftime('%Y%m%d')}"
+        last_number = cls.objects.filter(
+            application_number__startswith=prefix
+        ).annotate(
+            number_length=Length('application_number')
+        ).order_by('-number_length', '-application_number').values_list('application_number', flat=True).first()
+        
+        start = int(last_number[len(prefix):]) + 1 if last_number else 1
+        return [f'{prefix}{num:03d}' for num in range(start, start + count)]
+    
+    @classmethod
+    def get_receivers(cls, application_type):
+        """申請種別に設定された受付ロールのメンバー（通知先のユーザー）を返す"""
+        return get_role_recipients(application_type, 'receiver_role', 'receiver')
+    
+    @classmethod
+    def get_approvers(cls, application_type):
+        """申請種別に設定された承認ロールのメンバー（通知先のユーザー）を返す"""
+        return get_role_recipients(application_type, 'approver_role', 'approver')
+    
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        loaded_values = dict(getattr(self, '_loaded_values', {}))
+        old_status = None if is_new else loaded_values.get('status', self.status)
+        old_type = None if is_new else loaded_values.get('application_type', self.application_type)
+        
         if not self.application_number:
             # 申請番号の自動生成（例: APP20241227001）
-            today = timezone.now().strftime('%Y%m%d')
-            last_app = Application.objects.filter(
-                application_number__startswith=f'APP{today}'
-            ).order_by('-application_number').first()
-            
-            if last_app:
-                last_num = int(last_app.application_number[-3:])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            
-            self.application_number = f'APP{today}{new_num:03d}'
+            self.application_number = Application.allocate_application_numbers()[0]
         
         # 申請者の企業名を自動設定
         if not self.company_name and hasattr(self.applicant, 'profile'):
             self.company_name = self.applicant.profile.company_name
         
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # 申請種別 × ステータスの件数（/metrics のキューの深さ）
+            if (old_type, old_status) != (self.application_type, self.status):
+                adjust_status_counts({(old_type, old_status): -1, (self.application_type, self.status): 1})
+        self._record_audit_event(is_new)
+        self._sync_line_items(is_new, loaded_values)
+        
+        # 受付・承認キューの増減をリアルタイム通知
+        if old_status != self.status:
+            publish_status_change(self, old_status, self.status)
+            record_transition(self.application_type, old_status, self.status)
+    
+    def _record_audit_event(self, is_new):
+        """監査ログ: 作成時はスナップショット、更新時はフィールド差分を記録"""
+        if is_new:
+            record_event('create', self, snapshot_fields(self, self.AUDIT_FIELDS), application=self)
+        else:
+            changes = diff_fields(getattr(self, '_loaded_values', {}), self, self.AUDIT_FIELDS)
+            if changes:
+                self.record_change_event(changes)
+        
+        # 次回保存時の比較基準を更新
+        remember_fields(self, self.AUDIT_FIELDS)
+    
+    def record_change_event(self, changes, using=DEFAULT_DB_ALIAS):
+        event_type = 'transition' if 'status' in changes else 'update'
+        record_event(event_type, self, changes, application=self, using=using)
+    
+    def record_delete_event(self, using):
+        record_event('delete', self, deletion_fields(self, self.AUDIT_FIELDS), application=self, using=using)
+    
+    def _sync_line_items(self, is_new, loaded_values):
+        """持込工具・立入者の子テーブルを申請の内容に合わせる"""
+        def changed(name):
+            # 遅延ロード（defer / only）したまま代入していないフィールドは変更されていない（読み込まない）
+            if name not in self.__dict__:
+                return False
+            return name not in loaded_values or loaded_values[name] != self.__dict__[name]
+        
+        if is_new or any(changed(name) for name in self.LINE_ITEM_SOURCE_FIELDS):
+            Application.rebuild_line_items([self], delete_existing=not is_new)
+        elif any(changed(name) for name in self.LINE_ITEM_COPIED_FIELDS):
+            values = self.get_line_item_values()
+            ApplicationTool.objects.filter(application=self).update(**values)
+            ApplicationEntryMember.objects.filter(application=self).update(**values)
+    
+    @classmethod
+    def queryset_updated(cls, rows, using=DEFAULT_DB_ALIAS):
+        """
+        QuerySet.update() で変更された申請の後処理（AuditedQuerySet から呼ばれる）
+        
+        save() と同じく、申請種別 × ステータスの件数を増減し、
+        持込工具・立入者の子テーブルを作り直すか、複製した項目を更新する。
+        
+        Args:
+            rows: [(pk, {フィールド名: 更新前の値}, {フィールド名: 更新後の値}), ...]
+        """
+        deltas = defaultdict(int)
+        rebuild_ids, copied = [], defaultdict(list)
+        for pk, old, new in rows:
+            old_key = (old['application_type'], old['status'])
+            new_key = (new['application_type'], new['status'])
+            if old_key != new_key:
+                deltas[old_key] -= 1
+                deltas[new_key] += 1
+            if any(old.get(name) != new.get(name) for name in cls.LINE_ITEM_SOURCE_FIELDS):
+                rebuild_ids.append(pk)
+            elif any(old[name] != new[name] for name in cls.LINE_ITEM_COPIED_FIELDS):
+                values = cls(**{name: new[name] for name in cls.LINE_ITEM_COPIED_FIELDS}).get_line_item_values()
+                copied[tuple(values.items())].append(pk)
+        
+        adjust_status_counts(deltas)
+        
+        if rebuild_ids:
+            cls.rebuild_line_items(list(
+                cls._base_manager.using(using).filter(pk__in=rebuild_ids).only(
+                    'id', *cls.LINE_ITEM_SOURCE_FIELDS, *cls.LINE_ITEM_COPIED_FIELDS
+                )
+            ))
+        # 複製する値が同じ申請はまとめて更新する
+        for values, application_ids in copied.items():
+            ApplicationTool.objects.using(using).filter(application_id__in=application_ids).update(**dict(values))
+            ApplicationEntryMember.objects.using(using).filter(application_id__in=application_ids).update(**dict(values))
+    
+    def get_line_item_values(self):
+        """子テーブルに複製する申請の項目"""
+        return {
+            'application_type': self.application_type,
+            'status': self.status,
+            'start_date': self.work_start_date,
+            # 終了日がない場合は開始日の1日のみとみなす
+            'end_date': self.work_end_date or self.work_start_date,
+        }
+    
+    @classmethod
+    def rebuild_line_items(cls, applications, delete_existing=True):
+        """
+        持込工具リスト・立入者リストを解析して子テーブルを作り直す
+        
+        一括取込・バックフィルでは複数の申請をまとめて処理する。
+        """
+        tools, members = [], []
+        for application in applications:
+            values = application.get_line_item_values()
+            for line_number, line in enumerate(split_lines(application.tool_list), start=1):
+                name = line[:200]
+                tools.append(ApplicationTool(
+                    application=application, line_number=line_number,
+                    name=name, normalized_name=normalize_name(name), **values
+                ))
+            for line_number, line in enumerate(split_lines(application.entry_members), start=1):
+                name, company_name = parse_entry_member(line)
+                name = name[:200]
+                members.append(ApplicationEntryMember(
+                    application=application, line_number=line_number,
+                    name=name, normalized_name=normalize_name(name),
+                    company_name=company_name[:200], **values
+                ))
+        
+        if delete_existing:
+            application_ids = [application.pk for application in applications]
+            ApplicationTool.objects.filter(application_id__in=application_ids).delete()
+            ApplicationEntryMember.objects.filter(application_id__in=application_ids).delete()
+        ApplicationTool.objects.bulk_create(tools)
+        ApplicationEntryMember.objects.bulk_create(members)
+        return len(tools), len(members)
     
     def submit(self):
         """申請を提出"""
@@ -282,31 +670,9 @@ class Application(models.Model):
     
     def send_notification_to_receivers(self):
         """申請種別に設定された受付ロールのメンバーへメール通知"""
-        try:
-            # 申請種別設定を取得（キャッシュ使用）
-            cache_key = f'application_type_config_{self.application_type}'
-            type_config = cache.get(cache_key)
-            
-            if not type_config:
-                type_config = ApplicationTypeConfig.objects.select_related('receiver_role').get(
-                    application_type=self.application_type,
-                    is_active=True
-                )
-                cache.set(cache_key, type_config, 3600)
-            
-            # 受付ロールのメンバーを取得
-            receivers = type_config.receiver_role.members.filter(
-                user__is_active=True
-            ).select_related('user')
-            
-            recipient_list = [member.user.email for member in receivers if member.user.email]
-            
-        except ApplicationTypeConfig.DoesNotExist:
-            # 設定がない場合はフォールバック（既存ロジック）
-            receivers = User.objects.filter(profile__role='receiver', is_active=True)
-            recipient_list = [user.email for user in receivers if user.email]
+        receivers = self.get_receivers(self.application_type)
         
-        if not recipient_list:
+        if not receivers:
             return
         
         subject = f'【新規申請】{self.application_number} - {self.get_application_type_display()}'
@@ -323,35 +689,16 @@ class Application(models.Model):
 詳細は以下のURLからご確認ください。
 {settings.SITE_URL}/workflow/{self.pk}/
 '''
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=True)
+        notify(
+            receivers, subject, message, url=reverse('workflow:detail', args=[self.pk]),
+            urgent=is_urgent_application_type(self.application_type), dedup_key=f'submitted:{self.pk}'
+        )
     
     def send_notification_to_approvers(self):
         """申請種別に設定された承認ロールのメンバーへメール通知"""
-        try:
-            # 申請種別設定を取得（キャッシュ使用）
-            cache_key = f'application_type_config_{self.application_type}'
-            type_config = cache.get(cache_key)
-            
-            if not type_config:
-                type_config = ApplicationTypeConfig.objects.select_related('approver_role').get(
-                    application_type=self.application_type,
-                    is_active=True
-                )
-                cache.set(cache_key, type_config, 3600)
-            
-            # 承認ロールのメンバーを取得
-            approvers = type_config.approver_role.members.filter(
-                user__is_active=True
-            ).select_related('user')
-            
-            recipient_list = [member.user.email for member in approvers if member.user.email]
-            
-        except ApplicationTypeConfig.DoesNotExist:
-            # 設定がない場合はフォールバック（既存ロジック）
-            approvers = User.objects.filter(profile__role='approver', is_active=True)
-            recipient_list = [user.email for user in approvers if user.email]
+        approvers = self.get_approvers(self.application_type)
         
-        if not recipient_list:
+        if not approvers:
             return
         
         subject = f'【承認依頼】{self.application_number} - {self.get_application_type_display()}'
@@ -367,13 +714,15 @@ class Application(models.Model):
 詳細は以下のURLからご確認ください。
 {settings.SITE_URL}/workflow/{self.pk}/
 '''
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=True)
+        notify(
+            approvers, subject, message, url=reverse('workflow:detail', args=[self.pk]),
+            urgent=is_urgent_application_type(self.application_type), dedup_key=f'received:{self.pk}'
+        )
     
     def send_notification_to_applicant(self, subject_prefix, body_message):
         """申請者へメール通知"""
-        if self.applicant.email:
-            subject = f'【{subject_prefix}】{self.application_number} - {self.get_application_type_display()}'
-            message = f'''
+        subject = f'【{subject_prefix}】{self.application_number} - {self.get_application_type_display()}'
+        message = f'''
 {body_message}
 
 申請番号: {self.application_number}
@@ -383,7 +732,10 @@ class Application(models.Model):
 詳細は以下のURLからご確認ください。
 {settings.SITE_URL}/workflow/{self.pk}/
 '''
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [self.applicant.email], fail_silently=True)
+        notify(
+            [self.applicant], subject, message, url=reverse('workflow:detail', args=[self.pk]),
+            urgent=is_urgent_application_type(self.application_type), dedup_key=f'{subject_prefix}:{self.pk}'
+        )
     
     def can_edit(self, user):
         """編集可能か判定"""
@@ -395,11 +747,12 @@ class Application(models.Model):
     
     def can_receive(self, user):
         """受付可能か判定（ロールベース権限チェック）"""
-        if not hasattr(user, 'profile'):
+        context = get_user_context(user)
+        if not context.has_profile:
             return False
         
         # 管理者は常に可能
-        if user.profile.role == 'admin':
+        if context.is_admin:
             return True
         
         # ステータスチェック
@@ -407,30 +760,21 @@ class Application(models.Model):
             return False
         
         # 申請種別の受付ロールに所属しているかチェック
-        try:
-            cache_key = f'application_type_config_{self.application_type}'
-            type_config = cache.get(cache_key)
-            
-            if not type_config:
-                type_config = ApplicationTypeConfig.objects.select_related('receiver_role').get(
-                    application_type=self.application_type,
-                    is_active=True
-                )
-                cache.set(cache_key, type_config, 3600)
-            
-            return type_config.receiver_role.members.filter(user=user).exists()
-            
-        except ApplicationTypeConfig.DoesNotExist:
+        type_config = get_application_type_config(self.application_type)
+        if type_config is None:
             # 設定がない場合はフォールバック（既存ロール判定）
-            return user.profile.role == 'receiver'
+            return context.role == 'receiver'
+        
+        return context.in_role(type_config.receiver_role_id)
     
     def can_approve(self, user):
         """承認可能か判定（ロールベース権限チェック）"""
-        if not hasattr(user, 'profile'):
+        context = get_user_context(user)
+        if not context.has_profile:
             return False
         
         # 管理者は常に可能
-        if user.profile.role == 'admin':
+        if context.is_admin:
             return True
         
         # ステータスチェック
@@ -438,30 +782,71 @@ class Application(models.Model):
             return False
         
         # 申請種別の承認ロールに所属しているかチェック
-        try:
-            cache_key = f'application_type_config_{self.application_type}'
-            type_config = cache.get(cache_key)
-            
-            if not type_config:
-                type_config = ApplicationTypeConfig.objects.select_related('approver_role').get(
-                    application_type=self.application_type,
-                    is_active=True
-                )
-                cache.set(cache_key, type_config, 3600)
-            
-            return type_config.approver_role.members.filter(user=user).exists()
-            
-        except ApplicationTypeConfig.DoesNotExist:
+        type_config = get_application_type_config(self.application_type)
+        if type_config is None:
             # 設定がない場合はフォールバック（既存ロール判定）
-            return user.profile.role == 'approver'
+            return context.role == 'approver'
+        
+        return context.in_role(type_config.approver_role_id)
     
     def can_return(self, user):
         """差し戻し可能か判定"""
-        return (hasattr(user, 'profile') and 
-                user.profile.role in ['receiver', 'admin'] and 
+        return (get_user_context(user).has_role('receiver', 'admin') and 
                 self.status == 'submitted')
 
 
+# 申請詳細画面のフラグメントキャッシュ: セクション → (関連名, 更新日時の項目)
+DETAIL_SECTIONS = {
+    'attachments': ('attachments', 'uploaded_at'),
+    'comments': ('comments', 'created_at'),
+    'workflow_steps': ('workflow_steps', 'created_at'),
+}
+
+# セクションのバージョンのキャッシュ期間（秒）
+SECTION_VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def _section_version_key(application_id, section):
+    return f'application_section_version_{application_id}_{section}'
+
+
+def get_section_versions(application_id):
+    """
+    申請詳細の各セクション（添付・コメント・履歴）のバージョンを返す
+    
+    バージョンは「件数-最終更新日時」。キャッシュにない場合のみ1回のクエリでまとめて算出する。
+    """
+    keys = {section: _section_version_key(application_id, section) for section in DETAIL_SECTIONS}
+    cached = cache.get_many(keys.values())
+    versions = {section: cached[key] for section, key in keys.items() if key in cached}
+    
+    missing = [section for section in DETAIL_SECTIONS if section not in versions]
+    if missing:
+        annotations = {}
+        for section in missing:
+            related_name, time_field = DETAIL_SECTIONS[section]
+            related_model = Application._meta.get_field(related_name).related_model
+            summary = related_model.objects.filter(application=OuterRef('pk')).order_by().values('application')
+            annotations[f'{section}_count'] = Coalesce(Subquery(summary.annotate(value=Count('id')).values('value')), 0)
+            annotations[f'{section}_latest'] = Subquery(summary.annotate(value=Max(time_field)).values('value'))
+        
+        row = Application.objects.filter(pk=application_id).annotate(**annotations).values(*annotations).first() or {}
+        computed = {}
+        for section in missing:
+            latest = row.get(f'{section}_latest')
+            computed[section] = f"{row.get(f'{section}_count', 0)}-{latest.timestamp() if latest else 0}"
+        cache.set_many({keys[section]: version for section, version in computed.items()}, SECTION_VERSION_TIMEOUT)
+        versions.update(computed)
+    
+    return versions
+
+
+def invalidate_section(application_id, section):
+    """セクションの内容が変わったときにバージョンを破棄する（コミット後）"""
+    key = _section_version_key(application_id, section)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
 class WorkflowStep(models.Model):
     """ワークフローステップ（履歴記録）"""
     STEP_TYPE_CHOICES = [
@@ -491,9 +876,22 @@ class WorkflowStep(models.Model):
         verbose_name = 'ワークフローステップ'
         verbose_name_plural = 'ワークフローステップ'
         ordering = ['created_at']
+        indexes = [
+            # レポートの差分集計（処理日時の範囲）と申請ごとの処理順
+            models.Index(fields=['processed_at'], name='workflowstep_processed_idx'),
+            models.Index(fields=['application', 'processed_at'], name='workflowstep_app_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.application.application_number} - {self.get_step_type_display()}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_section(self.application_id, 'workflow_steps')
+    
+    def delete(self, *args, **kwargs):
+        invalidate_section(self.application_id, 'workflow_steps')
+        return super().delete(*args, **kwargs)
 
 
 class Comment(models.Model):
@@ -510,6 +908,14 @@ class Comment(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.created_at.strftime('%Y/%m/%d %H:%M')}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_section(self.application_id, 'comments')
+    
+    def delete(self, *args, **kwargs):
+        invalidate_section(self.application_id, 'comments')
+        return super().delete(*args, **kwargs)
 
 
 class Attachment(models.Model):
@@ -535,6 +941,11 @@ class Attachment(models.Model):
         if self.file:
             self.file_size = self.file.size
         super().save(*args, **kwargs)
+        invalidate_section(self.application_id, 'attachments')
+    
+    def delete(self, *args, **kwargs):
+        invalidate_section(self.application_id, 'attachments')
+        return super().delete(*args, **kwargs)
     
     def get_file_size_display(self):
         """ファイルサイズを人間が読みやすい形式で返す"""
@@ -549,3 +960,486 @@ class Attachment(models.Model):
     def file_name(self):
         """ファイル名を返す（filenameがない場合はfileから取得）"""
         return self.filename if self.filename else (self.file.name.split('/')[-1] if self.file else '')
+
+
+class ApplicationLineItem(models.Model):
+    """
+    申請の明細行（持込工具・立入者）の共通項目
+    
+    名称・期間で索引検索できるよう、申請種別・ステータス・期間を申請から複製して保持する。
+    """
+    line_number = models.PositiveSmallIntegerField('行番号')
+    name = models.CharField('名称', max_length=200)
+    normalized_name = models.CharField('検索用名称', max_length=200)
+    application_type = models.CharField('申請種別', max_length=30, choices=Application.APPLICATION_TYPE_CHOICES)
+    status = models.CharField('ステータス', max_length=20, choices=Application.STATUS_CHOICES)
+    start_date = models.DateField('開始日', null=True, blank=True)
+    end_date = models.DateField('終了日', null=True, blank=True)
+    
+    class Meta:
+        abstract = True
+        ordering = ['application', 'line_number']
+    
+    def __str__(self):
+        return f"{self.application.application_number} - {self.name}"
+
+
+class ApplicationTool(ApplicationLineItem):
+    """持込工具（申請の持込工具リストを1行1件に分解したもの）"""
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='tool_items', verbose_name='申請')
+    
+    class Meta(ApplicationLineItem.Meta):
+        verbose_name = '持込工具'
+        verbose_name_plural = '持込工具'
+        indexes = [
+            models.Index(fields=['normalized_name', 'status', 'start_date'], name='apptool_name_status_date_idx'),
+            models.Index(fields=['start_date', 'end_date'], name='apptool_period_idx'),
+        ]
+
+
+class ApplicationEntryMember(ApplicationLineItem):
+    """立入者（申請の立入者リストを1行1件に分解したもの）"""
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='entry_member_items', verbose_name='申請')
+    company_name = models.CharField('所属', max_length=200, blank=True)
+    
+    class Meta(ApplicationLineItem.Meta):
+        verbose_name = '立入者'
+        verbose_name_plural = '立入者'
+        indexes = [
+            models.Index(fields=['normalized_name', 'status', 'start_date'], name='appmember_name_status_date_idx'),
+            models.Index(fields=['start_date', 'end_date'], name='appmember_period_idx'),
+        ]
+
+
+class AuditEvent(models.Model):
+    """監査イベント（追記専用のフィールド差分・遷移ログ）"""
+    EVENT_TYPE_CHOICES = [
+        ('create', '作成'),
+        ('update', '更新'),
+        ('transition', 'ステータス遷移'),
+        ('delete', '削除'),
+        ('role_assign', 'ロール割当'),
+        ('role_update', 'ロール割当変更'),
+        ('role_unassign', 'ロール割当解除'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('web', '画面'),
+        ('admin', '管理画面'),
+        ('system', 'システム'),
+    ]
+    
+    event_type = models.CharField('イベント種別', max_length=20, choices=EVENT_TYPE_CHOICES)
+    source = models.CharField('操作元', max_length=10, choices=SOURCE_CHOICES, default='system')
+    target_model = models.CharField('対象モデル', max_length=50)
+    target_id = models.BigIntegerField('対象ID', null=True)
+    application = models.ForeignKey(
+        Application,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='audit_events',
+        verbose_name='申請'
+    )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='audit_events',
+        verbose_name='操作者'
+    )
+    # {フィールド名: [旧値, 新値]}（PostgreSQLではJSONBとして格納）
+    changes = models.JSONField('変更内容', encoder=DjangoJSONEncoder, default=dict)
+    occurred_at = models.DateTimeField('発生日時', default=timezone.now)
+    # 月単位のパーティションキー（YYYYMM）
+    month = models.PositiveIntegerField('年月')
+    
+    class Meta:
+        verbose_name = '監査イベント'
+        verbose_name_plural = '監査イベント'
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            models.Index(fields=['application', 'occurred_at'], name='auditevent_app_time_idx'),
+            models.Index(fields=['actor', 'occurred_at'], name='auditevent_actor_time_idx'),
+            models.Index(fields=['target_model', 'target_id', 'occurred_at'], name='auditevent_target_time_idx'),
+            models.Index(fields=['month', 'event_type'], name='auditevent_month_type_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_event_type_display()} - {self.target_model}#{self.target_id} ({self.occurred_at:%Y/%m/%d %H:%M})"
+    
+    def save(self, *args, **kwargs):
+        # 追記専用: 既存イベントの更新は不可
+        if not self._state.adding:
+            raise ValueError('監査イベントは変更できません。')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('監査イベントは削除できません。')
+
+
+class ReportRollup(models.Model):
+    """レポート用の日次集計（共通項目）"""
+    date = models.DateField('集計日')
+    application_type = models.CharField('申請種別', max_length=20, choices=Application.APPLICATION_TYPE_CHOICES)
+    role_name = models.CharField('担当ロール', max_length=100, blank=True)
+    company_name = models.CharField('申請企業名', max_length=200)
+    count = models.PositiveIntegerField('件数', default=0)
+    total_seconds = models.FloatField('合計時間（秒）', default=0)
+    max_seconds = models.FloatField('最大時間（秒）', default=0)
+    # reporting.DURATION_BUCKETS の区間ごとの件数
+    histogram = models.JSONField('時間の分布', default=list)
+    
+    class Meta:
+        abstract = True
+    
+    @property
+    def average_seconds(self):
+        return self.total_seconds / self.count if self.count else 0
+
+
+class LeadTimeRollup(ReportRollup):
+    """リードタイム（申請→受付→承認）の日次集計。集計日は各段階の完了日"""
+    STAGE_CHOICES = [
+        ('receive', '申請→受付'),
+        ('approve', '受付→承認'),
+        ('total', '申請→承認'),
+    ]
+    
+    stage = models.CharField('段階', max_length=10, choices=STAGE_CHOICES)
+    
+    class Meta:
+        verbose_name = 'リードタイム日次集計'
+        verbose_name_plural = 'リードタイム日次集計'
+        ordering = ['date', 'stage', 'application_type']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'stage', 'application_type', 'role_name', 'company_name'],
+                name='leadtime_rollup_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.get_stage_display()} {self.get_application_type_display()} {self.company_name}"
+
+
+class BacklogSnapshot(ReportRollup):
+    """滞留（受付待ち・承認待ち）の日次スナップショット。時間は集計時点の滞留時間"""
+    QUEUE_CHOICES = [
+        ('receive', '受付待ち'),
+        ('approve', '承認待ち'),
+    ]
+    
+    queue = models.CharField('キュー', max_length=10, choices=QUEUE_CHOICES)
+    
+    class Meta:
+        verbose_name = '滞留日次スナップショット'
+        verbose_name_plural = '滞留日次スナップショット'
+        ordering = ['date', 'queue', 'application_type']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'queue', 'application_type', 'role_name', 'company_name'],
+                name='backlog_snapshot_unique'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.get_queue_display()} {self.get_application_type_display()} {self.company_name}"
+
+
+class BackgroundTask(models.Model):
+    """
+    バックグラウンドタスク（workflow.tasks のタスクキュー）
+    
+    待機中（queued）のタスクのうち実行予定日時を過ぎたものを、優先度の高い順にワーカーが取得する。
+    取得時に実行予定日時を「可視性タイムアウト」後へ進めるため、ワーカーが停止したタスクは自動的に再実行される。
+    """
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    name = models.CharField('タスク名', max_length=200)
+    args = models.JSONField('位置引数', encoder=DjangoJSONEncoder, default=list)
+    kwargs = models.JSONField('キーワード引数', encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField('ステータス', max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField('優先度', default=0)
+    run_at = models.DateTimeField('実行予定日時', default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('実行回数', default=0)
+    max_attempts = models.PositiveSmallIntegerField('最大実行回数', default=5)
+    locked_by = models.CharField('実行中のワーカー', max_length=100, blank=True)
+    last_error = models.TextField('最後のエラー', blank=True)
+    created_at = models.DateTimeField('登録日時', auto_now_add=True)
+    finished_at = models.DateTimeField('終了日時', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'バックグラウンドタスク'
+        verbose_name_plural = 'バックグラウンドタスク'
+        ordering = ['-priority', 'run_at']
+        indexes = [
+            # ワーカーの取得クエリ（待機中のみの部分索引）
+            models.Index(
+                fields=['-priority', 'run_at'], name='task_queued_idx',
+                condition=models.Q(status='queued')
+            ),
+            models.Index(fields=['status', 'finished_at'], name='task_finished_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class SLAEscalation(models.Model):
+    """
+    SLA超過の通知履歴（workflow.escalation）
+    
+    段階の開始日時（申請日時・受付日時）ごとに記録するため、差し戻し後の再申請は改めて通知の対象になる。
+    """
+    STAGE_CHOICES = [
+        ('receive', '受付'),
+        ('approve', '承認'),
+    ]
+    LEVEL_CHOICES = [
+        (1, '督促'),
+        (2, 'エスカレーション'),
+    ]
+    
+    application = models.ForeignKey(
+        Application, on_delete=models.CASCADE, related_name='sla_escalations', verbose_name='申請'
+    )
+    stage = models.CharField('段階', max_length=10, choices=STAGE_CHOICES)
+    level = models.PositiveSmallIntegerField('レベル', choices=LEVEL_CHOICES)
+    stage_started_at = models.DateTimeField('段階の開始日時')
+    notified_at = models.DateTimeField('通知日時', default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'SLA超過の通知'
+        verbose_name_plural = 'SLA超過の通知'
+        ordering = ['-notified_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['application', 'stage', 'level', 'stage_started_at'], name='unique_sla_escalation'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.application_id} {self.get_stage_display()} {self.get_level_display()}"
+
+
+class SLACheckpoint(models.Model):
+    """
+    SLA超過の確認済み時刻（申請種別 × 段階 × レベル）
+    
+    段階の開始日時がこの時刻以前の申請は確認済みのため、次回は以降の申請だけを検索する。
+    """
+    application_type = models.CharField('申請種別', max_length=30, choices=Application.APPLICATION_TYPE_CHOICES)
+    stage = models.CharField('段階', max_length=10, choices=SLAEscalation.STAGE_CHOICES)
+    level = models.PositiveSmallIntegerField('レベル', choices=SLAEscalation.LEVEL_CHOICES)
+    checked_until = models.DateTimeField('確認済みの開始日時', null=True, blank=True)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'SLA確認状況'
+        verbose_name_plural = 'SLA確認状況'
+        constraints = [
+            models.UniqueConstraint(fields=['application_type', 'stage', 'level'], name='unique_sla_checkpoint'),
+        ]
+    
+    def __str__(self):
+        return f"{self.application_type} {self.get_stage_display()} {self.get_level_display()}"
+
+
+class PendingNotification(models.Model):
+    """
+    まとめ通知待ちのメール（workflow.notifications）
+    
+    まとめ通知を選んだユーザーへの通知をためておき、send_digests コマンドが1通にまとめて送信する。
+    同じ宛先・同じ重複キーの通知は1件だけ保持する。
+    """
+    recipient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='pending_notifications', verbose_name='宛先'
+    )
+    frequency = models.CharField('通知間隔', max_length=10, choices=UserProfile.NOTIFICATION_FREQUENCY_CHOICES)
+    subject = models.CharField('件名', max_length=255)
+    message = models.TextField('本文')
+    dedup_key = models.CharField('重複キー', max_length=100, blank=True)
+    created_at = models.DateTimeField('登録日時', default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'まとめ通知待ちのメール'
+        verbose_name_plural = 'まとめ通知待ちのメール'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['frequency', 'created_at'], name='notification_due_idx'),
+            models.Index(fields=['recipient', 'created_at'], name='notification_recipient_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'dedup_key'], name='unique_pending_notification',
+                condition=~models.Q(dedup_key='')
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.recipient_id} {self.subject}"
+
+
+class InboxNotification(models.Model):
+    """
+    受信箱の通知（画面上の通知、workflow.notifications）
+    
+    未読件数は UserProfile.unread_notifications とキャッシュに非正規化して持ち、ナビゲーションバーでは数えない。
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_notifications', verbose_name='宛先')
+    subject = models.CharField('件名', max_length=255)
+    message = models.TextField('本文', blank=True)
+    url = models.CharField('リンク先', max_length=255, blank=True)
+    is_read = models.BooleanField('既読', default=False)
+    created_at = models.DateTimeField('通知日時', default=timezone.now)
+    
+    class Meta:
+        verbose_name = '受信箱の通知'
+        verbose_name_plural = '受信箱の通知'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at'], name='inbox_user_unread_idx'),
+            models.Index(fields=['created_at'], name='inbox_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.subject}"
+
+
+class ApplicationStatusCount(models.Model):
+    """
+    申請種別 × ステータスの件数（/metrics のキューの深さ、workflow.metrics）
+    
+    申請の保存・QuerySet.update()・削除（CASCADE を含む）・一括取込と同じトランザクションで増減し、取得時に COUNT しない。
+    ずれた場合は python manage.py rebuild_status_counts で数え直す。
+    """
+    application_type = models.CharField('申請種別', max_length=30, choices=Application.APPLICATION_TYPE_CHOICES)
+    status = models.CharField('ステータス', max_length=20, choices=Application.STATUS_CHOICES)
+    count = models.IntegerField('件数', default=0)
+    
+    class Meta:
+        verbose_name = '申請件数'
+        verbose_name_plural = '申請件数'
+        ordering = ['application_type', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['application_type', 'status'], name='unique_application_status_count'),
+        ]
+    
+    def __str__(self):
+        return f"{self.application_type} {self.status}: {self.count}"
+
+
+def adjust_status_counts(deltas):
+    """
+    申請種別 × ステータスの件数を増減する
+    
+    Args:
+        deltas: {(申請種別, ステータス): 増減}。申請種別・ステータスが None のもの（新規作成前）は無視する
+    """
+    # 行ロックの取得順を揃える（ステータスの変更で A→B と B→A を同時に更新してもデッドロックしないように）
+    for (application_type, status), delta in sorted(deltas.items(), key=lambda item: tuple(map(str, item[0]))):
+        if application_type is None or status is None or not delta:
+            continue
+        counts = ApplicationStatusCount.objects.filter(application_type=application_type, status=status)
+        if not counts.update(count=F('count') + delta):
+            ApplicationStatusCount.objects.get_or_create(application_type=application_type, status=status)
+            counts.update(count=F('count') + delta)
+
+
+def count_deleted_application(sender, instance, **kwargs):
+    """
+    post_delete のレシーバ: 削除した申請を申請種別 × ステータスの件数から減らす
+    
+    個別の削除・QuerySet.delete()・CASCADE（申請者の削除など）のいずれも1件ずつ呼ばれる。
+    削除は Collector のトランザクション内で行われるため、件数も同じトランザクションで更新される。
+    """
+    loaded_values = getattr(instance, '_loaded_values', {})
+    key = (
+        loaded_values.get('application_type', instance.application_type),
+        loaded_values.get('status', instance.status),
+    )
+    adjust_status_counts({key: -1})
+
+
+def rebuild_status_counts():
+    """申請種別 × ステータスの件数を申請から数え直す"""
+    counts = Application.objects.values_list('application_type', 'status').annotate(count=Count('id')).order_by()
+    with transaction.atomic():
+        ApplicationStatusCount.objects.all().delete()
+        ApplicationStatusCount.objects.bulk_create([
+            ApplicationStatusCount(application_type=application_type, status=status, count=count)
+            for application_type, status, count in counts
+        ])
+
+
+class MetricCounter(models.Model):
+    """
+    運用メトリクスのカウンタ（workflow.metrics.MetricsRegistry の系列ごとの全ワーカーの合計）
+    
+    各ワーカーがプロセス内の集計値を F 式で加算する（キャッシュの incr はバックエンドによって原子的でないため）。
+    """
+    # 系列（メトリクス名 + ラベル）の md5
+    key = models.CharField('系列キー', max_length=32, unique=True)
+    name = models.CharField('メトリクス名', max_length=100)
+    labels = models.JSONField('ラベル', default=dict)
+    value = models.BigIntegerField('値', default=0)
+    
+    class Meta:
+        verbose_name = 'メトリクスのカウンタ'
+        verbose_name_plural = 'メトリクスのカウンタ'
+    
+    def __str__(self):
+        return f"{self.name} {self.labels}: {self.value}"
+
+
+class RequestProfile(models.Model):
+    """
+    リクエストのプロファイル（workflow.profiling）
+    
+    採取したスタック・cProfile の結果・SQLの一覧は zlib で圧縮した JSON として data に持つ。
+    保存時に保存期間・保存件数を超えた古いものを削除する。
+    """
+    TRIGGER_CHOICES = [
+        ('requested', '指定'),
+        ('slow', '低速'),
+    ]
+    MODE_CHOICES = [
+        ('sample', 'スタック採取'),
+        ('cprofile', 'cProfile'),
+    ]
+    
+    created_at = models.DateTimeField('記録日時', default=timezone.now)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='request_profiles', verbose_name='ユーザー'
+    )
+    method = models.CharField('メソッド', max_length=10)
+    path = models.CharField('パス', max_length=500)
+    view_name = models.CharField('URL名', max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField('ステータスコード')
+    duration_ms = models.FloatField('処理時間（ms）')
+    trigger = models.CharField('契機', max_length=10, choices=TRIGGER_CHOICES)
+    mode = models.CharField('方式', max_length=10, choices=MODE_CHOICES)
+    sample_count = models.PositiveIntegerField('採取回数', default=0)
+    query_count = models.PositiveIntegerField('SQL数', default=0)
+    query_ms = models.FloatField('SQLの時間（ms）', default=0)
+    data = models.BinaryField('プロファイル（圧縮）')
+    raw_size = models.PositiveIntegerField('圧縮前のサイズ', default=0)
+    
+    class Meta:
+        verbose_name = 'リクエストプロファイル'
+        verbose_name_plural = 'リクエストプロファイル'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='request_profile_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
@@ -0,0 +1,264 @@
+"""
+通知の配信（受信箱・メールのすぐに通知・まとめ通知）
+
+    notify(users, subject, message, url=application_url, dedup_key=f'submitted:{application.pk}')
+
+- 受信箱: 宛先全員の InboxNotification を bulk_create で1回に登録し、未読件数
+  （UserProfile.unread_notifications）を1回の UPDATE で加算する。ナビゲーションバーの未読件数は
+  キャッシュ（なければ読み込み済みのプロファイル）から表示するため、ページごとに数えない
+
+- すぐに通知: 宛先をまとめて1通をタスクキューから送信する
+- まとめ通知（1時間ごと・1日1回）: PendingNotification にためておき、send_digests コマンドが
+  区切りの時刻（毎時0分・毎日 NOTIFICATION_DIGEST_HOUR 時）を過ぎた宛先ごとに1通にまとめ、
+  1つのSMTP接続でまとめて送信する
+- urgent=True の通知（エスカレーション、申請種別設定の「即時通知」）は設定に関わらずすぐに送る
+- 重複キーが同じ通知は、まとめ通知待ちの間は最初の1件だけを保持する
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .metrics import track_email
+from .tasks import enqueue, send_email
+
+
+logger = logging.getLogger(__name__)
+
+# 1日1回のまとめ通知を送る時刻（現地時刻の時）
+DIGEST_HOUR = getattr(settings, 'NOTIFICATION_DIGEST_HOUR', 8)
+
+# まとめ通知を1回のトランザクションで処理する通知の件数
+DIGEST_BATCH_SIZE = 500
+
+DIGEST_FREQUENCIES = ['hourly', 'daily']
+
+# 未読件数のキャッシュ
+UNREAD_CACHE_KEY = 'inbox_unread_{}'
+UNREAD_CACHE_TIMEOUT = 300
+
+# 受信箱の通知を残す日数と、1回に削除する件数
+INBOX_RETENTION_DAYS = 90
+PRUNE_BATCH_SIZE = 1000
+
+
+def notification_frequency(user):
+    try:
+        return user.profile.notification_frequency
+    except ObjectDoesNotExist:
+        return 'immediate'
+
+
+def notify(users, subject, message, url='', urgent=False, dedup_key=''):
+    """
+    ユーザーへ通知する
+
+    受信箱へ追加し、メールはプロファイルの通知設定に従ってすぐに送るか、まとめ通知にためる
+    （メールの送信・まとめ通知の登録はトランザクションのコミット後）。
+    """
+    PendingNotification = apps.get_model('workflow', 'PendingNotification')
+    users = list(users)
+    deliver_to_inbox(users, subject, message, url)
+
+    immediate = set()
+    buffered = {}
+    for user in users:
+        if not user.email or not user.is_active or user.pk in buffered:
+            continue
+        frequency = 'immediate' if urgent else notification_frequency(user)
+        if frequency == 'immediate':
+            immediate.add(user.email)
+        else:
+            buffered[user.pk] = PendingNotification(
+                recipient=user, frequency=frequency, subject=subject[:255], message=message, dedup_key=dedup_key
+            )
+
+    if immediate:
+        enqueue(send_email, subject, message, sorted(immediate))
+    if buffered:
+        transaction.on_commit(
+            lambda: PendingNotification.objects.bulk_create(buffered.values(), ignore_conflicts=True)
+        )
+
+
+def digest_cutoff(frequency, now):
+    """まとめ通知の直近の区切りの時刻（これより前に登録された通知があれば送信する）"""
+    local = timezone.localtime(now)
+    if frequency == 'hourly':
+        return local.replace(minute=0, second=0, microsecond=0)
+    cutoff = local.replace(hour=DIGEST_HOUR, minute=0, second=0, microsecond=0)
+    if cutoff > local:
+        cutoff -= timedelta(days=1)
+    return cutoff
+
+
+def send_digests(now=None, batch_size=DIGEST_BATCH_SIZE):
+    """
+    区切りの時刻を過ぎたまとめ通知を送信する
+
+    宛先ごとに、たまっている通知（区切り後に登録されたものを含む）をすべて1通にまとめる。
+    通知の行は送信に成功してから削除するため、送信に失敗した場合は次回に再送する。
+    複数の実行が重なっても、ロック済みの行は読み飛ばすため二重に送信しない。
+
+    Returns:
+        送信したメールの数
+    """
+    PendingNotification = apps.get_model('workflow', 'PendingNotification')
+    now = now or timezone.now()
+    due = Q()
+    for frequency in DIGEST_FREQUENCIES:
+        due |= Q(frequency=frequency, created_at__lt=digest_cutoff(frequency, now))
+    skip_locked = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+
+    sent = 0
+    mail_connection = get_connection()
+    mail_connection.open()
+    try:
+        while True:
+            with transaction.atomic():
+                recipient_ids = {
+                    notification.recipient_id
+                    for notification in PendingNotification.objects.select_for_update(**skip_locked)
+                    .filter(due).only('recipient_id')[:batch_size]
+                }
+                if not recipient_ids:
+                    break
+                notifications = list(
+                    PendingNotification.objects.select_for_update(**skip_locked)
+                    .filter(recipient_id__in=recipient_ids)
+                    .select_related('recipient').order_by('recipient_id', 'created_at')
+                )
+                by_recipient = defaultdict(list)
+                for notification in notifications:
+                    by_recipient[notification.recipient].append(notification)
+
+                messages = [
+                    render_digest(recipient, items, mail_connection)
+                    for recipient, items in by_recipient.items()
+                    if recipient.email
+                ]
+                with track_email('digest'):
+                    mail_connection.send_messages(messages)
+                PendingNotification.objects.filter(pk__in=[notification.pk for notification in notifications]).delete()
+            sent += len(messages)
+    finally:
+        mail_connection.close()
+
+    if sent:
+        logger.info('まとめ通知を%d通送信しました', sent)
+    return sent
+
+
+def render_digest(recipient, notifications, mail_connection=None):
+    """宛先1人分の通知を1通のメールにまとめる"""
+    sections = [
+        f'■ {notification.subject}\n{notification.message.strip()}'
+        for notification in notifications
+    ]
+    body = '\n\n'.join(sections)
+    message = f'''
+通知をまとめてお送りします（{len(notifications)}件）。
+
+{body}
+
+通知の受け取り方は以下のURLから変更できます。
+{settings.SITE_URL}/workflow/notification-settings/
+'''
+    subject = f'【まとめ通知】{len(notifications)}件のお知らせ'
+    return EmailMessage(
+        subject, message, settings.DEFAULT_FROM_EMAIL, [recipient.email], connection=mail_connection
+    )
+
+
+# ---------------------------------------------------------------------------
+# 受信箱
+# ---------------------------------------------------------------------------
+
+def deliver_to_inbox(users, subject, message='', url=''):
+    """ユーザーの受信箱へ通知を追加する（宛先の人数に関わらず INSERT 1回・UPDATE 1回）"""
+    InboxNotification = apps.get_model('workflow', 'InboxNotification')
+    user_ids = list(dict.fromkeys(user.pk for user in users if user.is_active))
+    if not user_ids:
+        return
+    now = timezone.now()
+    InboxNotification.objects.bulk_create([
+        InboxNotification(user_id=user_id, subject=subject[:255], message=message, url=url, created_at=now)
+        for user_id in user_ids
+    ])
+    _adjust_unread(user_ids, 1)
+
+
+def _adjust_unread(user_ids, delta):
+    """未読件数を delta だけ増減し、コミット後にキャッシュを消す"""
+    UserProfile = apps.get_model('workflow', 'UserProfile')
+    UserProfile.objects.filter(user_id__in=user_ids).update(
+        unread_notifications=Greatest(F('unread_notifications') + delta, 0)
+    )
+    keys = [UNREAD_CACHE_KEY.format(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def unread_count(user):
+    """未読件数（キャッシュ、なければプロファイルの非正規化した件数）"""
+    key = UNREAD_CACHE_KEY.format(user.pk)
+    count = cache.get(key)
+    if count is None:
+        # キャッシュがない場合のみ1クエリ（件数の列だけを読む。ナビゲーションバーの役割・企業名は
+        # セッションの user_context から表示するため、ここで user.profile を読み込むと余分な読み込みになる）
+        UserProfile = apps.get_model('workflow', 'UserProfile')
+        count = UserProfile.objects.filter(user_id=user.pk).values_list('unread_notifications', flat=True).first() or 0
+        cache.add(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+@transaction.atomic
+def mark_read(user, pk=None):
+    """通知を既読にする（pk を省略した場合はすべて）。既読にした件数を返す"""
+    InboxNotification = apps.get_model('workflow', 'InboxNotification')
+    notifications = InboxNotification.objects.filter(user=user, is_read=False)
+    if pk is not None:
+        notifications = notifications.filter(pk=pk)
+    updated = notifications.update(is_read=True)
+    if updated:
+        _adjust_unread([user.pk], -updated)
+    return updated
+
+
+def prune_inbox(days=INBOX_RETENTION_DAYS, batch_size=PRUNE_BATCH_SIZE):
+    """
+    days 日より前の通知を batch_size 件ずつ削除する（未読のまま削除した分は未読件数から引く）
+
+    Returns:
+        削除した件数
+    """
+    InboxNotification = apps.get_model('workflow', 'InboxNotification')
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                InboxNotification.objects.select_for_update()
+                .filter(created_at__lt=cutoff).order_by('created_at')
+                .values_list('id', 'user_id', 'is_read')[:batch_size]
+            )
+            if not batch:
+                break
+            InboxNotification.objects.filter(id__in=[notification_id for notification_id, _, _ in batch]).delete()
+
+            unread = Counter(user_id for _, user_id, is_read in batch if not is_read)
+            users_by_count = defaultdict(list)
+            for user_id, count in unread.items():
+                users_by_count[count].append(user_id)
+            for count, user_ids in users_by_count.items():
+                _adjust_unread(user_ids, -count)
+        deleted += len(batch)
+    return deleted
@@ -0,0 +1,219 @@
+"""
+作業場所の占有状況と期間の重複検出
+
+作業申請・工事申請（受付済・承認済）を「作業場所 × 期間（開始日〜終了日、両端を含む）」の占有として扱い、
+受付待ちの申請と期間が重なるものを検出する。
+
+- PostgreSQL: daterange の重なり（&&）で検索し、作業場所 + daterange の GiST 索引を使う
+  （索引はマイグレーション 0005 で作成）
+- その他のDB: (作業場所, 終了日) の索引で候補を絞り込む（終了済みの過去の申請は読まない）
+候補を読み込んだ後は、作業場所ごとの区間木で個々の申請との重なりを判定する。
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.db import connections
+from django.db.models import F, Func, Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Application
+
+
+# 占有として扱う申請種別・ステータス
+OCCUPANCY_TYPES = ['work', 'construction']
+OCCUPYING_STATUSES = ['received', 'approved']
+
+# 占有情報として読み込む列
+OCCUPANCY_COLUMNS = [
+    'id', 'application_number', 'application_type', 'title', 'company_name',
+    'work_location', 'work_start_date', 'work_end_date', 'worker_count', 'status',
+]
+
+
+def get_period(application):
+    """申請の期間 (開始日, 終了日) を返す（終了日がない場合は開始日の1日のみ）"""
+    if not application.work_start_date:
+        return None
+    return application.work_start_date, application.work_end_date or application.work_start_date
+
+
+class IntervalTree:
+    """
+    閉区間 [start, end] の静的な区間木（中心点で分割）
+
+    n件の区間に対し、重なる区間の検索は O(log n + 該当件数)。
+    """
+
+    def __init__(self, intervals):
+        # intervals: (開始, 終了, 値) のリスト
+        self.center = None
+        self.left = self.right = None
+        self.by_start = self.by_end = ()
+        if not intervals:
+            return
+
+        points = sorted(point for start, end, _ in intervals for point in (start, end))
+        self.center = points[len(points) // 2]
+
+        left, right, overlapping = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                overlapping.append(interval)
+
+        self.by_start = sorted(overlapping, key=lambda interval: interval[0])
+        self.by_end = sorted(overlapping, key=lambda interval: interval[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def query(self, start, end):
+        """[start, end] と重なる区間の値を返す"""
+        results = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.center is None:
+                continue
+            if end < node.center:
+                # 中心より左の検索範囲: 開始が end 以前の区間のみ該当
+                for interval in node.by_start:
+                    if interval[0] > end:
+                        break
+                    results.append(interval[2])
+                if node.left:
+                    stack.append(node.left)
+            elif start > node.center:
+                # 中心より右の検索範囲: 終了が start 以降の区間のみ該当
+                for interval in node.by_end:
+                    if interval[1] < start:
+                        break
+                    results.append(interval[2])
+                if node.right:
+                    stack.append(node.right)
+            else:
+                # 検索範囲が中心を含む: 中心を含む区間はすべて該当
+                results.extend(interval[2] for interval in node.by_start)
+                if node.left:
+                    stack.append(node.left)
+                if node.right:
+                    stack.append(node.right)
+        return results
+
+
+def occupying_applications(locations, period_from, period_to, using='default'):
+    """指定した作業場所で期間 [period_from, period_to] と重なる占有中の申請を返す"""
+    queryset = Application.objects.using(using).filter(
+        application_type__in=OCCUPANCY_TYPES,
+        status__in=OCCUPYING_STATUSES,
+        work_location__in=locations,
+        work_start_date__isnull=False,
+    )
+
+    if connections[using].vendor == 'postgresql':
+        from django.contrib.postgres.fields import DateRangeField
+        from django.db.backends.postgresql.psycopg_any import DateRange
+
+        # GiST 索引の式と同じ daterange を組み立てる
+        queryset = queryset.annotate(
+            period=Func(
+                F('work_start_date'),
+                Coalesce(F('work_end_date'), F('work_start_date')),
+                Value('[]'),
+                function='daterange',
+                output_field=DateRangeField(),
+            )
+        ).filter(period__overlap=DateRange(period_from, period_to, '[]'))
+    else:
+        queryset = queryset.filter(work_start_date__lte=period_to).filter(
+            Q(work_end_date__gte=period_from) |
+            Q(work_end_date__isnull=True, work_start_date__gte=period_from)
+        )
+
+    return queryset.only(*OCCUPANCY_COLUMNS).order_by('work_start_date', 'id')
+
+
+def find_conflicts(applications):
+    """
+    申請ごとに、同じ作業場所で期間が重なる占有中の申請を返す
+
+    一覧の申請をまとめて1回のクエリで候補を読み込み、作業場所ごとの区間木で判定する。
+
+    Returns:
+        {申請ID: [重なる申請, ...]}（重なりのある申請のみ）
+    """
+    targets = [
+        (application, get_period(application))
+        for application in applications
+        if application.application_type in OCCUPANCY_TYPES and application.work_location
+    ]
+    targets = [(application, period) for application, period in targets if period]
+    if not targets:
+        return {}
+
+    period_from = min(period[0] for _, period in targets)
+    period_to = max(period[1] for _, period in targets)
+    locations = {application.work_location for application, _ in targets}
+
+    intervals = {}
+    for booking in occupying_applications(locations, period_from, period_to):
+        start, end = get_period(booking)
+        intervals.setdefault(booking.work_location, []).append((start, end, booking))
+    trees = {location: IntervalTree(items) for location, items in intervals.items()}
+
+    conflicts = {}
+    for application, (start, end) in targets:
+        tree = trees.get(application.work_location)
+        if tree is None:
+            continue
+        found = [booking for booking in tree.query(start, end) if booking.pk != application.pk]
+        if found:
+            found.sort(key=lambda booking: (booking.work_start_date, booking.pk))
+            conflicts[application.pk] = found
+    return conflicts
+
+
+def attach_conflicts(applications):
+    """一覧の各申請に重なる占有中の申請（conflicts 属性）を設定する"""
+    applications = list(applications)
+    conflicts = find_conflicts(applications)
+    for application in applications:
+        application.conflicts = conflicts.get(application.pk, [])
+    return applications
+
+
+def occupancy_calendar(location, year, month):
+    """
+    作業場所の月間占有カレンダーを返す
+
+    対象月と重なる申請のみを索引で読み込むため、履歴の量によらず1か月分の件数に比例する。
+
+    Returns:
+        週のリスト。各週は7日分の {'date', 'in_month', 'bookings', 'worker_count'}
+    """
+    first_day = date(year, month, 1)
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+
+    bookings_by_day = {}
+    for booking in occupying_applications([location], first_day, last_day):
+        start, end = get_period(booking)
+        day = max(start, first_day)
+        while day <= min(end, last_day):
+            bookings_by_day.setdefault(day, []).append(booking)
+            day += timedelta(days=1)
+
+    weeks = []
+    for week in calendar.Calendar(firstweekday=0).monthdatescalendar(year, month):
+        days = []
+        for day in week:
+            bookings = bookings_by_day.get(day, [])
+            days.append({
+                'date': day,
+                'in_month': day.month == month,
+                'bookings': bookings,
+                'worker_count': sum(booking.worker_count or 0 for booking in bookings),
+            })
+        weeks.append(days)
+    return weeks
@@ -0,0 +1,301 @@
+"""
+リクエスト単位のプロファイル（ProfilingMiddleware。結果は管理画面の「リクエストプロファイル」）
+
+- 指定: スタッフが ?_profile=1 または X-Workflow-Profile: 1 を付けたリクエスト。
+  ?_profile=cprofile（ヘッダーは cprofile）では cProfile で関数ごとの時間を記録する（同期のみ）
+- 自動: PROFILING_SAMPLE_RATE の割合のリクエストでスタックを採取し、
+  PROFILING_SLOW_MS 以上かかった場合のみ保存する（特定のユーザーだけ遅い画面の調査用）
+
+スタックの採取は別スレッドから PROFILING_INTERVAL_MS ごとにリクエストのスレッドのスタックを読む
+（統計的プロファイル）。非同期ビューではイベントループのスレッドと、このリクエストのSQLを実行した
+スレッドを対象にする（イベントループ上の他のリクエストの処理も含まれる）。
+SQLは実行順に文とDB・所要時間を記録する（パラメータは個人情報を含むため記録しない）。
+
+採取したスタックは折りたたみ形式（frame;frame;frame 回数）で出力でき、flamegraph.pl や
+speedscope でフレームグラフとして表示できる。cProfile の結果は pstats 形式（snakeviz など）で出力する。
+保存時に PROFILE_RETENTION_DAYS より古いもの・PROFILE_MAX_COUNT 件を超えた古いものを削除する。
+"""
+import base64
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# 保存期間と保存件数の上限
+PROFILE_RETENTION_DAYS = 7
+PROFILE_MAX_COUNT = 500
+
+# 1件に記録するSQLの上限（超えた分は件数・時間の合計のみ数える）
+MAX_QUERIES = 2000
+
+# 採取するスタックの深さの上限
+MAX_STACK_DEPTH = 128
+
+# 実行中のリクエストのプロファイル（SQLの記録用）
+_current = ContextVar('workflow_request_profile', default=None)
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename):
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    if 'site-packages' in filename:
+        return filename.split('site-packages' + os.sep, 1)[-1]
+    return os.path.basename(filename)
+
+
+def _frame_label(code):
+    return f'{getattr(code, "co_qualname", code.co_name)} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+def fold_stack(frame):
+    """フレームから折りたたみ形式のスタック（呼び出し元;…;実行中の関数）を作る"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """別スレッドから一定間隔で対象スレッドのスタックを採取する"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_ids = {threading.get_ident()}
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='workflow-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in tuple(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[fold_stack(frame)] += 1
+
+
+class RequestProfiler:
+    """1リクエストのプロファイル（スタックの採取または cProfile と、SQLの記録）"""
+
+    def __init__(self, trigger, mode='sample'):
+        self.trigger = trigger
+        self.mode = mode
+        self.queries = []
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.sampler = None
+        self.profile = None
+        self._token = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000)
+            self.sampler.start()
+        self._token = _current.set(self)
+
+    def stop(self):
+        _current.reset(self._token)
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def add_query(self, alias, sql, many, elapsed_ms):
+        self.query_count += 1
+        self.query_ms += elapsed_ms
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append({'db': alias, 'sql': sql, 'many': many, 'ms': round(elapsed_ms, 3)})
+        if self.sampler is not None:
+            # sync_to_async などで別スレッドから実行されたSQLのスレッドも採取する
+            self.sampler.thread_ids.add(threading.get_ident())
+
+    def data(self):
+        data = {'queries': self.queries}
+        if self.sampler is not None:
+            data['stacks'] = self.sampler.stacks.most_common()
+        if self.profile is not None:
+            self.profile.create_stats()
+            output = io.StringIO()
+            pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(60)
+            data['pstats_text'] = output.getvalue()
+            data['pstats'] = base64.b64encode(marshal.dumps(self.profile.stats)).decode('ascii')
+        return data
+
+    @property
+    def sample_count(self):
+        return sum(self.sampler.stacks.values()) if self.sampler is not None else 0
+
+
+def record_query(execute, sql, params, many, context):
+    """DB接続の execute_wrapper（プロファイル中のリクエストのSQLと所要時間を記録する）"""
+    profiler = _current.get()
+    if profiler is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profiler.add_query(context['connection'].alias, sql, many, (time.perf_counter() - started) * 1000)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _requested_value(request):
+    value = request.GET.get('_profile') or request.headers.get('X-Workflow-Profile')
+    return value if value and value != '0' else None
+
+
+def profile_requested(request):
+    """プロファイルの指定（?_profile / X-Workflow-Profile）があるか（ユーザーは読み込まない）"""
+    return _requested_value(request) is not None
+
+
+def requested_mode(request):
+    """スタッフがプロファイルを指定していれば 'sample' か 'cprofile' を返す"""
+    value = _requested_value(request)
+    # 指定できるのはスタッフのみ（指定がある場合だけユーザーを読み込む）
+    if value is None or not request.user.is_staff:
+        return None
+    return 'cprofile' if value == 'cprofile' else 'sample'
+
+
+def start_profiler(mode=None, is_async=False):
+    """
+    プロファイルを開始する（プロファイルしない場合は None）
+
+    Args:
+        mode: requested_mode() の結果。None の場合は PROFILING_SAMPLE_RATE の割合で低速時用に採取する
+        is_async: 非同期ビューか（イベントループのスレッドで呼ぶ）
+    """
+    if mode is not None:
+        # cProfile はスレッド単位のため、非同期ビューではスタックの採取にする
+        profiler = RequestProfiler('requested', 'sample' if is_async else mode)
+    elif settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        profiler = RequestProfiler('slow')
+    else:
+        return None
+    profiler.start()
+    return profiler
+
+
+def finish_profiler(profiler, request, response, duration_ms):
+    """プロファイルを保存して返す（自動で採取したものは PROFILING_SLOW_MS 未満なら保存しない）"""
+    if profiler.trigger == 'slow' and duration_ms < settings.PROFILING_SLOW_MS:
+        return None
+    RequestProfile = apps.get_model('workflow', 'RequestProfile')
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    raw = json.dumps(profiler.data(), ensure_ascii=False).encode('utf-8')
+    try:
+        profile = RequestProfile.objects.create(
+            user_id=user.pk if user is not None and user.is_authenticated else None,
+            method=request.method[:10],
+            path=request.get_full_path()[:500],
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            trigger=profiler.trigger,
+            mode=profiler.mode,
+            sample_count=profiler.sample_count,
+            query_count=profiler.query_count,
+            query_ms=profiler.query_ms,
+            data=zlib.compress(raw, 6),
+            raw_size=len(raw),
+        )
+        prune_profiles()
+    except Exception:
+        # 調査用の記録のため、保存できなくてもレスポンスは返す
+        logger.warning('リクエストのプロファイルを保存できませんでした: %s', request.path, exc_info=True)
+        return None
+    return profile
+
+
+def prune_profiles(days=PROFILE_RETENTION_DAYS, max_count=PROFILE_MAX_COUNT):
+    """保存期間を過ぎたプロファイルと、新しい順に max_count 件を超えた分を削除する。削除した件数を返す"""
+    RequestProfile = apps.get_model('workflow', 'RequestProfile')
+    deleted, _ = RequestProfile.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+    oldest_kept = (
+        RequestProfile.objects.order_by('-created_at', '-id').values_list('created_at', 'id')[max_count - 1:max_count]
+    )
+    for created_at, profile_id in oldest_kept:
+        overflow, _ = RequestProfile.objects.filter(created_at__lte=created_at).exclude(
+            created_at=created_at, id__gte=profile_id
+        ).delete()
+        deleted += overflow
+    return deleted
+
+
+def load_data(profile):
+    return json.loads(zlib.decompress(profile.data))
+
+
+def folded_stacks(data):
+    """折りたたみ形式（flamegraph.pl・speedscope の入力）"""
+    return ''.join(f'{stack} {count}\n' for stack, count in data.get('stacks', []))
+
+
+def pstats_dump(data):
+    """cProfile の結果（pstats.Stats で読めるファイルの内容）。スタックの採取では None"""
+    if 'pstats' not in data:
+        return None
+    return base64.b64decode(data['pstats'])
+
+
+def hot_frames(data, limit=30):
+    """
+    採取時に実行中だった回数（自身の時間）の多い関数 [(関数, 自身の回数, スタックに含まれた回数, 自身の割合), ...]
+    """
+    stacks = data.get('stacks', [])
+    total = sum(count for _, count in stacks)
+    own, inclusive = Counter(), Counter()
+    for stack, count in stacks:
+        labels = stack.split(';')
+        own[labels[-1]] += count
+        for label in set(labels):
+            inclusive[label] += count
+    return [(label, count, inclusive[label], count / total) for label, count in own.most_common(limit)]
+
+
+def query_summary(data, limit=20):
+    """同じSQLの実行回数と合計時間 [(SQL, 回数, 合計ms), ...]（N+1 の発見用）"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for query in data.get('queries', []):
+        totals[query['sql']][0] += 1
+        totals[query['sql']][1] += query['ms']
+    ranked = sorted(totals.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+    return [(sql, count, total_ms) for sql, (count, total_ms) in ranked[:limit]]
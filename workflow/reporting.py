@@ -0,0 +1,294 @@
+"""
+SLA・リードタイムのレポート（WorkflowStep の履歴からの日次集計）
+
+- リードタイム: 申請ごとの処理履歴をDBのウィンドウ関数（LAG）で直前のステップと並べ、
+  受付（直前が申請）・承認（直前が受付、2つ前が申請）の完了ごとに所要時間を求める。
+  完了日 × 段階 × 申請種別 × 担当ロール × 申請企業 ごとに LeadTimeRollup へ集計する
+- 滞留: 受付待ち・承認待ちの申請の滞留時間を、集計日ごとに BacklogSnapshot へ記録する
+
+集計は refresh_reports コマンドで前回の集計日以降を差分更新し、レポート画面は集計テーブルのみを読む。
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Min, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from .models import Application, ApplicationTypeConfig, BacklogSnapshot, LeadTimeRollup, WorkflowStep
+
+
+# 時間の分布の区間（上限秒, 表示名）。最後の区間は上限なし
+DURATION_BUCKETS = [
+    (3600, '1時間以内'),
+    (4 * 3600, '4時間以内'),
+    (24 * 3600, '1日以内'),
+    (3 * 24 * 3600, '3日以内'),
+    (7 * 24 * 3600, '7日以内'),
+    (None, '7日超'),
+]
+_BUCKET_LIMITS = [limit for limit, _ in DURATION_BUCKETS[:-1]]
+
+# レポートの集計軸
+GROUP_FIELDS = {
+    'application_type': '申請種別',
+    'role_name': '担当ロール',
+    'company_name': '申請企業',
+}
+
+# 差分更新で前回の最終集計日から遡る日数（取込などで後から登録された履歴を拾う）
+REFRESH_OVERLAP_DAYS = 1
+
+
+def bucket_index(seconds):
+    """所要時間が入る DURATION_BUCKETS の位置を返す"""
+    return bisect_left(_BUCKET_LIMITS, seconds)
+
+
+class DurationTotals:
+    """キーごとの件数・合計・最大・分布を集計する"""
+
+    def __init__(self):
+        self._totals = defaultdict(lambda: [0, 0.0, 0.0, [0] * len(DURATION_BUCKETS)])
+
+    def add(self, key, seconds):
+        totals = self._totals[key]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+        totals[3][bucket_index(seconds)] += 1
+
+    def merge(self, key, count, total_seconds, max_seconds, histogram):
+        """集計済みの行（日次集計）を加算する"""
+        totals = self._totals[key]
+        totals[0] += count
+        totals[1] += total_seconds
+        totals[2] = max(totals[2], max_seconds)
+        totals[3] = [a + b for a, b in zip(totals[3], histogram)]
+
+    def items(self):
+        for key, (count, total_seconds, max_seconds, histogram) in self._totals.items():
+            yield key, {
+                'count': count,
+                'total_seconds': total_seconds,
+                'max_seconds': max_seconds,
+                'histogram': histogram,
+            }
+
+
+def _day_bounds(date_from, date_to):
+    """[date_from, date_to] の日付範囲を現地時刻の [開始, 終了) に変換する"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(date_from, time.min), tz),
+        timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz),
+    )
+
+
+def _role_names():
+    """申請種別 → (受付ロール名, 承認ロール名)"""
+    return {
+        config.application_type: (config.receiver_role.name, config.approver_role.name)
+        for config in ApplicationTypeConfig.objects.select_related('receiver_role', 'approver_role')
+    }
+
+
+def stage_transitions(date_from, date_to):
+    """
+    期間内に完了した受付・承認の所要時間を返す
+
+    対象期間に受付・承認のある申請の履歴をすべて読み、申請ごとに処理日時順の LAG で直前（2つ前）のステップを並べる。
+    差し戻し後の再申請では直前のステップが再申請になるため、最後の申請からの時間になる。
+
+    Yields:
+        (段階, 完了日時, 所要秒, 申請種別, 申請企業)
+    """
+    start, end = _day_bounds(date_from, date_to)
+    completed = WorkflowStep.objects.filter(
+        step_type__in=['receive', 'approve'], processed_at__gte=start, processed_at__lt=end
+    ).values('application_id')
+
+    partition = {'partition_by': F('application_id'), 'order_by': [F('processed_at').asc(), F('id').asc()]}
+    steps = WorkflowStep.objects.filter(
+        application_id__in=completed, processed_at__isnull=False
+    ).annotate(
+        previous_type=Window(Lag('step_type'), **partition),
+        previous_at=Window(Lag('processed_at'), **partition),
+        before_previous_type=Window(Lag('step_type', 2), **partition),
+        before_previous_at=Window(Lag('processed_at', 2), **partition),
+    ).filter(
+        # ウィンドウ関数の結果による絞り込みはLAGの計算後に適用される
+        previous_type__in=['submit', 'receive']
+    ).order_by().values_list(
+        'step_type', 'processed_at', 'previous_type', 'previous_at',
+        'before_previous_type', 'before_previous_at',
+        'application__application_type', 'application__company_name',
+    )
+
+    for (step_type, processed_at, previous_type, previous_at,
+         before_previous_type, before_previous_at, application_type, company_name) in steps.iterator():
+        if not start <= processed_at < end:
+            continue
+        if step_type == 'receive' and previous_type == 'submit':
+            yield 'receive', processed_at, (processed_at - previous_at).total_seconds(), application_type, company_name
+        elif step_type == 'approve' and previous_type == 'receive':
+            yield 'approve', processed_at, (processed_at - previous_at).total_seconds(), application_type, company_name
+            if before_previous_type == 'submit':
+                yield 'total', processed_at, (processed_at - before_previous_at).total_seconds(), application_type, company_name
+
+
+@transaction.atomic
+def refresh_lead_times(date_from, date_to):
+    """[date_from, date_to] のリードタイム日次集計を作り直す"""
+    role_names = _role_names()
+    totals = DurationTotals()
+    for stage, processed_at, seconds, application_type, company_name in stage_transitions(date_from, date_to):
+        receiver_role, approver_role = role_names.get(application_type, ('', ''))
+        role_name = receiver_role if stage == 'receive' else approver_role
+        day = timezone.localtime(processed_at).date()
+        totals.add((day, stage, application_type, role_name, company_name), seconds)
+
+    LeadTimeRollup.objects.filter(date__range=(date_from, date_to)).delete()
+    rollups = LeadTimeRollup.objects.bulk_create([
+        LeadTimeRollup(
+            date=day, stage=stage, application_type=application_type,
+            role_name=role_name, company_name=company_name, **values
+        )
+        for (day, stage, application_type, role_name, company_name), values in totals.items()
+    ])
+    return len(rollups)
+
+
+@transaction.atomic
+def snapshot_backlog(now=None):
+    """現時点の受付待ち・承認待ちの滞留時間を当日のスナップショットとして記録する"""
+    now = now or timezone.now()
+    role_names = _role_names()
+    totals = DurationTotals()
+
+    queues = [
+        ('receive', 'submitted', 'submitted_at', 0),
+        ('approve', 'received', 'received_at', 1),
+    ]
+    for queue, status, since_field, role_index in queues:
+        waiting = Application.objects.filter(status=status, **{f'{since_field}__isnull': False}).values_list(
+            'application_type', 'company_name', since_field
+        )
+        for application_type, company_name, since in waiting.iterator():
+            role_name = role_names.get(application_type, ('', ''))[role_index]
+            totals.add((queue, application_type, role_name, company_name), max((now - since).total_seconds(), 0))
+
+    day = timezone.localtime(now).date()
+    BacklogSnapshot.objects.filter(date=day).delete()
+    snapshots = BacklogSnapshot.objects.bulk_create([
+        BacklogSnapshot(
+            date=day, queue=queue, application_type=application_type,
+            role_name=role_name, company_name=company_name, **values
+        )
+        for (queue, application_type, role_name, company_name), values in totals.items()
+    ])
+    return len(snapshots)
+
+
+def refresh_reports(date_from=None, full=False, now=None):
+    """
+    日次集計を差分更新する
+
+    Args:
+        date_from: 作り直す最初の日（省略時は前回の最終集計日の REFRESH_OVERLAP_DAYS 日前から）
+        full: 全期間を作り直す
+
+    Returns:
+        {'date_from', 'date_to', 'lead_time_rows', 'backlog_rows'}
+    """
+    now = now or timezone.now()
+    date_to = timezone.localtime(now).date()
+
+    if date_from is None:
+        last_date = None if full else LeadTimeRollup.objects.aggregate(last=Max('date'))['last']
+        if last_date is not None:
+            date_from = last_date - timedelta(days=REFRESH_OVERLAP_DAYS)
+        else:
+            first = WorkflowStep.objects.aggregate(first=Min('processed_at'))['first']
+            date_from = timezone.localtime(first).date() if first else date_to
+
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'lead_time_rows': refresh_lead_times(date_from, date_to),
+        'backlog_rows': snapshot_backlog(now),
+    }
+
+
+def _report_rows(totals, labels):
+    rows = []
+    for key, values in sorted(totals.items(), key=lambda item: item[0]):
+        count = values['count']
+        histogram = values['histogram']
+        rows.append({
+            'label': labels(key),
+            'count': count,
+            'average_hours': values['total_seconds'] / count / 3600 if count else 0,
+            'max_hours': values['max_seconds'] / 3600,
+            'histogram': histogram,
+            'p90_label': _percentile_bucket(histogram, 0.9),
+        })
+    return rows
+
+
+def _percentile_bucket(histogram, ratio):
+    """分布から、全体の ratio が収まる区間の表示名を返す"""
+    total = sum(histogram)
+    if not total:
+        return ''
+    cumulative = 0
+    for count, (_, label) in zip(histogram, DURATION_BUCKETS):
+        cumulative += count
+        if cumulative >= total * ratio:
+            return label
+    return DURATION_BUCKETS[-1][1]
+
+
+def _group_label(group_by, value):
+    if group_by == 'application_type':
+        return dict(Application.APPLICATION_TYPE_CHOICES).get(value, value)
+    return value or '（未設定）'
+
+
+def lead_time_report(date_from, date_to, group_by='application_type'):
+    """期間内のリードタイムを 段階 × 集計軸 ごとに返す（日次集計のみを読む）"""
+    stages = dict(LeadTimeRollup.STAGE_CHOICES)
+    totals = DurationTotals()
+    rollups = LeadTimeRollup.objects.filter(date__range=(date_from, date_to)).values_list(
+        'stage', group_by, 'count', 'total_seconds', 'max_seconds', 'histogram'
+    )
+    stage_order = {stage: index for index, stage in enumerate(stages)}
+    for stage, group_value, *values in rollups:
+        totals.merge((stage_order[stage], stage, group_value), *values)
+    return _report_rows(
+        totals, lambda key: (stages[key[1]], _group_label(group_by, key[2]))
+    )
+
+
+def backlog_report(group_by='application_type', day=None):
+    """最新（または指定日以前で最新）の滞留スナップショットを キュー × 集計軸 ごとに返す"""
+    snapshots = BacklogSnapshot.objects.all()
+    if day is not None:
+        snapshots = snapshots.filter(date__lte=day)
+    latest = snapshots.aggregate(latest=Max('date'))['latest']
+    if latest is None:
+        return None, []
+
+    queues = dict(BacklogSnapshot.QUEUE_CHOICES)
+    queue_order = {queue: index for index, queue in enumerate(queues)}
+    totals = DurationTotals()
+    rows = BacklogSnapshot.objects.filter(date=latest).values_list(
+        'queue', group_by, 'count', 'total_seconds', 'max_seconds', 'histogram'
+    )
+    for queue, group_value, *values in rows:
+        totals.merge((queue_order[queue], queue, group_value), *values)
+    return latest, _report_rows(
+        totals, lambda key: (queues[key[1]], _group_label(group_by, key[2]))
+    )
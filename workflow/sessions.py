@@ -0,0 +1,38 @@
+"""
+セッションの保存先（settings.WORKFLOW_SESSION_STORAGE）
+
+- db: django_session テーブル（Django の既定）。リクエストごとに1回読み、変更時に書く
+- cached_db: 共有キャッシュ + DB。読み取りは通常キャッシュのみで、書き込みは両方
+- signed_cookies: 署名付きCookie。DBを使わない（内容は暗号化されないため、機密情報は入れない）
+
+db から signed_cookies へ切り替えると、ログイン中のユーザーのCookieにはDBのセッションのキーが残っている。
+このモジュールの SessionStore はこのキーを受け取った場合にDBのセッションを読み込み、
+レスポンスで署名付きCookieに置き換える（DBの行は削除する）ため、切り替えでログアウトされない。
+移行の状況は python manage.py migrate_sessions で確認する。
+"""
+from django.contrib.sessions.backends import db, signed_cookies
+
+
+def is_database_session_key(session_key):
+    """DBのセッションのキーの形式か（署名付きCookieの値は ':' 区切りの署名を含む）"""
+    return bool(session_key) and ':' not in session_key and len(session_key) == 32
+
+
+class SessionStore(signed_cookies.SessionStore):
+    """署名付きCookieのセッション（DBのセッションのキーを受け取った場合はDBから移す）"""
+
+    def load(self):
+        if not is_database_session_key(self.session_key):
+            return super().load()
+
+        store = db.SessionStore(self.session_key)
+        data = store.load()
+        if store.session_key is None:
+            # 期限切れ・削除済み
+            self.create()
+            return {}
+
+        store.delete()
+        # レスポンスで署名付きCookieとして保存させる
+        self.modified = True
+        return data
@@ -0,0 +1,216 @@
+"""
+DBを使う軽量なバックグラウンドタスクキュー
+
+メール送信などの時間のかかる処理をリクエストから切り離し、runworkers コマンドのワーカーで実行する。
+
+    @task()
+    def send_email(subject, message, recipient_list): ...
+
+    enqueue(send_email, subject, message, recipients)              トランザクションのコミット後に登録
+    enqueue(send_email, ..., priority=10, run_at=明日9時, max_attempts=3)
+
+- 取得: PostgreSQL では SELECT ... FOR UPDATE SKIP LOCKED で、複数のワーカーが同じタスクを待たずに取得する。
+  SKIP LOCKED のないDB（SQLite）では、実行予定日時を条件にした UPDATE で1件ずつ取得する
+- 可視性タイムアウト: 取得時に実行予定日時を visibility_timeout 秒後へ進める。
+  ワーカーが停止した場合はその時刻を過ぎると別のワーカーが再実行する
+- 再試行: 失敗したタスクは max_attempts 回まで指数バックオフで再実行する。
+  ワーカーごと停止させたタスク（メモリ不足・SIGKILL など）も、取得回数が max_attempts に達したら失敗にする
+- DBに接続できないなどで取得に失敗した場合、ワーカーは待ち時間を延ばしながら取得し直す
+引数はJSONで保存するため、モデルは主キーで渡す。
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import track_email
+
+
+logger = logging.getLogger(__name__)
+
+# 既定の可視性タイムアウト（秒）。これより長くかかるタスクは enqueue 時ではなくワーカーの設定で延ばす
+VISIBILITY_TIMEOUT = 300
+
+# 再試行までの待ち時間（秒）: RETRY_BASE_DELAY * 2^(実行回数-1)、最大 RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 3600
+
+# 取得に失敗した場合の待ち時間（秒）の上限（ポーリング間隔から倍々に延ばす）
+CLAIM_MAX_BACKOFF = 60
+
+# 完了したタスクを削除するまでの日数
+FINISHED_RETENTION_DAYS = 7
+
+_registry = {}
+
+
+def task(name=None):
+    """関数をタスクとして登録する（名前の既定値は モジュール名.関数名）"""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        _registry[func.task_name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def enqueue(func, *args, priority=0, run_at=None, max_attempts=5, **kwargs):
+    """
+    タスクを登録する
+
+    トランザクション内ではコミット後に登録し、ロールバックされた場合は登録しない。
+    """
+    BackgroundTask = apps.get_model('workflow', 'BackgroundTask')
+    name = func if isinstance(func, str) else func.task_name
+    if name not in _registry:
+        raise ValueError(f'登録されていないタスクです: {name}')
+
+    def create():
+        BackgroundTask.objects.create(
+            name=name, args=list(args), kwargs=kwargs, priority=priority,
+            run_at=run_at or timezone.now(), max_attempts=max_attempts,
+        )
+    transaction.on_commit(create)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+class Worker:
+    """タスクを取得して実行するワーカー（1スレッド・1プロセスに1つ）"""
+
+    def __init__(self, worker_id=None, batch_size=10, poll_interval=1.0, visibility_timeout=VISIBILITY_TIMEOUT):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def run(self, drain=False):
+        """停止されるまで（drain の場合は実行できるタスクがなくなるまで）タスクを実行する"""
+        failures = 0
+        try:
+            while not self.stopping.is_set():
+                try:
+                    tasks = self.claim()
+                except Exception:
+                    if drain:
+                        raise
+                    failures += 1
+                    delay = min(self.poll_interval * 2 ** failures, CLAIM_MAX_BACKOFF)
+                    logger.exception('タスクを取得できませんでした（%s秒後に再試行します）: %s', delay, self.worker_id)
+                    # 切断された接続は破棄し、次の取得で接続し直す
+                    connection.close()
+                    self.stopping.wait(delay)
+                    continue
+                failures = 0
+                if not tasks:
+                    if drain:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                for background_task in tasks:
+                    self.execute(background_task)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopping.set()
+
+    def claim(self):
+        """実行するタスクを取得し、実行予定日時を可視性タイムアウト後へ進める"""
+        BackgroundTask = apps.get_model('workflow', 'BackgroundTask')
+        now = timezone.now()
+        due = BackgroundTask.objects.filter(status='queued', run_at__lte=now)
+        # 最後の実行中にワーカーが停止したタスク（完了も失敗も記録されていない）は再実行しない
+        exhausted = due.filter(attempts__gte=F('max_attempts')).update(
+            status='failed', finished_at=now, locked_by='',
+            last_error='実行中にワーカーが停止しました（再試行の上限）',
+        )
+        if exhausted:
+            logger.error('実行中にワーカーが停止したタスクを失敗にしました: %s件', exhausted)
+        available = due.filter(attempts__lt=F('max_attempts')).order_by('-priority', 'run_at')
+        claim_values = {
+            'run_at': now + timedelta(seconds=self.visibility_timeout),
+            'attempts': F('attempts') + 1,
+            'locked_by': self.worker_id,
+        }
+
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                ids = list(available.select_for_update(skip_locked=True).values_list('id', flat=True)[:self.batch_size])
+                if ids:
+                    BackgroundTask.objects.filter(id__in=ids).update(**claim_values)
+        else:
+            # 他のワーカーが先に取得したタスクは run_at が変わっているため更新件数が0になる
+            ids = [
+                task_id for task_id, run_at in available.values_list('id', 'run_at')[:self.batch_size]
+                if BackgroundTask.objects.filter(id=task_id, status='queued', run_at=run_at).update(**claim_values)
+            ]
+
+        if not ids:
+            return []
+        return list(BackgroundTask.objects.filter(id__in=ids).order_by('-priority', 'run_at'))
+
+    def execute(self, background_task):
+        BackgroundTask = apps.get_model('workflow', 'BackgroundTask')
+        # 可視性タイムアウト後に別のワーカーが取得し直した場合は、結果を書き込まない
+        claimed = BackgroundTask.objects.filter(
+            id=background_task.id, locked_by=self.worker_id, attempts=background_task.attempts
+        )
+        try:
+            func = get_task(background_task.name)
+            func(*background_task.args, **background_task.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if background_task.attempts >= background_task.max_attempts:
+                logger.error('タスクが失敗しました（再試行の上限）: %s #%s', background_task.name, background_task.id)
+                claimed.update(status='failed', last_error=error, finished_at=timezone.now(), locked_by='')
+            else:
+                logger.warning('タスクが失敗したため再試行します: %s #%s', background_task.name, background_task.id)
+                claimed.update(
+                    last_error=error, locked_by='',
+                    run_at=timezone.now() + timedelta(seconds=retry_delay(background_task.attempts)),
+                )
+        else:
+            claimed.update(status='done', finished_at=timezone.now(), locked_by='')
+        self.processed += 1
+
+
+def purge_finished_tasks(days=FINISHED_RETENTION_DAYS):
+    """終了してから days 日以上たった完了タスクを削除する（失敗したタスクは調査用に残す）"""
+    BackgroundTask = apps.get_model('workflow', 'BackgroundTask')
+    deleted, _ = BackgroundTask.objects.filter(
+        status='done', finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# タスク
+# ---------------------------------------------------------------------------
+
+@task()
+def send_email(subject, message, recipient_list):
+    """メールを送信する（失敗時はキューの再試行に任せる）"""
+    with track_email('task'):
+        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
+
+
+@task()
+def noop(*args, **kwargs):
+    """何もしないタスク（ベンチマーク・動作確認用）"""
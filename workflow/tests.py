@@ -1,3 +1,1610 @@
-from django.test import TestCase
+"""
+業務ワークフローシステムのテスト
+"""
+import asyncio
+import csv
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, connection, connections, models, transaction
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from .async_views import (
+    AsyncApplicationDetailView, AsyncDashboardView, AsyncPendingApproveView, AsyncPendingReceiveView
+)
+from .audit import diff_fields, replay_application
+from . import caching, db_routing
+from .caching import routing_cache
+from .db_routing import replica_reads
+from .escalation import escalate
+from .events import LocalBroker
+from .importer import ApplicationImporter
+from .metrics import MetricsRegistry, registry
+from .models import (
+    Application, ApplicationEntryMember, ApplicationStatusCount, ApplicationTool, ApplicationTypeConfig, Attachment,
+    AuditEvent, BacklogSnapshot, BackgroundTask, Comment, LeadTimeRollup, MetricCounter, PendingNotification,
+    RequestProfile, RoleMember, SLACheckpoint, SLAEscalation, UserProfile, WorkflowRole, WorkflowStep,
+    adjust_status_counts, rebuild_status_counts
+)
+from .notifications import DIGEST_HOUR, UNREAD_CACHE_KEY, digest_cutoff, notify, send_digests, unread_count
+from .occupancy import IntervalTree, attach_conflicts, occupying_applications
+from .profiling import load_data, prune_profiles, query_summary
+from .reporting import refresh_lead_times, snapshot_backlog
+from .rows import application_rows, make_rows
+from .tasks import Worker, enqueue, retry_delay, task
+from .user_context import get_user_context
+from .views import get_pending_receive_queryset
+
+
+class AuditLogTests(TestCase):
+    """監査ログ（差分・再生・セーブポイントのロールバック・一括更新・CASCADE による削除）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.role = WorkflowRole.objects.create(name='受付係', role_type='receiver')
+
+    def create_application(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Application.objects.create(
+                application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先'
+            )
+
+    def event_types(self, **filters):
+        return list(AuditEvent.objects.filter(**filters).order_by('id').values_list('event_type', flat=True))
+
+    def test_diff_fields(self):
+        application = Application.objects.get(pk=self.create_application().pk)
+        application.title = '変更後'
+        application.status = 'submitted'
+        self.assertEqual(
+            diff_fields(application._loaded_values, application, ['title', 'status', 'company_name']),
+            {'title': ['作業申請', '変更後'], 'status': ['draft', 'submitted']}
+        )
+
+        # 遅延ロードしたフィールドは比較しない
+        deferred = Application.objects.only('id', 'status').get(pk=application.pk)
+        self.assertEqual(diff_fields(deferred._loaded_values, deferred, ['title', 'status']), {})
+
+    def test_replay_application(self):
+        application = self.create_application()
+        created_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            application.status = 'submitted'
+            application.save()
+            application.title = '変更後'
+            application.save()
+        updated_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Application.objects.get(pk=application.pk).delete()
+
+        pk = application.pk
+        self.assertEqual(self.event_types(application_id=pk), ['create', 'transition', 'update', 'delete'])
+        self.assertEqual(replay_application(pk, at=created_at)['status'], 'draft')
+        state = replay_application(pk, at=updated_at)
+        self.assertEqual((state['status'], state['title']), ('submitted', '変更後'))
+        self.assertIsNone(replay_application(pk))
+
+    def test_rolled_back_savepoint_is_not_recorded(self):
+        application = self.create_application()
+        with self.captureOnCommitCallbacks(execute=True):
+            application.status = 'submitted'
+            application.save()
+            try:
+                with transaction.atomic():
+                    application.title = '取り消す変更'
+                    application.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            member = RoleMember.objects.create(role=self.role, user=self.vendor)
+        self.assertEqual(self.event_types(application_id=application.pk), ['create', 'transition'])
+        self.assertEqual(self.event_types(target_model='rolemember', target_id=member.pk), ['role_assign'])
+
+    def test_saving_same_instance_twice_records_once(self):
+        admin = User.objects.create_user('admin_user')
+        with self.captureOnCommitCallbacks(execute=True):
+            member = RoleMember.objects.create(role=self.role, user=self.vendor)
+        member = RoleMember.objects.get(pk=member.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            member.assigned_by = admin
+            member.save()
+            member.save()
+        self.assertEqual(self.event_types(target_model='rolemember'), ['role_assign', 'role_update'])
+
+    def test_bulk_update_and_cascade_delete(self):
+        application = self.create_application()
+        with self.captureOnCommitCallbacks(execute=True):
+            member = RoleMember.objects.create(role=self.role, user=self.vendor)
+            self.assertEqual(Application.objects.filter(applicant=self.vendor).update(status='submitted'), 1)
+        event = AuditEvent.objects.get(application_id=application.pk, event_type='transition')
+        self.assertEqual(event.changes, {'status': ['draft', 'submitted']})
+
+        # ユーザーの削除による CASCADE も1件ずつ記録する
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.delete()
+        self.assertEqual(self.event_types(application_id=application.pk), ['create', 'transition', 'delete'])
+        self.assertEqual(
+            self.event_types(target_model='rolemember', target_id=member.pk), ['role_assign', 'role_unassign']
+        )
+        self.assertIsNone(replay_application(application.pk))
+
+
+class QueueEventTests(TestCase):
+    """キューイベントの配信（コミット後のみ配信・プロセス内の購読者への配信）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.broker = LocalBroker()
+        patcher = mock.patch('workflow.events.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def subscribe(self, *channels):
+        queue = asyncio.Queue()
+        self.broker.subscribe(channels, self.loop, queue)
+        return queue
+
+    def received(self, queue):
+        # call_soon_threadsafe で登録された put_nowait を実行する
+        self.loop.run_until_complete(asyncio.sleep(0))
+        messages = []
+        while not queue.empty():
+            messages.append(queue.get_nowait())
+        return messages
+
+    def test_local_broker_fan_out(self):
+        first = self.subscribe('receive:work')
+        second = self.subscribe('receive:work', 'approve:work')
+        other = self.subscribe('receive:material')
+        self.broker.publish('receive:work', {'event': 'new_item'})
+        self.assertEqual(self.received(first), [{'event': 'new_item'}])
+        self.assertEqual(self.received(second), [{'event': 'new_item'}])
+        self.assertEqual(self.received(other), [])
+
+        self.broker.unsubscribe(self.loop, second)
+        self.broker.publish('approve:work', {'event': 'new_item'})
+        self.assertEqual(self.received(second), [])
+
+    def test_only_committed_transitions_are_published(self):
+        queue = self.subscribe('receive:work')
+        application = Application.objects.create(
+            application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    application.status = 'submitted'
+                    application.save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.received(queue), [])
+
+        application = Application.objects.get(pk=application.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            application.status = 'submitted'
+            application.save()
+        messages = self.received(queue)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(
+            (messages[0]['event'], messages[0]['application_id'], messages[0]['delta']),
+            ('new_item', application.pk, 1)
+        )
+
+
+@override_settings(ROOT_URLCONF='config.urls_asgi')
+class AsyncViewTests(TestCase):
+    """非同期ビュー（ログインへのリダイレクト・役割による403・存在しないページの404）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.other_vendor = User.objects.create_user('other_vendor', 'other@example.com', 'password')
+        UserProfile.objects.create(user=cls.other_vendor, role='vendor', company_name='別の取引先')
+        cls.receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        UserProfile.objects.create(user=cls.receiver, role='receiver', company_name='本社')
+        cls.approver = User.objects.create_user('approver', 'approver@example.com', 'password')
+        UserProfile.objects.create(user=cls.approver, role='approver', company_name='本社')
+
+        receiver_role = WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+        approver_role = WorkflowRole.objects.create(name='一般承認', role_type='approver')
+        RoleMember.objects.create(role=receiver_role, user=cls.receiver)
+        RoleMember.objects.create(role=approver_role, user=cls.approver)
+        ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=receiver_role, approver_role=approver_role
+        )
+        cls.application = Application.objects.create(
+            application_type='work', title='作業申請', status='submitted', applicant=cls.vendor,
+            company_name='取引先', submitted_at=timezone.now()
+        )
+        cls.draft = Application.objects.create(
+            application_type='work', title='下書き', applicant=cls.vendor, company_name='取引先'
+        )
+
+    def setUp(self):
+        routing_cache.invalidate_all()
+
+    async def login(self, user):
+        await sync_to_async(self.async_client.force_login)(user)
+
+    def test_routes_use_async_views(self):
+        for name, view_class in [
+            ('dashboard', AsyncDashboardView), ('pending_receive', AsyncPendingReceiveView),
+            ('pending_approve', AsyncPendingApproveView),
+        ]:
+            self.assertIs(resolve(reverse(f'workflow:{name}')).func.view_class, view_class)
+        detail = reverse('workflow:detail', args=[self.application.pk])
+        self.assertIs(resolve(detail).func.view_class, AsyncApplicationDetailView)
+
+    async def test_login_required(self):
+        for url in [
+            reverse('workflow:dashboard'), reverse('workflow:detail', args=[self.application.pk]),
+            reverse('workflow:pending_receive'), reverse('workflow:pending_approve'),
+        ]:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+    async def test_dashboard(self):
+        await self.login(self.vendor)
+        response = await self.async_client.get(reverse('workflow:dashboard'))
+        self.assertContains(response, self.application.application_number)
+        for page in ['2', 'abc', '0']:
+            response = await self.async_client.get(reverse('workflow:dashboard'), {'page': page})
+            self.assertEqual(response.status_code, 404)
+
+    async def test_detail(self):
+        # 他の取引先の下書きは閲覧できない
+        await self.login(self.other_vendor)
+        response = await self.async_client.get(reverse('workflow:detail', args=[self.draft.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        await self.login(self.vendor)
+        response = await self.async_client.get(reverse('workflow:detail', args=[self.draft.pk]))
+        self.assertContains(response, self.draft.application_number)
+        response = await self.async_client.get(reverse('workflow:detail', args=[self.draft.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_pending_receive(self):
+        await self.login(self.vendor)
+        response = await self.async_client.get(reverse('workflow:pending_receive'))
+        self.assertEqual(response.status_code, 403)
+
+        await self.login(self.receiver)
+        response = await self.async_client.get(reverse('workflow:pending_receive'))
+        self.assertContains(response, self.application.application_number)
+        response = await self.async_client.get(reverse('workflow:pending_receive'), {'page': '2'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_pending_approve(self):
+        await self.login(self.receiver)
+        response = await self.async_client.get(reverse('workflow:pending_approve'))
+        self.assertEqual(response.status_code, 403)
+
+        await self.login(self.approver)
+        response = await self.async_client.get(reverse('workflow:pending_approve'))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('workflow:pending_approve'), {'page': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ApplicationAPITests(TestCase):
+    """JSON API（スパースフィールドセット・カーソルページネーション・ETag・キューの権限）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        UserProfile.objects.create(user=cls.receiver, role='receiver', company_name='本社')
+        receiver_role = WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+        approver_role = WorkflowRole.objects.create(name='一般承認', role_type='approver')
+        RoleMember.objects.create(role=receiver_role, user=cls.receiver)
+        ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=receiver_role, approver_role=approver_role
+        )
+
+        cls.applications = [
+            Application.objects.create(
+                application_type='work', title=f'作業申請{index}', status='submitted', applicant=cls.vendor,
+                company_name='取引先', content='申請内容', submitted_at=timezone.now()
+            )
+            for index in range(5)
+        ]
+
+    def setUp(self):
+        routing_cache.invalidate_all()
+
+    def get(self, url, params=None, **headers):
+        return self.client.get(url, params or {}, **headers)
+
+    def test_sparse_fields(self):
+        self.client.force_login(self.vendor)
+        url = reverse('workflow:api_applications')
+        content_column = connection.ops.quote_name(Application._meta.get_field('content').column)
+        with CaptureQueriesContext(connection) as context:
+            results = self.get(url, {'fields': 'application_number,status'}).json()['results']
+        self.assertEqual(set(results[0]), {'application_number', 'status'})
+        for query in context.captured_queries:
+            self.assertNotIn(content_column, query['sql'])
+            self.assertNotIn('DISTINCT', query['sql'])
+
+        # 既定では大きなテキスト項目を返さない。指定すれば返す
+        self.assertNotIn('content', self.get(url).json()['results'][0])
+        self.assertEqual(self.get(url, {'fields': 'content'}).json()['results'][0], {'content': '申請内容'})
+
+        response = self.get(url, {'fields': 'title,unknown'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('unknown', response.json()['error'])
+
+    def test_cursor_pagination(self):
+        self.client.force_login(self.vendor)
+        url = reverse('workflow:api_applications')
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {'fields': 'id', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.get(url, params).json()
+            ids += [item['id'] for item in data['results']]
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [application.pk for application in reversed(self.applications)])
+
+        response = self.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'カーソルが不正です。'})
+
+    def test_etag(self):
+        self.client.force_login(self.vendor)
+        url = reverse('workflow:api_applications')
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # フィールドの指定が違えば別のETag
+        self.assertNotEqual(self.get(url, {'fields': 'id'})['ETag'], etag)
+
+        application = self.applications[-1]
+        application.title = '変更後'
+        application.save()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        detail_url = reverse('workflow:api_application_detail', args=[application.pk])
+        etag = self.get(detail_url)['ETag']
+        self.assertEqual(self.get(detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_queue_permissions(self):
+        url = reverse('workflow:api_queue_receive')
+        self.assertEqual(self.get(url).status_code, 401)
+
+        self.client.force_login(self.vendor)
+        response = self.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('ETag', response)
+
+        self.client.force_login(self.receiver)
+        results = self.get(url, {'fields': 'id'}).json()['results']
+        self.assertEqual([item['id'] for item in results], [application.pk for application in self.applications])
+
+
+class ImporterNumberRetryTests(TestCase):
+    """一括取込の申請番号の衝突（採番し直す）と、その他の制約違反（再試行しない）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def row(self, **values):
+        return dict({'application_type': 'work', 'title': '一括取込', 'content': ''}, **values)
+
+    def test_number_collision_is_retried(self):
+        taken = Application.objects.create(
+            application_type='work', title='既存', applicant=self.vendor, company_name='取引先'
+        ).application_number
+        allocate = Application.allocate_application_numbers
+        with mock.patch.object(
+            Application, 'allocate_application_numbers', side_effect=[[taken], allocate(1)]
+        ) as allocate_numbers:
+            created = ApplicationImporter(self.vendor)._insert_chunk([self.row()])
+        self.assertEqual(allocate_numbers.call_count, 2)
+        self.assertNotEqual(created[0].application_number, taken)
+
+    def test_other_integrity_errors_are_raised(self):
+        importer = ApplicationImporter(self.vendor)
+        with mock.patch.object(
+            Application, 'allocate_application_numbers', wraps=Application.allocate_application_numbers
+        ) as allocate_numbers:
+            with self.assertRaises(IntegrityError):
+                importer._insert_chunk([self.row(title=None)])
+        self.assertEqual(allocate_numbers.call_count, 1)
+
+
+class ImportViewPermissionTests(TestCase):
+    """一括取込の画面は申請者（取引先）と管理者のみ"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        UserProfile.objects.create(user=cls.receiver, role='receiver', company_name='本社')
+
+    def test_only_vendors_and_admins_can_import(self):
+        url = reverse('workflow:import')
+        self.client.force_login(self.receiver)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        upload = SimpleUploadedFile('import.csv', 'application_type,title\nwork,一括取込\n'.encode('utf-8'))
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+        self.assertFalse(Application.objects.exists())
+        self.assertNotContains(self.client.get(reverse('workflow:dashboard')), url)
+
+        self.client.force_login(self.vendor)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertContains(self.client.get(reverse('workflow:dashboard')), url)
+
+
+class LineItemSyncTests(TestCase):
+    """持込工具・立入者の子テーブルの同期（save()・QuerySet.update()・遅延ロードしたインスタンス）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def setUp(self):
+        self.application = Application.objects.create(
+            application_type='tool_bringin', title='工具持込', applicant=self.vendor, company_name='取引先',
+            work_start_date=date(2026, 11, 2), tool_list='インパクトドライバー\n脚立',
+            entry_members='山田太郎（協力会社）',
+        )
+
+    def items(self):
+        return sorted(
+            (item.name, item.status, item.start_date, item.end_date)
+            for item in ApplicationTool.objects.filter(application=self.application)
+        )
+
+    def test_deferred_save_updates_copies_without_rebuilding(self):
+        tool_ids = set(ApplicationTool.objects.values_list('id', flat=True))
+        application = Application.objects.only('id', 'status', 'application_type').get(pk=self.application.pk)
+        application.status = 'submitted'
+        with CaptureQueriesContext(connection) as context:
+            application.save()
+        tool_list_column = connection.ops.quote_name(Application._meta.get_field('tool_list').column)
+        self.assertFalse([query for query in context.captured_queries if tool_list_column in query['sql']])
+        self.assertEqual(set(ApplicationTool.objects.values_list('id', flat=True)), tool_ids)
+        self.assertEqual(set(ApplicationTool.objects.values_list('status', flat=True)), {'submitted'})
+
+    def test_queryset_update_copies_status_and_dates(self):
+        tool_ids = set(ApplicationTool.objects.values_list('id', flat=True))
+        Application.objects.filter(pk=self.application.pk).update(status='submitted', work_end_date=date(2026, 11, 4))
+        self.assertEqual(set(ApplicationTool.objects.values_list('id', flat=True)), tool_ids)
+        self.assertEqual(self.items(), [
+            ('インパクトドライバー', 'submitted', date(2026, 11, 2), date(2026, 11, 4)),
+            ('脚立', 'submitted', date(2026, 11, 2), date(2026, 11, 4)),
+        ])
+        self.assertEqual(
+            list(ApplicationEntryMember.objects.values_list('name', 'status', 'end_date')),
+            [('山田太郎', 'submitted', date(2026, 11, 4))]
+        )
+
+    def test_queryset_update_rebuilds_changed_lists(self):
+        Application.objects.filter(pk=self.application.pk).update(tool_list='高所作業車')
+        self.assertEqual(self.items(), [('高所作業車', 'draft', date(2026, 11, 2), date(2026, 11, 2))])
+        self.assertEqual(ApplicationEntryMember.objects.count(), 1)
+
+
+class OccupancyTests(TestCase):
+    """作業場所の期間の重複（区間木・占有中の申請の検索・受付待ち一覧の重複表示）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def create(self, start, end=None, status='approved', location='A棟', application_type='work'):
+        return Application.objects.create(
+            application_type=application_type, title='作業申請', status=status, applicant=self.vendor,
+            company_name='取引先', work_location=location, work_start_date=start, work_end_date=end,
+            submitted_at=timezone.now()
+        )
+
+    def test_interval_tree_boundaries(self):
+        tree = IntervalTree([(1, 3, 'a'), (3, 5, 'b'), (7, 7, 'c'), (2, 9, 'd')])
+        # 両端を含む: 終了日・開始日が一致するだけでも重なる
+        self.assertEqual(sorted(tree.query(3, 3)), ['a', 'b', 'd'])
+        self.assertEqual(sorted(tree.query(5, 6)), ['b', 'd'])
+        self.assertEqual(sorted(tree.query(7, 7)), ['c', 'd'])
+        # 隣接するだけの区間は重ならない
+        self.assertEqual(sorted(tree.query(10, 12)), [])
+        self.assertEqual(sorted(tree.query(0, 0)), [])
+        self.assertEqual(IntervalTree([]).query(1, 2), [])
+
+    def test_interval_tree_matches_linear_scan(self):
+        rng = random.Random(0)
+        intervals = []
+        for index in range(200):
+            start = rng.randint(0, 100)
+            intervals.append((start, start + rng.randint(0, 10), index))
+        tree = IntervalTree(intervals)
+        for _ in range(200):
+            start = rng.randint(-5, 115)
+            end = start + rng.randint(0, 15)
+            expected = sorted(value for lower, upper, value in intervals if lower <= end and upper >= start)
+            self.assertEqual(sorted(tree.query(start, end)), expected)
+
+    def test_occupying_applications(self):
+        one_day = self.create(date(2026, 11, 10))
+        touching = self.create(date(2026, 11, 1), date(2026, 11, 5))
+        self.create(date(2026, 10, 1), date(2026, 10, 31))
+        self.create(date(2026, 11, 5), date(2026, 11, 6), status='submitted')
+        self.create(date(2026, 11, 5), date(2026, 11, 6), location='B棟')
+        self.create(date(2026, 11, 5), date(2026, 11, 6), application_type='tool_bringin')
+
+        # PostgreSQL では daterange の重なり、その他のDBでは開始日・終了日の比較で検索する
+        found = occupying_applications(['A棟'], date(2026, 11, 5), date(2026, 11, 10))
+        self.assertEqual([application.pk for application in found], [touching.pk, one_day.pk])
+        self.assertFalse(occupying_applications(['A棟'], date(2026, 11, 11), date(2026, 11, 30)).exists())
+
+    def test_attach_conflicts_on_pending_receive_rows(self):
+        booking = self.create(date(2026, 11, 1), date(2026, 11, 5), status='received')
+        self.create(date(2026, 11, 6), date(2026, 11, 8))
+        overlapping = self.create(date(2026, 11, 5), date(2026, 11, 7), status='submitted')
+        separate = self.create(date(2026, 11, 9), status='submitted')
+        other_location = self.create(date(2026, 11, 1), status='submitted', location='B棟')
+
+        admin = User.objects.create_user('admin_user')
+        UserProfile.objects.create(user=admin, role='admin')
+        rows = attach_conflicts(make_rows(application_rows(get_pending_receive_queryset(admin))))
+        conflicts = {row.pk: [application.pk for application in row.conflicts] for row in rows}
+        self.assertEqual(conflicts[overlapping.pk][0], booking.pk)
+        self.assertEqual(len(conflicts[overlapping.pk]), 2)
+        self.assertEqual(conflicts[separate.pk], [])
+        self.assertEqual(conflicts[other_location.pk], [])
+
+
+class SharedCacheRecomputeTests(TestCase):
+    """共有キャッシュの再計算（同時のミスで1回だけ計算・再計算中は古い値・待ち時間の上限）"""
+    key = 'recompute_test'
+
+    def setUp(self):
+        cache.delete_many([self.key, f'{self.key}:lock'])
+        self.addCleanup(cache.delete_many, [self.key, f'{self.key}:lock'])
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        started = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def worker(results):
+            started.wait()
+            results.append(caching.get_or_compute(self.key, compute, 60))
+
+        results = []
+        threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+    def test_stale_value_is_served_while_recomputing(self):
+        cache.set(self.key, ('old', time.time() - 1), 60)
+        compute = mock.Mock(return_value='new')
+
+        # 他のワーカーが再計算中（ロックを保持している）
+        self.assertTrue(caching._acquire(self.key, self.key))
+        try:
+            self.assertEqual(caching.get_or_compute(self.key, compute, 60), 'old')
+            compute.assert_not_called()
+        finally:
+            cache.delete(f'{self.key}:lock')
+            caching._process_locks[self.key].release()
+
+        self.assertEqual(caching.get_or_compute(self.key, compute, 60), 'new')
+        self.assertEqual(caching.get_or_compute(self.key, compute, 60), 'new')
+        compute.assert_called_once()
+
+    def test_waiter_computes_after_timeout_without_storing(self):
+        cache.add(f'{self.key}:lock', 1, caching.LOCK_TIMEOUT)
+        with mock.patch.object(caching, 'LOCK_WAIT', 0.1):
+            started = time.monotonic()
+            self.assertEqual(caching.get_or_compute(self.key, lambda: 'computed', 60), 'computed')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertIsNone(cache.get(self.key))
+
+
+class RoutingCacheLockTests(TestCase):
+    """プロセス内の再計算ロックがキャッシュのバージョンごとに増えないこと"""
+
+    def test_process_locks_are_not_versioned(self):
+        for value in range(3):
+            routing_cache.invalidate_all()
+            self.assertEqual(routing_cache.get_or_compute('lock_test', lambda: value, 60), value)
+        self.assertIn('lock_test', caching._process_locks)
+        self.assertFalse([name for name in caching._process_locks if name.startswith('lock_test_v')])
+
+
+# default のテストDBを指すレプリカの別名（ReplicaRoutingTests の間だけ追加する）
+REPLICA_ALIAS = 'replica_test'
+
+
+@replica_reads
+def replica_read_view(request):
+    """読み取り先のDBの別名と件数を返す（POST では書き込みも行う）"""
+    if request.method == 'POST':
+        WorkflowRole.objects.create(name='追加', role_type='receiver')
+    roles = WorkflowRole.objects.all()
+    return HttpResponse(f'{roles.db}:{roles.count()}')
+
+
+def primary_read_view(request):
+    roles = WorkflowRole.objects.all()
+    return HttpResponse(f'{roles.db}:{roles.count()}')
+
+
+# ReplicaRoutingTests のURL設定（ROOT_URLCONF='workflow.tests'。ミドルウェアが参照する管理画面などを含める）
+urlpatterns = [
+    path('replica/', replica_read_view),
+    path('primary/', primary_read_view),
+    path('', include('config.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='workflow.tests', DATABASE_REPLICAS=[REPLICA_ALIAS])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    読み取り専用レプリカへの振り分け（@replica_reads・POST・書き込み後の固定・レプリカの障害）
+
+    DB_REPLICA_HOSTS で追加する別名と同じく TEST の MIRROR で default のテストDBを指す別名を使う。
+    別の接続から読めるよう、データをコミットする TransactionTestCase にする。
+    """
+    # テストランナーが作成するDBは default のみ。レプリカの別名はクラスの開始時に追加する
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        settings_dict = connections['default'].settings_dict
+        connections.settings[REPLICA_ALIAS] = {**settings_dict, 'TEST': {**settings_dict['TEST'], 'MIRROR': 'default'}}
+        cls.addClassCleanup(cls.remove_replica)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+
+    def setUp(self):
+        db_routing.health.reset()
+        self.addCleanup(db_routing.health.reset)
+        WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+
+    def test_marked_get_reads_from_replica(self):
+        self.assertEqual(self.client.get('/replica/').content, f'{REPLICA_ALIAS}:1'.encode())
+        self.assertEqual(self.client.get('/primary/').content, b'default:1')
+
+    def test_post_reads_primary_and_pins_next_requests(self):
+        response = self.client.post('/replica/')
+        self.assertEqual(response.content, b'default:2')
+        self.assertIn(db_routing.PIN_COOKIE, response.cookies)
+
+        # 書き込み後のリクエストは Cookie の期限までプライマリから読む
+        self.assertEqual(self.client.get('/replica/').content, b'default:2')
+        self.client.cookies[db_routing.PIN_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.client.get('/replica/').content, f'{REPLICA_ALIAS}:2'.encode())
+
+    def test_unusable_replica_falls_back_to_primary(self):
+        with mock.patch.object(db_routing, 'measure_lag', side_effect=DatabaseError('接続できません')):
+            with self.assertLogs('workflow.db_routing', 'WARNING'):
+                self.assertEqual(self.client.get('/replica/').content, b'default:1')
+
+        db_routing.health.reset()
+        with override_settings(REPLICA_MAX_LAG=5), mock.patch.object(db_routing, 'measure_lag', return_value=30.0):
+            with self.assertLogs('workflow.db_routing', 'WARNING'):
+                self.assertEqual(self.client.get('/replica/').content, b'default:1')
+
+        db_routing.health.reset()
+        self.assertEqual(self.client.get('/replica/').content, f'{REPLICA_ALIAS}:1'.encode())
+
+
+class ReportRollupTests(TestCase):
+    """リードタイムの日次集計（期間の作り直し・LAGによる直前ステップ）と滞留スナップショット"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        receiver_role = WorkflowRole.objects.create(name='受付係', role_type='receiver')
+        approver_role = WorkflowRole.objects.create(name='承認係', role_type='approver')
+        ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=receiver_role, approver_role=approver_role
+        )
+
+        # 申請 09:00 → 受付 11:00（2時間）→ 翌日 10:00 承認（23時間、通算25時間）
+        cls.history(
+            'approved', ('submit', 1, 9), ('receive', 1, 11), ('approve', 2, 10)
+        )
+        # 差し戻し後の再申請 13:00 → 受付 14:00（1時間）→ 2日後 14:00 承認（48時間、通算49時間）
+        cls.history(
+            'approved', ('submit', 1, 9), ('return', 1, 10), ('submit', 1, 13), ('receive', 1, 14), ('approve', 3, 14)
+        )
+
+    @classmethod
+    def history(cls, status, *steps):
+        application = Application.objects.create(
+            application_type='work', title='作業申請', applicant=cls.vendor, company_name='取引先', status=status
+        )
+        for step_type, day, hour in steps:
+            WorkflowStep.objects.create(
+                application=application, step_type=step_type, status='completed', processed_at=local_time(2026, 4, day, hour)
+            )
+        return application
+
+    def rollups(self):
+        return {
+            (rollup.date.day, rollup.stage): (rollup.role_name, rollup.count, rollup.total_seconds / 3600,
+                                              rollup.max_seconds / 3600, rollup.histogram)
+            for rollup in LeadTimeRollup.objects.all()
+        }
+
+    def test_lead_times_from_previous_steps(self):
+        self.assertEqual(refresh_lead_times(date(2026, 4, 1), date(2026, 4, 3)), 5)
+
+        self.assertEqual(self.rollups(), {
+            (1, 'receive'): ('受付係', 2, 3.0, 2.0, [1, 1, 0, 0, 0, 0]),
+            (2, 'approve'): ('承認係', 1, 23.0, 23.0, [0, 0, 1, 0, 0, 0]),
+            (2, 'total'): ('承認係', 1, 25.0, 25.0, [0, 0, 0, 1, 0, 0]),
+            (3, 'approve'): ('承認係', 1, 48.0, 48.0, [0, 0, 0, 1, 0, 0]),
+            (3, 'total'): ('承認係', 1, 49.0, 49.0, [0, 0, 0, 1, 0, 0]),
+        })
+
+    def test_rebuild_replaces_only_the_range(self):
+        kept = LeadTimeRollup.objects.create(
+            date=date(2026, 3, 31), stage='receive', application_type='work', company_name='取引先', count=7
+        )
+        LeadTimeRollup.objects.create(
+            date=date(2026, 4, 1), stage='receive', application_type='work', company_name='削除済みの企業', count=9
+        )
+
+        # 承認の完了（4/3）は期間外。期間内の受付の前のステップは期間外でも読む
+        self.assertEqual(refresh_lead_times(date(2026, 4, 1), date(2026, 4, 2)), 3)
+        self.assertEqual(set(self.rollups()), {(31, 'receive'), (1, 'receive'), (2, 'approve'), (2, 'total')})
+        self.assertEqual(LeadTimeRollup.objects.get(pk=kept.pk).count, 7)
+        self.assertEqual(self.rollups()[(1, 'receive')][1], 2)
+
+        # 同じ期間を作り直しても重複しない
+        self.assertEqual(refresh_lead_times(date(2026, 4, 1), date(2026, 4, 2)), 3)
+        self.assertEqual(LeadTimeRollup.objects.count(), 4)
+
+    def test_backlog_snapshot(self):
+        now = local_time(2026, 4, 3, 18)
+        for hours in (2, 30):
+            Application.objects.create(
+                application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先',
+                status='submitted', submitted_at=now - timedelta(hours=hours)
+            )
+        Application.objects.create(
+            application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先',
+            status='received', submitted_at=now - timedelta(hours=10), received_at=now - timedelta(hours=5)
+        )
+
+        self.assertEqual(snapshot_backlog(now), 2)
+        snapshots = {
+            snapshot.queue: (snapshot.date, snapshot.role_name, snapshot.count, snapshot.total_seconds / 3600,
+                             snapshot.max_seconds / 3600, snapshot.histogram)
+            for snapshot in BacklogSnapshot.objects.all()
+        }
+        self.assertEqual(snapshots, {
+            'receive': (date(2026, 4, 3), '受付係', 2, 32.0, 30.0, [0, 1, 0, 1, 0, 0]),
+            'approve': (date(2026, 4, 3), '承認係', 1, 5.0, 5.0, [0, 0, 1, 0, 0, 0]),
+        })
+
+        # 同じ日のスナップショットは置き換える
+        Application.objects.filter(status='received').update(status='approved')
+        self.assertEqual(snapshot_backlog(now + timedelta(hours=1)), 1)
+        self.assertEqual(list(BacklogSnapshot.objects.values_list('queue', 'count')), [('receive', 2)])
+
+
+@task(name='workflow.tests.failing_task')
+def failing_task():
+    raise RuntimeError('失敗')
+
+
+class BackgroundTaskWorkerTests(TestCase):
+    """タスクの取得（SKIP LOCKED のないDBの経路）・再試行・停止したワーカーの扱い"""
+
+    def enqueue(self, func='workflow.tasks.noop', **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue(func, **kwargs)
+        return BackgroundTask.objects.latest('id')
+
+    def test_claim_hides_task_from_other_workers(self):
+        background_task = self.enqueue()
+        worker = Worker('worker-1', visibility_timeout=60)
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            claimed = worker.claim()
+            self.assertEqual([item.pk for item in claimed], [background_task.pk])
+            self.assertEqual((claimed[0].attempts, claimed[0].locked_by), (1, 'worker-1'))
+            self.assertGreater(claimed[0].run_at, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(Worker('worker-2').claim(), [])
+
+        worker.execute(claimed[0])
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.locked_by), ('done', ''))
+
+    def test_failed_task_is_retried_with_backoff(self):
+        background_task = self.enqueue('workflow.tests.failing_task', max_attempts=2)
+        worker = Worker('worker-1')
+        with self.assertLogs('workflow.tasks', 'WARNING'):
+            worker.execute(worker.claim()[0])
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.attempts), ('queued', 1))
+        self.assertIn('RuntimeError', background_task.last_error)
+        self.assertAlmostEqual(
+            (background_task.run_at - timezone.now()).total_seconds(), retry_delay(1), delta=5
+        )
+
+        BackgroundTask.objects.filter(pk=background_task.pk).update(run_at=timezone.now())
+        with self.assertLogs('workflow.tasks', 'ERROR'):
+            worker.execute(worker.claim()[0])
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.attempts), ('failed', 2))
+
+    def test_stale_worker_does_not_overwrite_result(self):
+        background_task = self.enqueue()
+        claimed = Worker('worker-1', visibility_timeout=0).claim()[0]
+        # 可視性タイムアウト後に別のワーカーが取得し直した
+        reclaimed = Worker('worker-2').claim()[0]
+        Worker('worker-1').execute(claimed)
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.locked_by), ('queued', 'worker-2'))
+
+        Worker('worker-2').execute(reclaimed)
+        background_task.refresh_from_db()
+        self.assertEqual(background_task.status, 'done')
+
+    def test_task_that_killed_its_worker_is_failed(self):
+        background_task = self.enqueue(max_attempts=1)
+        Worker('worker-1', visibility_timeout=0).claim()
+        # worker-1 は実行中に停止した（完了も失敗も記録されない）
+        with self.assertLogs('workflow.tasks', 'ERROR'):
+            self.assertEqual(Worker('worker-2').claim(), [])
+        background_task.refresh_from_db()
+        self.assertEqual((background_task.status, background_task.attempts), ('failed', 1))
+
+    def test_run_survives_claim_errors(self):
+        worker = Worker('worker-1', poll_interval=0)
+        calls = []
+
+        def claim():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('接続が切断されました')
+            worker.stop()
+            return []
+
+        with mock.patch.object(worker, 'claim', side_effect=claim), \
+                mock.patch('workflow.tasks.connection.close'), self.assertLogs('workflow.tasks', 'ERROR'):
+            worker.run()
+        self.assertEqual(len(calls), 2)
+
+
+class SLAEscalationTests(TestCase):
+    """SLA超過の通知（同じ段階・レベルで1回だけ、バッチの境界、差し戻し後の再申請）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        receiver_role = WorkflowRole.objects.create(name='受付係', role_type='receiver')
+        approver_role = WorkflowRole.objects.create(name='承認係', role_type='approver')
+        receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        RoleMember.objects.create(role=receiver_role, user=receiver)
+        cls.config = ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=receiver_role, approver_role=approver_role,
+            receive_reminder_hours=24, receive_escalation_hours=48,
+        )
+        cls.now = timezone.now()
+
+    def submit(self, hours_ago):
+        return Application.objects.create(
+            application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先',
+            status='submitted', submitted_at=self.now - timedelta(hours=hours_ago)
+        )
+
+    def escalate(self, level=1, batch_size=1000, now=None):
+        deadline = (now or self.now) - timedelta(hours=24 * level)
+        return escalate(self.config, 'receive', level, deadline, batch_size)
+
+    def test_each_level_is_notified_once(self):
+        self.submit(hours_ago=30)
+        self.submit(hours_ago=50)
+        self.submit(hours_ago=1)
+
+        self.assertEqual(self.escalate(), 2)
+        self.assertEqual(self.escalate(), 0)
+        self.assertEqual(self.escalate(now=self.now + timedelta(minutes=1)), 0)
+        self.assertEqual(self.escalate(level=2), 1)
+        self.assertEqual(self.escalate(level=2), 0)
+        self.assertEqual(SLAEscalation.objects.filter(level=1).count(), 2)
+
+    def test_batch_boundary(self):
+        # バッチの最後と同じ申請日時の申請がバッチからはみ出す
+        first = self.submit(hours_ago=40)
+        boundary = [self.submit(hours_ago=30) for _ in range(2)]
+
+        self.assertEqual(self.escalate(batch_size=2), 2)
+        checkpoint = SLACheckpoint.objects.get(application_type='work', stage='receive', level=1)
+        self.assertEqual(checkpoint.checked_until, self.now - timedelta(hours=30))
+        self.assertEqual(self.escalate(batch_size=2), 1)
+        self.assertEqual(self.escalate(batch_size=2), 0)
+        self.assertEqual(
+            set(SLAEscalation.objects.values_list('application_id', flat=True)),
+            {first.pk, *(application.pk for application in boundary)}
+        )
+
+    def test_resubmitted_application_is_notified_again(self):
+        application = self.submit(hours_ago=30)
+        self.assertEqual(self.escalate(), 1)
+
+        application.status = 'returned'
+        application.save()
+        application.status = 'submitted'
+        application.submitted_at = self.now - timedelta(hours=2)
+        application.save()
+        self.assertEqual(self.escalate(), 0)
+
+        later = self.now + timedelta(hours=23)
+        self.assertEqual(self.escalate(now=later), 1)
+        self.assertEqual(
+            list(SLAEscalation.objects.order_by('stage_started_at').values_list('stage_started_at', flat=True)),
+            [self.now - timedelta(hours=30), self.now - timedelta(hours=2)]
+        )
+
+
+def local_time(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class NotificationDigestTests(TestCase):
+    """まとめ通知（区切りの時刻・重複キー・送信失敗時の再送）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.daily = User.objects.create_user('daily', 'daily@example.com', 'password')
+        UserProfile.objects.create(user=cls.daily, role='receiver', notification_frequency='daily')
+        cls.hourly = User.objects.create_user('hourly', 'hourly@example.com', 'password')
+        UserProfile.objects.create(user=cls.hourly, role='receiver', notification_frequency='hourly')
+
+    def pending(self, user, created_at, subject='通知', dedup_key=''):
+        return PendingNotification.objects.create(
+            recipient=user, frequency=user.profile.notification_frequency, subject=subject, message='本文',
+            dedup_key=dedup_key, created_at=created_at
+        )
+
+    def test_digest_cutoff(self):
+        self.assertEqual(digest_cutoff('hourly', local_time(2026, 10, 19, 10, 25)), local_time(2026, 10, 19, 10, 0))
+        self.assertEqual(
+            digest_cutoff('daily', local_time(2026, 10, 19, DIGEST_HOUR, 0)), local_time(2026, 10, 19, DIGEST_HOUR, 0)
+        )
+        self.assertEqual(
+            digest_cutoff('daily', local_time(2026, 10, 19, DIGEST_HOUR, 30)), local_time(2026, 10, 19, DIGEST_HOUR, 0)
+        )
+        self.assertEqual(
+            digest_cutoff('daily', local_time(2026, 10, 19, DIGEST_HOUR - 1, 59)),
+            local_time(2026, 10, 18, DIGEST_HOUR, 0)
+        )
+
+    def test_only_recipients_past_their_cutoff_are_sent(self):
+        self.pending(self.daily, local_time(2026, 10, 19, DIGEST_HOUR - 1, 0), subject='前日分')
+        self.pending(self.daily, local_time(2026, 10, 19, DIGEST_HOUR, 10), subject='区切り後')
+        self.pending(self.hourly, local_time(2026, 10, 19, DIGEST_HOUR, 20))
+
+        # 1日1回: 区切り後の通知もまとめて送る。1時間ごと: 次の区切りまで待つ
+        self.assertEqual(send_digests(now=local_time(2026, 10, 19, DIGEST_HOUR, 30)), 1)
+        self.assertEqual(mail.outbox[0].to, ['daily@example.com'])
+        self.assertIn('前日分', mail.outbox[0].body)
+        self.assertIn('区切り後', mail.outbox[0].body)
+        self.assertEqual(list(PendingNotification.objects.values_list('recipient', flat=True)), [self.hourly.pk])
+
+        self.assertEqual(send_digests(now=local_time(2026, 10, 19, DIGEST_HOUR + 1, 0)), 1)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_dedup_key_keeps_first_notification(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.daily], '申請1を受け付けました', '本文', dedup_key='received:1')
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.daily], '申請1を受け付けました（再送）', '本文', dedup_key='received:1')
+            notify([self.daily], 'キーなし', '本文')
+            notify([self.daily], 'キーなし', '本文')
+        self.assertEqual(
+            sorted(PendingNotification.objects.values_list('subject', flat=True)),
+            ['キーなし', 'キーなし', '申請1を受け付けました']
+        )
+
+    def test_failed_send_keeps_notifications(self):
+        self.pending(self.daily, local_time(2026, 10, 18, 12, 0))
+        now = local_time(2026, 10, 19, DIGEST_HOUR, 30)
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=SMTPException('接続できません')
+        ):
+            with self.assertRaises(SMTPException):
+                send_digests(now=now)
+        self.assertEqual(PendingNotification.objects.count(), 1)
+
+        self.assertEqual(send_digests(now=now), 1)
+        self.assertFalse(PendingNotification.objects.exists())
+
+
+class UnreadCountTests(TestCase):
+    """ナビゲーションバーの未読件数"""
+
+    def test_cache_miss_reads_only_the_count(self):
+        user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        UserProfile.objects.create(user=user, role='receiver', unread_notifications=3)
+        user = User.objects.get(pk=user.pk)
+        cache.delete(UNREAD_CACHE_KEY.format(user.pk))
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_count(user), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(user), 3)
+
+        # プロファイルがないユーザーは0件
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.assertEqual(unread_count(other), 0)
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """
+    管理画面の一覧のクエリ数が表示件数に比例しないこと（行ごとのFK読み込み・COUNT の回帰検出）
+
+    同じ一覧を少ない件数と多い件数で表示し、クエリ数が同じであることを確認する。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.vendors = []
+        for i in range(12):
+            user = User.objects.create_user(f'vendor{i}', f'vendor{i}@example.com', 'password')
+            UserProfile.objects.create(user=user, role='vendor', company_name=f'取引先{i}')
+            cls.vendors.append(user)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueriesConstant(self, url, add_rows):
+        """add_rows(件数の開始番号, 件数) で行を増やしてもクエリ数が変わらないことを確認する"""
+        add_rows(0, 2)
+        few = self._count_queries(url)
+        add_rows(2, 10)
+        many = self._count_queries(url)
+        self.assertEqual(few, many, f'{url} のクエリ数が件数に比例しています（{few} → {many}）')
+
+    def _create_applications(self, start, count):
+        return [
+            Application.objects.create(
+                application_type='work',
+                title=f'作業申請{i}',
+                content='内容',
+                applicant=self.vendors[i % len(self.vendors)],
+                work_location='A棟',
+            )
+            for i in range(start, start + count)
+        ]
+
+    def test_application_changelist(self):
+        self.assertQueriesConstant(
+            reverse('admin:workflow_application_changelist'), self._create_applications
+        )
+
+    def test_application_changelist_search(self):
+        self._create_applications(0, 3)
+        url = reverse('admin:workflow_application_changelist') + '?q=作業申請'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '作業申請1')
+
+    def test_workflow_step_changelist(self):
+        def add_rows(start, count):
+            WorkflowStep.objects.bulk_create([
+                WorkflowStep(application=application, step_type='submit', processor=application.applicant,
+                             status='completed')
+                for application in self._create_applications(start, count)
+            ])
+        self.assertQueriesConstant(reverse('admin:workflow_workflowstep_changelist'), add_rows)
+
+    def test_comment_changelist(self):
+        def add_rows(start, count):
+            Comment.objects.bulk_create([
+                Comment(application=application, user=application.applicant, content='確認お願いします')
+                for application in self._create_applications(start, count)
+            ])
+        self.assertQueriesConstant(reverse('admin:workflow_comment_changelist'), add_rows)
+
+    def test_attachment_changelist(self):
+        def add_rows(start, count):
+            Attachment.objects.bulk_create([
+                Attachment(application=application, file=f'workflow/attachments/test{application.pk}.pdf',
+                           filename=f'図面{application.pk}.pdf', file_size=1024, uploaded_by=application.applicant)
+                for application in self._create_applications(start, count)
+            ])
+        self.assertQueriesConstant(reverse('admin:workflow_attachment_changelist'), add_rows)
+
+    def test_workflow_role_changelist(self):
+        def add_rows(start, count):
+            for i in range(start, start + count):
+                role = WorkflowRole.objects.create(name=f'受付ロール{i}', role_type='receiver')
+                for user in self.vendors[:3]:
+                    RoleMember.objects.create(role=role, user=user)
+        self.assertQueriesConstant(reverse('admin:workflow_workflowrole_changelist'), add_rows)
+
+    def test_workflow_role_member_count(self):
+        role = WorkflowRole.objects.create(name='承認ロール', role_type='approver')
+        for user in self.vendors[:4]:
+            RoleMember.objects.create(role=role, user=user)
+        response = self.client.get(reverse('admin:workflow_workflowrole_changelist'))
+        self.assertContains(response, '<strong>4</strong> 人', html=True)
+
+    def test_role_member_changelist(self):
+        role = WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+
+        def add_rows(start, count):
+            for user in self.vendors[start:start + count]:
+                RoleMember.objects.create(role=role, user=user, assigned_by=self.admin_user)
+        self.assertQueriesConstant(reverse('admin:workflow_rolemember_changelist'), add_rows)
+
+
+class ListViewColumnTests(TestCase):
+    """
+    一覧画面が申請内容などの大きなテキスト列を読み込まないこと（列の射影の回帰検出）
+
+    一覧の表示中に実行されたクエリに、申請のテキスト列（TextField）が含まれないことを確認する。
+    遅延読み込みした列を行ごとに読み込んだ場合も、そのクエリに列が含まれるため検出できる。
+    """
+    LARGE_TEXT = 'あ' * 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        UserProfile.objects.create(user=cls.receiver, role='receiver', company_name='本社')
+        cls.approver = User.objects.create_user('approver', 'approver@example.com', 'password')
+        UserProfile.objects.create(user=cls.approver, role='approver', company_name='本社')
+
+        receiver_role = WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+        approver_role = WorkflowRole.objects.create(name='一般承認', role_type='approver')
+        RoleMember.objects.create(role=receiver_role, user=cls.receiver)
+        RoleMember.objects.create(role=approver_role, user=cls.approver)
+        ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=receiver_role, approver_role=approver_role
+        )
+
+        for status in ['draft', 'submitted', 'submitted', 'received', 'received']:
+            Application.objects.create(
+                application_type='work', title=f'作業申請（{status}）', status=status,
+                applicant=cls.vendor, work_location='A棟',
+                content=cls.LARGE_TEXT, tool_list=cls.LARGE_TEXT,
+                entry_purpose=cls.LARGE_TEXT, entry_members=cls.LARGE_TEXT,
+            )
+
+    def setUp(self):
+        # 他のテスト・開発環境で作られたユーザーごとの申請種別のキャッシュを使わない
+        routing_cache.invalidate_all()
+
+    def assertNoLargeColumns(self, user, url):
+        large_columns = [
+            '{}.{}'.format(connection.ops.quote_name(Application._meta.db_table), connection.ops.quote_name(field.column))
+            for field in Application._meta.concrete_fields
+            if isinstance(field, models.TextField)
+        ]
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in context.captured_queries:
+            for column in large_columns:
+                self.assertNotIn(column, query['sql'], f'{url} が不要な列 {column} を読み込んでいます')
+        return response
+
+    def test_dashboard(self):
+        response = self.assertNoLargeColumns(self.receiver, reverse('workflow:dashboard'))
+        self.assertContains(response, '作業申請（submitted）')
+
+    def test_my_applications(self):
+        response = self.assertNoLargeColumns(self.vendor, reverse('workflow:my_applications'))
+        self.assertContains(response, '作業申請（draft）')
+
+    def test_pending_receive(self):
+        response = self.assertNoLargeColumns(self.receiver, reverse('workflow:pending_receive'))
+        self.assertContains(response, '作業申請（submitted）')
+
+    def test_pending_approve(self):
+        response = self.assertNoLargeColumns(self.approver, reverse('workflow:pending_approve'))
+        self.assertContains(response, '作業申請（received）')
+
+    def test_export(self):
+        Application.objects.create(
+            application_type='work', title='=HYPERLINK("http://example.com")', status='submitted',
+            applicant=self.vendor, work_location='@SUM(A1)',
+        )
+        self.client.force_login(self.vendor)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('workflow:export'), {'status': 'submitted'})
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response.status_code, 200)
+        content_column = connection.ops.quote_name(Application._meta.get_field('content').column)
+        for query in context.captured_queries:
+            self.assertNotIn(content_column, query['sql'])
+        lines = list(csv.reader(content.lstrip('\ufeff').splitlines()))
+        self.assertEqual(lines[0][:2], ['申請番号', '申請種別'])
+        self.assertEqual(len(lines), 4)
+        self.assertEqual([line[2] for line in lines[1:]].count('作業申請（submitted）'), 2)
+        self.assertTrue(all(line[3] == '申請中' for line in lines[1:]))
+
+        # 数式として解釈される値は先頭に ' を付けて出力する
+        formula_row = next(line for line in lines if 'HYPERLINK' in line[2])
+        self.assertEqual(formula_row[2], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(formula_row[6], "'@SUM(A1)")
+
+
+class UserContextTests(TestCase):
+    """ユーザーコンテキスト（役割・所属ロール）の1クエリでの読み込みと、セッションへの保存・無効化"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+        cls.receiver = User.objects.create_user('receiver', 'receiver@example.com', 'password')
+        UserProfile.objects.create(user=cls.receiver, role='receiver', company_name='本社')
+
+        cls.receiver_role = WorkflowRole.objects.create(name='一般受付', role_type='receiver')
+        inactive_role = WorkflowRole.objects.create(name='旧受付', role_type='receiver', is_active=False)
+        cls.approver_role = WorkflowRole.objects.create(name='一般承認', role_type='approver')
+        RoleMember.objects.create(role=cls.receiver_role, user=cls.receiver)
+        RoleMember.objects.create(role=inactive_role, user=cls.receiver)
+        ApplicationTypeConfig.objects.create(
+            application_type='work', receiver_role=cls.receiver_role, approver_role=cls.approver_role
+        )
+        cls.application = Application.objects.create(
+            application_type='work', title='作業申請', status='submitted', applicant=cls.vendor
+        )
+
+    def setUp(self):
+        routing_cache.invalidate_all()
+
+    def context_queries(self, queries):
+        tables = [connection.ops.quote_name(model._meta.db_table) for model in (UserProfile, RoleMember)]
+        return [query['sql'] for query in queries if any(table in query['sql'] for table in tables)]
+
+    def test_load_in_one_query(self):
+        user = User.objects.get(pk=self.receiver.pk)
+        with self.assertNumQueries(1):
+            context = get_user_context(user)
+        self.assertTrue(context.has_role('receiver', 'admin'))
+        self.assertEqual(context.company_name, '本社')
+        self.assertEqual(context.role_ids('receiver'), [self.receiver_role.pk])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.application.can_receive(user))
+            self.assertFalse(self.application.can_approve(user))
+            self.assertTrue(self.application.can_return(user))
+        self.assertEqual(self.context_queries(queries.captured_queries), [])
+
+    def test_cached_in_session(self):
+        self.client.force_login(self.receiver)
+        self.assertEqual(self.client.get(reverse('workflow:pending_receive')).status_code, 200)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('workflow:pending_receive'))
+        self.assertContains(response, '作業申請')
+        self.assertEqual(self.context_queries(context.captured_queries), [])
+
+    def test_invalidated_by_profile_change(self):
+        self.client.force_login(self.receiver)
+        self.assertEqual(self.client.get(reverse('workflow:pending_receive')).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=self.receiver)
+            profile.role = 'vendor'
+            profile.save()
+        self.assertEqual(self.client.get(reverse('workflow:pending_receive')).status_code, 403)
+
+    def test_invalidated_by_role_membership_change(self):
+        self.client.force_login(self.receiver)
+        url = reverse('workflow:detail', args=[self.application.pk])
+        self.assertContains(self.client.get(url), reverse('workflow:receive', args=[self.application.pk]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoleMember.objects.get(role=self.receiver_role, user=self.receiver).delete()
+        self.assertNotContains(self.client.get(url), reverse('workflow:receive', args=[self.application.pk]))
+
+
+class SignedCookieSessionMigrationTests(TestCase):
+    """DBのセッションから署名付きCookieのセッション（workflow.sessions）への切り替えでログアウトされないこと"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def test_database_session_moves_to_cookie(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db'):
+            self.client.force_login(self.vendor)
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+
+        with override_settings(SESSION_ENGINE='workflow.sessions'):
+            response = self.client.get(reverse('workflow:my_applications'))
+            self.assertEqual(response.status_code, 200)
+            cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            self.assertNotEqual(cookie, session_key)
+            self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+            # 以降は署名付きCookieだけで認証される
+            self.assertEqual(self.client.get(reverse('workflow:my_applications')).status_code, 200)
+
+    def test_unknown_session_key_is_anonymous(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'x' * 32
+        with override_settings(SESSION_ENGINE='workflow.sessions'):
+            response = self.client.get(reverse('workflow:my_applications'))
+        self.assertEqual(response.status_code, 302)
+
+
+class MetricsTests(TestCase):
+    """申請の件数の集計テーブルと /metrics の出力"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def setUp(self):
+        # 前のテストの未反映分を含めて消す
+        registry.flush()
+        registry.reset_shared()
+        self.addCleanup(registry.reset_shared)
+
+    def counts(self):
+        return {
+            (row.application_type, row.status): row.count
+            for row in ApplicationStatusCount.objects.all() if row.count
+        }
+
+    def create_application(self, **kwargs):
+        return Application.objects.create(
+            application_type='work', title='作業申請', applicant=self.vendor, company_name='取引先', **kwargs
+        )
+
+    def test_status_counts_follow_save_and_delete(self):
+        application = self.create_application()
+        other = self.create_application(status='submitted')
+        self.assertEqual(self.counts(), {('work', 'draft'): 1, ('work', 'submitted'): 1})
+
+        application.status = 'submitted'
+        application.save()
+        other.application_type = 'material'
+        other.save()
+        self.assertEqual(self.counts(), {('work', 'submitted'): 1, ('material', 'submitted'): 1})
+
+        other.delete()
+        self.assertEqual(self.counts(), {('work', 'submitted'): 1})
+
+        ApplicationStatusCount.objects.update(count=0)
+        rebuild_status_counts()
+        self.assertEqual(self.counts(), {('work', 'submitted'): 1})
+
+    def test_status_counts_follow_queryset_update_and_cascade_delete(self):
+        draft = self.create_application()
+        for _ in range(2):
+            self.create_application(status='submitted')
+
+        Application.objects.filter(status='submitted').update(status='received')
+        Application.objects.filter(pk=draft.pk).update(application_type='construction', title='工事申請')
+        self.assertEqual(self.counts(), {('construction', 'draft'): 1, ('work', 'received'): 2})
+
+        # 申請者の削除（CASCADE）と QuerySet.delete() も1件ずつ減らす
+        applicant = User.objects.create_user('other', 'other@example.com', 'password')
+        Application.objects.create(
+            application_type='work', title='作業申請', applicant=applicant, company_name='別の取引先', status='received'
+        )
+        self.assertEqual(self.counts()[('work', 'received')], 3)
+        applicant.delete()
+        Application.objects.filter(pk=draft.pk).delete()
+        self.assertEqual(self.counts(), {('work', 'received'): 2})
+
+        ApplicationStatusCount.objects.update(count=0)
+        rebuild_status_counts()
+        self.assertEqual(self.counts(), {('work', 'received'): 2})
+
+    def test_status_counts_are_updated_in_key_order(self):
+        self.create_application(status='submitted')
+        ApplicationStatusCount.objects.create(application_type='material', status='draft', count=1)
+        manager = ApplicationStatusCount.objects
+        with mock.patch.object(manager, 'filter', wraps=manager.filter) as filter_counts:
+            adjust_status_counts({('work', 'submitted'): -1, ('material', 'draft'): 1, ('work', 'draft'): 1})
+        # 同時に逆向きの変更をしてもデッドロックしないよう、常に同じ順で行をロックする
+        self.assertEqual(
+            [(call.kwargs['application_type'], call.kwargs['status']) for call in filter_counts.call_args_list],
+            [('material', 'draft'), ('work', 'draft'), ('work', 'submitted')]
+        )
+        self.assertEqual(self.counts(), {('material', 'draft'): 2, ('work', 'draft'): 1})
+
+    def test_metrics_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_application(status='submitted')
+        self.client.force_login(self.vendor)
+        self.client.get(reverse('workflow:my_applications'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('workflow_applications{application_type="work",status="submitted"} 1', text)
+        self.assertIn('# TYPE workflow_http_request_duration_seconds histogram', text)
+        self.assertIn(
+            'workflow_http_request_duration_seconds_count{method="GET",view="workflow:my_applications"} 1', text
+        )
+        self.assertIn('workflow_http_responses_total{status="200",view="workflow:my_applications"} 1', text)
+        self.assertIn('workflow_db_queries_total{db="default",view="workflow:my_applications"}', text)
+        self.assertIn('workflow_transitions_total{application_type="work",from_status="",to_status="submitted"} 1', text)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_metrics_access(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 403)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='192.0.2.1')
+            self.assertEqual(response.status_code, 200)
+
+    def test_workers_add_to_shared_counters(self):
+        labels = {'view': 'workflow:dashboard', 'status': '200'}
+        workers = [MetricsRegistry(), MetricsRegistry()]
+        for worker in workers:
+            worker.inc('workflow_http_responses_total', labels, 2)
+        for worker in workers:
+            worker.flush()
+
+        series = ('workflow_http_responses_total', (('status', '200'), ('view', 'workflow:dashboard')))
+        self.assertEqual(registry.shared_totals(), {series: 4})
+        counter = MetricCounter.objects.get()
+        self.assertEqual((counter.name, counter.labels), ('workflow_http_responses_total', labels))
+
+    def test_flush_outside_transactions_and_retry_on_failure(self):
+        worker = MetricsRegistry()
+        # トランザクション内では反映の間隔を過ぎても反映しない
+        with mock.patch('workflow.metrics.FLUSH_INTERVAL', 0):
+            worker.inc('workflow_email_send_failures_total', {'source': 'digest'})
+        self.assertFalse(MetricCounter.objects.exists())
+
+        # 反映に失敗した値は次回に持ち越す
+        with mock.patch.object(MetricCounter.objects, 'filter', side_effect=DatabaseError):
+            with self.assertLogs('workflow.metrics', 'WARNING'):
+                worker.flush()
+        worker.inc('workflow_email_send_failures_total', {'source': 'digest'})
+        worker.flush()
+        self.assertEqual(
+            registry.shared_totals(), {('workflow_email_send_failures_total', (('source', 'digest'),)): 2}
+        )
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    """リクエストのプロファイル（指定・低速なリクエストの自動採取・保存件数の上限）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True, is_superuser=True)
+        UserProfile.objects.create(user=cls.staff, role='admin', company_name='自社')
+        cls.vendor = User.objects.create_user('vendor', 'vendor@example.com', 'password')
+        UserProfile.objects.create(user=cls.vendor, role='vendor', company_name='取引先')
+
+    def test_staff_can_request_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('workflow:dashboard'), {'_profile': 'cprofile'})
+        self.assertEqual(response.status_code, 200)
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Workflow-Profile'], reverse('admin:workflow_requestprofile_change', args=[profile.pk]))
+        self.assertEqual((profile.trigger, profile.mode, profile.view_name), ('requested', 'cprofile', 'workflow:dashboard'))
+        data = load_data(profile)
+        self.assertEqual(len(data['queries']), profile.query_count)
+        self.assertTrue(any('workflow_application' in query['sql'] for query in data['queries']))
+        self.assertIn('cumulative', data['pstats_text'])
+
+        self.client.get(reverse('workflow:dashboard'), HTTP_X_WORKFLOW_PROFILE='1')
+        sampled = RequestProfile.objects.latest('id')
+        self.assertEqual(sampled.mode, 'sample')
+
+        change_page = self.client.get(response['X-Workflow-Profile'])
+        self.assertEqual(change_page.status_code, 200)
+        # 実行回数の多いSQLの表に、記録したSQLの文が表示される
+        top_sql, count, total_ms = query_summary(data)[0]
+        self.assertContains(
+            change_page, f'<tr><td>{count}</td><td>{total_ms:.1f}</td><td><code>{escape(top_sql)}</code></td></tr>'
+        )
+        for kind in ('pstats', 'sql'):
+            url = reverse('admin:workflow_requestprofile_download', args=[profile.pk, kind])
+            self.assertEqual(self.client.get(url).status_code, 200)
+        url = reverse('admin:workflow_requestprofile_download', args=[sampled.pk, 'folded'])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_only_staff_and_slow_requests_are_saved(self):
+        self.client.force_login(self.vendor)
+        response = self.client.get(reverse('workflow:my_applications'), {'_profile': '1'})
+        self.assertNotIn('X-Workflow-Profile', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=60000):
+            self.client.get(reverse('workflow:my_applications'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=0, PROFILING_INTERVAL_MS=1):
+            self.client.get(reverse('workflow:my_applications'))
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.trigger, profile.user), ('slow', self.vendor))
+        self.assertGreater(profile.query_count, 0)
+
+    def test_prune_profiles(self):
+        now = timezone.now()
+        for minutes in range(5):
+            RequestProfile.objects.create(
+                created_at=now - timedelta(minutes=minutes), method='GET', path='/', status_code=200,
+                duration_ms=1, trigger='slow', mode='sample', data=b''
+            )
+        RequestProfile.objects.create(
+            created_at=now - timedelta(days=30), method='GET', path='/', status_code=200,
+            duration_ms=1, trigger='slow', mode='sample', data=b''
+        )
+        self.assertEqual(prune_profiles(days=7, max_count=3), 3)
+        self.assertEqual(
+            sorted(RequestProfile.objects.values_list('created_at', flat=True)),
+            [now - timedelta(minutes=minutes) for minutes in (2, 1, 0)]
+        )
@@ -2,7 +2,7 @@
 業務ワークフローシステムのURL設定（製造業・建設業向け）
 """
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'workflow'
 
@@ -12,6 +12,8 @@ urlpatterns = [
     
     # 申請関連
     path('create/', views.ApplicationCreateView.as_view(), name='create'),
+    path('import/', views.import_applications, name='import'),
+    path('export/', views.export_applications, name='export'),
     path('<int:pk>/', views.ApplicationDetailView.as_view(), name='detail'),
     path('<int:pk>/edit/', views.ApplicationUpdateView.as_view(), name='edit'),
     path('<int:pk>/submit/', views.submit_application, name='submit'),
@@ -31,8 +33,34 @@ urlpatterns = [
     path('manual/user/', views.user_manual, name='user_manual'),
     path('manual/operation/', views.operation_manual, name='operation_manual'),
     
+    # 受信箱・通知設定
+    path('inbox/', views.InboxView.as_view(), name='inbox'),
+    path('inbox/<int:pk>/', views.open_notification, name='open_notification'),
+    path('inbox/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('notification-settings/', views.notification_settings, name='notification_settings'),
+    
     # 一覧
     path('my-applications/', views.MyApplicationsView.as_view(), name='my_applications'),
     path('pending-receive/', views.PendingReceiveView.as_view(), name='pending_receive'),
     path('pending-approve/', views.PendingApproveView.as_view(), name='pending_approve'),
+    
+    # 作業場所の占有カレンダー
+    path('occupancy/', views.OccupancyCalendarView.as_view(), name='occupancy_calendar'),
+    
+    # レポート（リードタイム・滞留）
+    path('reports/', views.ReportView.as_view(), name='reports'),
+    
+    # JSON API
+    path('api/applications/', api.application_list, name='api_applications'),
+    path('api/applications/<int:pk>/', api.application_detail, name='api_application_detail'),
+    path('api/applications/<int:pk>/steps/', api.application_sub_resource, {'resource': 'steps'}, name='api_application_steps'),
+    path('api/applications/<int:pk>/comments/', api.application_sub_resource, {'resource': 'comments'}, name='api_application_comments'),
+    path('api/applications/<int:pk>/attachments/', api.application_sub_resource, {'resource': 'attachments'}, name='api_application_attachments'),
+    path('api/queues/receive/', api.queue_list, {'queue': 'receive'}, name='api_queue_receive'),
+    path('api/queues/approve/', api.queue_list, {'queue': 'approve'}, name='api_queue_approve'),
+    path('api/lookup/entry-members/', api.lookup_entry_members, name='api_lookup_entry_members'),
+    path('api/lookup/tools/', api.lookup_tools, name='api_lookup_tools'),
+    
+    # リアルタイム通知（SSE）
+    path('events/queue/', views.queue_events, name='queue_events'),
 ]
@@ -0,0 +1,22 @@
+"""
+業務ワークフローシステムのURL設定（ASGI用）
+
+workflow.urls と同じURL・名前で、参照系の画面のみ非同期ビューに差し替える。
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import app_name, urlpatterns as sync_urlpatterns  # noqa: F401
+
+ASYNC_VIEWS = {
+    'dashboard': async_views.AsyncDashboardView.as_view(),
+    'detail': async_views.AsyncApplicationDetailView.as_view(),
+    'pending_receive': async_views.AsyncPendingReceiveView.as_view(),
+    'pending_approve': async_views.AsyncPendingApproveView.as_view(),
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,117 @@
+"""
+権限の判定に使うユーザーコンテキスト（プロファイルの役割・所属するロール）
+
+権限の判定ごとに user.profile（hasattr）と user.workflow_roles を遅延読み込みすると、
+1リクエストで同じ問い合わせが何度も発生する。プロファイルと有効なロールの所属を1回のクエリで読み込み、
+リクエストの間はユーザーに、リクエストをまたいではセッションに保存する。
+
+セッションの値には routing_cache のバージョンを添え、ロール・所属・プロファイルの変更で
+バージョンが上がったら読み直す（UserContextMiddleware がセッションをユーザーに結び付ける）。
+
+    context = get_user_context(request.user)
+    if context.is_admin or context.in_role(type_config.receiver_role_id):
+        ...
+"""
+from django.apps import apps
+from django.contrib.auth import get_user_model
+
+from .caching import routing_cache
+
+
+SESSION_KEY = 'workflow_user_context'
+
+
+class UserContext:
+    """ユーザーのプロファイルの役割と、所属する有効なロール（id, ロール種別）"""
+
+    __slots__ = ('user_id', 'role', 'company_name', 'roles')
+
+    def __init__(self, user_id=None, role=None, company_name='', roles=()):
+        self.user_id = user_id
+        self.role = role
+        self.company_name = company_name
+        self.roles = tuple((role_id, role_type) for role_id, role_type in roles)
+
+    @property
+    def has_profile(self):
+        return self.role is not None
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    @property
+    def role_label(self):
+        return dict(apps.get_model('workflow', 'UserProfile').ROLE_CHOICES).get(self.role, self.role)
+
+    def has_role(self, *roles):
+        """プロファイルの役割がいずれかに該当するか（プロファイルがない場合は False）"""
+        return self.role is not None and self.role in roles
+
+    def in_role(self, role_id):
+        """ワークフローロールに所属しているか"""
+        return any(member_role_id == role_id for member_role_id, _ in self.roles)
+
+    def role_ids(self, role_type):
+        """所属するロールのうち、ロール種別（受付・承認）が一致するもののid"""
+        return [role_id for role_id, member_role_type in self.roles if member_role_type == role_type]
+
+    def to_session(self, version):
+        return {
+            'version': version, 'user_id': self.user_id, 'role': self.role,
+            'company_name': self.company_name, 'roles': [list(role) for role in self.roles],
+        }
+
+    @classmethod
+    def from_session(cls, data):
+        return cls(data['user_id'], data['role'], data['company_name'], data['roles'])
+
+
+ANONYMOUS = UserContext()
+
+
+def load_user_context(user_id):
+    """プロファイルと有効なロールの所属を1回のクエリで読み込む（所属ごとに1行、所属がなければ1行）"""
+    rows = get_user_model().objects.filter(pk=user_id).values_list(
+        'profile__role', 'profile__company_name',
+        'workflow_roles__role_id', 'workflow_roles__role__role_type', 'workflow_roles__role__is_active',
+    )
+    role, company_name, roles = None, '', []
+    for role, company_name, role_id, role_type, is_active in rows:
+        if role_id is not None and is_active:
+            roles.append((role_id, role_type))
+    return UserContext(user_id, role, company_name or '', roles)
+
+
+def bind_session(user, session):
+    """ユーザーにセッションを結び付ける（get_user_context がセッションに保存した値を使う）"""
+    user._workflow_session = session
+    return user
+
+
+def get_user_context(user):
+    """
+    ユーザーのコンテキストを返す
+
+    同じユーザーのオブジェクトでは1回だけ読み込む。セッションが結び付いていれば、
+    バージョンが変わっていない間はセッションの値を使う。
+    """
+    context = getattr(user, '_workflow_context', None)
+    if context is not None:
+        return context
+
+    if not user.is_authenticated:
+        return ANONYMOUS
+
+    session = getattr(user, '_workflow_session', None)
+    version = routing_cache.version()
+    data = session.get(SESSION_KEY) if session is not None else None
+    if data and data.get('version') == version and data.get('user_id') == user.pk:
+        context = UserContext.from_session(data)
+    else:
+        context = load_user_context(user.pk)
+        if session is not None:
+            session[SESSION_KEY] = context.to_session(version)
+
+    user._workflow_context = context
+    return context
@@ -0,0 +1,137 @@
+"""
+申請種別ごとの入力ルール（必須項目・日付の前後関係）
+
+ルールは申請種別ごとの表として宣言し、起動時に一度だけ検証器へコンパイルする。
+画面（ApplicationForm）・管理画面・一括取込で同じ検証器を使う。
+
+    application_validator.validate(cleaned_data)     1件（辞書）の検証
+    application_validator.validate_columns(columns)  列指向のまとめて検証（{項目: [値, ...]}）
+"""
+from collections import defaultdict
+
+from .models import Application
+
+
+# 申請種別 → 必須項目（フィールド名, 申請種別ごとの項目名）
+REQUIRED_FIELDS = {
+    'work': [
+        ('work_location', '作業場所'),
+        ('work_start_date', '作業開始予定日'),
+        ('worker_count', '作業人数'),
+    ],
+    'construction': [
+        ('work_location', '工事場所'),
+        ('work_start_date', '工事開始予定日'),
+        ('work_end_date', '工事終了予定日'),
+        ('contractor_name', '施工業者名'),
+        ('worker_count', '工事人数'),
+    ],
+    'tool_bringin': [
+        ('tool_list', '持込工具リスト'),
+        ('work_start_date', '使用開始予定日'),
+        ('work_end_date', '返却予定日'),
+    ],
+    'restricted_entry': [
+        ('restricted_area', 'エリア名'),
+        ('entry_purpose', '立入目的'),
+        ('entry_members', '立入者リスト'),
+        ('work_start_date', '立入予定日'),
+    ],
+    'restricted_tool': [
+        ('restricted_area', 'エリア名'),
+        ('tool_list', '持込工具リスト'),
+        ('entry_members', '立入者リスト'),
+        ('work_start_date', '使用開始予定日'),
+    ],
+}
+
+# 日付の前後関係（開始, 終了, エラーを付けるフィールド, メッセージ）。全申請種別に適用する
+DATE_ORDER_RULES = [
+    ('work_start_date', 'work_end_date', 'work_end_date', '終了日は開始日より後の日付を指定してください。'),
+]
+
+
+class ApplicationValidator:
+    """ルール表をコンパイルした検証器"""
+
+    def __init__(self, required_fields, date_order_rules, type_labels):
+        # 申請種別 → ((フィールド名, エラーメッセージ), ...) をメッセージ組み立て済みで保持する
+        self.required = {
+            application_type: tuple(
+                (field_name, f'{type_labels[application_type]}の場合、{label}は必須です。')
+                for field_name, label in fields
+            )
+            for application_type, fields in required_fields.items()
+        }
+        self.date_order = tuple(date_order_rules)
+        self.fields = sorted(
+            {field_name for fields in self.required.values() for field_name, _ in fields} |
+            {name for start, end, _, _ in self.date_order for name in (start, end)}
+        )
+
+    def validate(self, data):
+        """
+        1件分の値を検証する
+
+        Returns:
+            (フィールド名, エラーメッセージ) のリスト
+        """
+        errors = [
+            (field_name, message)
+            for field_name, message in self.required.get(data.get('application_type'), ())
+            if not data.get(field_name)
+        ]
+        for start_field, end_field, error_field, message in self.date_order:
+            start, end = data.get(start_field), data.get(end_field)
+            if start and end and end < start:
+                errors.append((error_field, message))
+        return errors
+
+    def validate_columns(self, columns):
+        """
+        列指向のデータ（{フィールド名: [値, ...]}）をまとめて検証する
+
+        行ごとに辞書を作らず、申請種別ごとに対象行を絞り込んでから列単位で判定する。
+
+        Returns:
+            {行インデックス: [(フィールド名, エラーメッセージ), ...]}（エラーのある行のみ）
+        """
+        types = columns.get('application_type', ())
+        size = len(types)
+        missing = [None] * size
+
+        rows_by_type = defaultdict(list)
+        for index, application_type in enumerate(types):
+            rows_by_type[application_type].append(index)
+
+        errors = defaultdict(list)
+        for application_type, indexes in rows_by_type.items():
+            for field_name, message in self.required.get(application_type, ()):
+                values = columns.get(field_name, missing)
+                for index in indexes:
+                    if not values[index]:
+                        errors[index].append((field_name, message))
+
+        for start_field, end_field, error_field, message in self.date_order:
+            starts = columns.get(start_field, missing)
+            ends = columns.get(end_field, missing)
+            for index, (start, end) in enumerate(zip(starts, ends)):
+                if start and end and end < start:
+                    errors[index].append((error_field, message))
+
+        return dict(errors)
+
+
+def compile_rules(required_fields=REQUIRED_FIELDS, date_order_rules=DATE_ORDER_RULES):
+    """ルール表から検証器を作成する"""
+    return ApplicationValidator(
+        required_fields, date_order_rules, dict(Application.APPLICATION_TYPE_CHOICES)
+    )
+
+
+application_validator = compile_rules()
+
+
+def to_columns(records, field_names):
+    """辞書のリストを列指向（{フィールド名: [値, ...]}）に変換する"""
+    return {name: [record.get(name) for record in records] for name in field_names}
@@ -1,22 +1,44 @@
 """
 業務ワークフローシステムのビュー（製造業・建設業向け）
 """
+import hmac
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.generic import ListView, DetailView, CreateView, UpdateView
+from django.core.exceptions import PermissionDenied
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, TemplateView
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.db import transaction
 from django.db.models import Q
-from django.core.cache import cache
 
 from .models import (
     Application, WorkflowStep, Comment, Attachment,
-    ApplicationTypeConfig, RoleMember
+    RoleMember, UserProfile, InboxNotification,
+    get_user_receivable_types, get_user_approvable_types, get_section_versions
+)
+from .db_routing import reading_from_replica, replica_reads
+from .forms import ApplicationForm, CommentForm, AttachmentForm, ApplicationImportForm, NotificationSettingsForm
+from .importer import ApplicationImporter, ApplicationImportError, read_rows
+from .occupancy import (
+    OCCUPANCY_TYPES, OCCUPYING_STATUSES, attach_conflicts, find_conflicts, occupancy_calendar
+)
+from .metrics import collect, registry, render_text
+from .notifications import mark_read
+from .reporting import DURATION_BUCKETS, GROUP_FIELDS, backlog_report, lead_time_report
+from .rows import application_rows, csv_lines, iter_rows, make_rows
+from .user_context import get_user_context
+from .events import (
+    RECEIVE_QUEUE, APPROVE_QUEUE, channel_name, stream_queue_events
 )
-from .forms import ApplicationForm, CommentForm, AttachmentForm
 
 
 class RoleRequiredMixin(UserPassesTestMixin):
@@ -24,12 +46,230 @@ class RoleRequiredMixin(UserPassesTestMixin):
     required_roles = []
     
     def test_func(self):
-        if not hasattr(self.request.user, 'profile'):
-            return False
-        return self.request.user.profile.role in self.required_roles
+        return get_user_context(self.request.user).has_role(*self.required_roles)
+
+
+# 一覧画面で読み込む列（申請内容・持込工具リストなどの大きなテキスト列は読み込まない）
+LIST_COLUMNS = (
+    'id', 'application_number', 'application_type', 'title', 'company_name', 'status',
+    'created_at', 'updated_at', 'submitted_at', 'received_at', 'applicant__username',
+)
+
+# 受付待ち一覧は作業場所・期間の重複表示に使う列も読み込む
+PENDING_RECEIVE_COLUMNS = LIST_COLUMNS + ('work_location', 'work_start_date', 'work_end_date')
+
+
+def project_list(queryset, columns=LIST_COLUMNS):
+    """一覧の表示に使う列だけを読み込む（申請者はユーザー名のみ結合）"""
+    return queryset.select_related('applicant').only(*columns)
+
+
+def filter_dashboard_applications(user, params):
+    """ダッシュボードの範囲・検索条件で絞り込んだ申請（列の射影・並び順は呼び出し側で指定する。APIと共通）"""
+    # 条件1: 自分が申請した伝票（全ステータス）
+    my_applications = Application.objects.filter(applicant=user)
+    
+    # 条件2: 自分が受付する伝票（申請中のみ）
+    receivable_applications = Application.objects.none()
+    if get_user_context(user).has_profile:
+        receivable_types = get_user_receivable_types(user)
+        if receivable_types:
+            receivable_applications = Application.objects.filter(
+                status='submitted',  # 申請中のみ
+                application_type__in=receivable_types
+            ).exclude(
+                applicant=user  # 自分の申請は除外（条件1で含まれる）
+            )
+    
+    # 条件3: 自分が承認する伝票（受付済のみ）
+    approvable_applications = Application.objects.none()
+    if get_user_context(user).has_profile:
+        approvable_types = get_user_approvable_types(user)
+        if approvable_types:
+            approvable_applications = Application.objects.filter(
+                status='received',  # 受付済のみ
+                application_type__in=approvable_types
+            ).exclude(
+                applicant=user  # 自分の申請は除外（条件1で含まれる）
+            )
+    
+    # 3条件のOR結合（同じテーブルの条件のみのため重複しない）
+    queryset = (
+        my_applications | 
+        receivable_applications | 
+        approvable_applications
+    )
+    
+    # 検索条件の適用
+    search_query = params.get('q', '')
+    if search_query:
+        queryset = queryset.filter(
+            Q(application_number__icontains=search_query) |
+            Q(title__icontains=search_query) |
+            Q(company_name__icontains=search_query)
+        )
+    
+    # ステータスフィルターの適用
+    status_filter = params.get('status', '')
+    if status_filter:
+        queryset = queryset.filter(status=status_filter)
+    
+    # 申請種別フィルターの適用
+    type_filter = params.get('type', '')
+    if type_filter:
+        queryset = queryset.filter(application_type=type_filter)
+    
+    return queryset
+
+
+def get_dashboard_queryset(user, params):
+    """ダッシュボードの申請一覧クエリセットを返す（同期・非同期ビュー共通）"""
+    return project_list(filter_dashboard_applications(user, params)).order_by('-created_at')
+
+
+def get_dashboard_counters(user):
+    """ダッシュボードの統計件数のクエリセットを {コンテキスト名: クエリセット} で返す"""
+    # 自分の申請の統計
+    counters = {
+        'my_draft_count': Application.objects.filter(applicant=user, status='draft'),
+        'my_submitted_count': Application.objects.filter(applicant=user, status='submitted'),
+        'my_approved_count': Application.objects.filter(applicant=user, status='approved'),
+    }
+    
+    if get_user_context(user).has_profile:
+        # 受付待ち（受付可能な申請種別）
+        receivable_types = get_user_receivable_types(user)
+        if receivable_types:
+            counters['pending_receive_count'] = Application.objects.filter(
+                status='submitted',
+                application_type__in=receivable_types
+            ).exclude(applicant=user)
+        else:
+            counters['pending_receive_count'] = Application.objects.none()
+        
+        # 承認待ち（承認可能な申請種別）
+        approvable_types = get_user_approvable_types(user)
+        if approvable_types:
+            counters['pending_approve_count'] = Application.objects.filter(
+                status='received',
+                application_type__in=approvable_types
+            ).exclude(applicant=user)
+        else:
+            counters['pending_approve_count'] = Application.objects.none()
+    
+    return counters
+
+
+def get_accessible_applications(user):
+    """
+    ユーザーが閲覧可能な申請のクエリセットを返す（詳細画面用）
+    
+    添付・コメント・履歴は事前読込しない（get_detail_sections を参照）。
+    """
+    queryset = Application.objects.select_related('applicant', 'applicant__profile')
+    
+    # 管理者は全て閲覧可能
+    context = get_user_context(user)
+    if context.is_admin:
+        return queryset
+    
+    # 以下の条件で閲覧可能（ダッシュボードと同じロジック）
+    # 1. 自分が申請した伝票
+    # 2. 自分が受付可能な申請種別の申請中伝票
+    # 3. 自分が承認可能な申請種別の受付済伝票
+    condition = Q(applicant=user)
+    if context.has_profile:
+        receivable_types = get_user_receivable_types(user)
+        if receivable_types:
+            condition |= Q(status='submitted', application_type__in=receivable_types)
+        
+        approvable_types = get_user_approvable_types(user)
+        if approvable_types:
+            condition |= Q(status='received', application_type__in=approvable_types)
+    
+    return queryset.filter(condition)
+
+
+def get_detail_sections(application):
+    """
+    申請詳細の添付・コメント・履歴セクションのコンテキストを返す
+    
+    各セクションはバージョン（件数・最終更新日時）をキーにフラグメントキャッシュするため、
+    一覧は遅延評価のクエリセットとし、キャッシュがない場合のみ読み込む。
+    """
+    return {
+        'attachments': application.attachments.select_related('uploaded_by'),
+        'comments': application.comments.select_related('user'),
+        'workflow_steps': application.workflow_steps.select_related('processor'),
+        'section_versions': get_section_versions(application.pk),
+    }
+
+
+def get_action_permissions(application, user):
+    """詳細画面で表示するアクションの権限を返す"""
+    return {
+        'can_edit': application.can_edit(user),
+        'can_submit': application.can_submit(user),
+        'can_receive': application.can_receive(user),
+        'can_approve': application.can_approve(user),
+        'can_return': application.can_return(user),
+    }
+
+
+def get_my_applications_queryset(user):
+    """自分の申請一覧のクエリセットを返す"""
+    return project_list(Application.objects.filter(applicant=user)).order_by('-created_at')
+
+
+def filter_pending_receive(user):
+    """受付待ちの申請（列の射影・並び順は呼び出し側で指定する。APIと共通）"""
+    queryset = Application.objects.filter(status='submitted')
+    
+    # 管理者以外はロールベースでフィルタリング
+    context = get_user_context(user)
+    if context.has_profile and not context.is_admin:
+        # ユーザーが受付可能な申請種別のみ表示
+        receivable_types = get_user_receivable_types(user)
+        queryset = queryset.filter(application_type__in=receivable_types)
+    
+    return queryset
+
+
+def get_pending_receive_queryset(user):
+    """受付待ち一覧のクエリセットを返す"""
+    return project_list(filter_pending_receive(user), PENDING_RECEIVE_COLUMNS).order_by('submitted_at')
+
+
+def filter_pending_approve(user):
+    """承認待ちの申請（列の射影・並び順は呼び出し側で指定する。APIと共通）"""
+    queryset = Application.objects.filter(status='received')
+    
+    # 管理者以外はロールベースでフィルタリング
+    context = get_user_context(user)
+    if context.has_profile and not context.is_admin:
+        # ユーザーが承認可能な申請種別のみ表示
+        approvable_types = get_user_approvable_types(user)
+        queryset = queryset.filter(application_type__in=approvable_types)
+    
+    return queryset
+
+
+def get_pending_approve_queryset(user):
+    """承認待ち一覧のクエリセットを返す"""
+    return project_list(filter_pending_approve(user)).order_by('received_at')
+
+
+class ApplicationRowsMixin:
+    """一覧のページを Application のインスタンスではなく行（workflow.rows）で表示する"""
+    
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = make_rows(object_list)
+        return paginator, page, page.object_list, is_paginated
 
 
-class DashboardView(LoginRequiredMixin, ListView):
+@method_decorator(replica_reads, name='dispatch')
+class DashboardView(ApplicationRowsMixin, LoginRequiredMixin, ListView):
     """ダッシュボード - ユーザー種別に応じた申請一覧"""
     model = Application
     template_name = 'workflow/dashboard.html'
@@ -37,151 +277,14 @@ class DashboardView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        user = self.request.user
-        
-        # 条件1: 自分が申請した伝票（全ステータス）
-        my_applications = Application.objects.filter(applicant=user)
-        
-        # 条件2: 自分が受付する伝票（申請中のみ）
-        receivable_applications = Application.objects.none()
-        if hasattr(user, 'profile'):
-            receivable_types = self._get_user_receivable_types(user)
-            if receivable_types:
-                receivable_applications = Application.objects.filter(
-                    status='submitted',  # 申請中のみ
-                    application_type__in=receivable_types
-                ).exclude(
-                    applicant=user  # 自分の申請は除外（条件1で含まれる）
-                )
-        
-        # 条件3: 自分が承認する伝票（受付済のみ）
-        approvable_applications = Application.objects.none()
-        if hasattr(user, 'profile'):
-            approvable_types = self._get_user_approvable_types(user)
-            if approvable_types:
-                approvable_applications = Application.objects.filter(
-                    status='received',  # 受付済のみ
-                    application_type__in=approvable_types
-                ).exclude(
-                    applicant=user  # 自分の申請は除外（条件1で含まれる）
-                )
-        
-        # 3条件のOR結合
-        queryset = (
-            my_applications | 
-            receivable_applications | 
-            approvable_applications
-        ).distinct()
-        
-        # 検索条件の適用
-        search_query = self.request.GET.get('q', '')
-        if search_query:
-            queryset = queryset.filter(
-                Q(application_number__icontains=search_query) |
-                Q(title__icontains=search_query) |
-                Q(company_name__icontains=search_query)
-            )
-        
-        # ステータスフィルターの適用
-        status_filter = self.request.GET.get('status', '')
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        
-        # 申請種別フィルターの適用
-        type_filter = self.request.GET.get('type', '')
-        if type_filter:
-            queryset = queryset.filter(application_type=type_filter)
-        
-        return queryset.select_related('applicant', 'applicant__profile').order_by('-created_at')
-    
-    def _get_user_receivable_types(self, user):
-        """ユーザーが受付可能な申請種別のリストを取得（キャッシュ付き）"""
-        cache_key = f'user_receivable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            # ユーザーが所属する受付ロールを取得
-            user_roles = user.workflow_roles.filter(role__role_type='receiver', role__is_active=True)
-            
-            # それらのロールが担当する申請種別を取得
-            configs = ApplicationTypeConfig.objects.filter(
-                receiver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            # フォールバック: 設定がない場合は全種別
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)  # 1時間キャッシュ
-        
-        return types
-    
-    def _get_user_approvable_types(self, user):
-        """ユーザーが承認可能な申請種別のリストを取得（キャッシュ付き）"""
-        cache_key = f'user_approvable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            # ユーザーが所属する承認ロールを取得
-            user_roles = user.workflow_roles.filter(role__role_type='approver', role__is_active=True)
-            
-            # それらのロールが担当する申請種別を取得
-            configs = ApplicationTypeConfig.objects.filter(
-                approver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            # フォールバック: 設定がない場合は全種別
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)  # 1時間キャッシュ
-        
-        return types
+        return application_rows(get_dashboard_queryset(self.request.user, self.request.GET))
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
         # 統計情報（全ユーザー共通）
-        user = self.request.user
-        
-        # 自分の申請の統計
-        context['my_draft_count'] = Application.objects.filter(
-            applicant=user, 
-            status='draft'
-        ).count()
-        context['my_submitted_count'] = Application.objects.filter(
-            applicant=user, 
-            status='submitted'
-        ).count()
-        context['my_approved_count'] = Application.objects.filter(
-            applicant=user, 
-            status='approved'
-        ).count()
-        
-        # 受付待ち（受付可能な申請種別）
-        if hasattr(user, 'profile'):
-            receivable_types = self._get_user_receivable_types(user)
-            if receivable_types:
-                context['pending_receive_count'] = Application.objects.filter(
-                    status='submitted',
-                    application_type__in=receivable_types
-                ).exclude(applicant=user).count()
-            else:
-                context['pending_receive_count'] = 0
-            
-            # 承認待ち（承認可能な申請種別）
-            approvable_types = self._get_user_approvable_types(user)
-            if approvable_types:
-                context['pending_approve_count'] = Application.objects.filter(
-                    status='received',
-                    application_type__in=approvable_types
-                ).exclude(applicant=user).count()
-            else:
-                context['pending_approve_count'] = 0
+        for name, queryset in get_dashboard_counters(self.request.user).items():
+            context[name] = queryset.count()
         
         # フィルター用の選択肢
         context['status_choices'] = Application.STATUS_CHOICES
@@ -273,105 +376,16 @@ class ApplicationDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'application'
     
     def get_queryset(self):
-        queryset = Application.objects.select_related('applicant', 'applicant__profile').prefetch_related(
-            'workflow_steps__processor',
-            'comments__user',
-            'attachments__uploaded_by'
-        )
-        
-        user = self.request.user
-        
-        # 管理者は全て閲覧可能
-        if hasattr(user, 'profile') and user.profile.role == 'admin':
-            return queryset
-        
-        # 以下の条件で閲覧可能（ダッシュボードと同じロジック）
-        # 1. 自分が申請した伝票
-        # 2. 自分が受付可能な申請種別の申請中伝票
-        # 3. 自分が承認可能な申請種別の受付済伝票
-        
-        accessible_ids = []
-        
-        # 条件1: 自分が申請した伝票
-        my_applications = Application.objects.filter(applicant=user).values_list('id', flat=True)
-        accessible_ids.extend(my_applications)
-        
-        # 条件2: 受付可能な申請中の伝票
-        if hasattr(user, 'profile'):
-            receivable_types = self._get_user_receivable_types(user)
-            if receivable_types:
-                receivable_apps = Application.objects.filter(
-                    status='submitted',
-                    application_type__in=receivable_types
-                ).values_list('id', flat=True)
-                accessible_ids.extend(receivable_apps)
-            
-            # 条件3: 承認可能な受付済の伝票
-            approvable_types = self._get_user_approvable_types(user)
-            if approvable_types:
-                approvable_apps = Application.objects.filter(
-                    status='received',
-                    application_type__in=approvable_types
-                ).values_list('id', flat=True)
-                accessible_ids.extend(approvable_apps)
-        
-        # アクセス可能なIDでフィルタリング
-        return queryset.filter(id__in=accessible_ids)
-    
-    def _get_user_receivable_types(self, user):
-        """ユーザーが受付可能な申請種別のリストを取得（キャッシュ付き）"""
-        cache_key = f'user_receivable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            user_roles = user.workflow_roles.filter(role__role_type='receiver', role__is_active=True)
-            configs = ApplicationTypeConfig.objects.filter(
-                receiver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)
-        
-        return types
-    
-    def _get_user_approvable_types(self, user):
-        """ユーザーが承認可能な申請種別のリストを取得（キャッシュ付き）"""
-        cache_key = f'user_approvable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            user_roles = user.workflow_roles.filter(role__role_type='approver', role__is_active=True)
-            configs = ApplicationTypeConfig.objects.filter(
-                approver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)
-        
-        return types
+        return get_accessible_applications(self.request.user)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['comment_form'] = CommentForm()
         context['attachment_form'] = AttachmentForm()
+        context.update(get_detail_sections(self.object))
         
         # アクション権限の判定
-        application = self.object
-        user = self.request.user
-        
-        context['can_edit'] = application.can_edit(user)
-        context['can_submit'] = application.can_submit(user)
-        context['can_receive'] = application.can_receive(user)
-        context['can_approve'] = application.can_approve(user)
-        context['can_return'] = application.can_return(user)
+        context.update(get_action_permissions(self.object, self.request.user))
         
         return context
 
@@ -524,7 +538,10 @@ def receive_application(request, pk):
         
         return redirect('workflow:detail', pk=pk)
     
-    return render(request, 'workflow/confirm_receive.html', {'application': application})
+    return render(request, 'workflow/confirm_receive.html', {
+        'application': application,
+        'conflicts': find_conflicts([application]).get(application.pk, []),
+    })
 
 
 @login_required
@@ -583,7 +600,7 @@ def add_comment(request, pk):
     
     # 取引先は自分の申請のみコメント可能
     user = request.user
-    if hasattr(user, 'profile') and user.profile.role == 'vendor':
+    if get_user_context(user).role == 'vendor':
         if application.applicant != user:
             messages.error(request, 'コメントする権限がありません。')
             return redirect('workflow:detail', pk=pk)
@@ -643,7 +660,83 @@ def delete_attachment(request, pk, attachment_id):
     return redirect('workflow:detail', pk=pk)
 
 
-class MyApplicationsView(LoginRequiredMixin, ListView):
+# 一括取込できる役割（取込んだ申請は取込んだユーザーの申請になるため、申請者と管理者のみ）
+IMPORT_ROLES = ['vendor', 'admin']
+
+
+@login_required
+def import_applications(request):
+    """申請の一括取込（CSV / Excel）"""
+    if not get_user_context(request.user).has_role(*IMPORT_ROLES):
+        raise PermissionDenied
+    
+    result = None
+    
+    if request.method == 'POST':
+        form = ApplicationImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            importer = ApplicationImporter(request.user, submit=form.cleaned_data['submit'])
+            try:
+                result = importer.run(read_rows(upload, upload.name))
+            except ApplicationImportError as e:
+                messages.error(request, str(e))
+            else:
+                if result.created:
+                    messages.success(request, f'{result.created}件の申請を登録しました。')
+                if result.errors:
+                    messages.warning(request, f'{result.failed_rows}行にエラーがあるため登録されませんでした。')
+    else:
+        form = ApplicationImportForm()
+    
+    return render(request, 'workflow/application_import.html', {
+        'form': form,
+        'result': result,
+        'import_fields': [
+            (name, Application._meta.get_field(name).verbose_name)
+            for name in ApplicationForm._meta.fields
+        ],
+    })
+
+
+@login_required
+@replica_reads
+def export_applications(request):
+    """ダッシュボードの申請一覧（検索・絞り込み条件を適用）をCSVで出力する"""
+    queryset = get_dashboard_queryset(request.user, request.GET)
+    
+    def lines():
+        # 出力はビューを抜けた後に行われるため、読み取り先をここで改めてレプリカにする
+        with reading_from_replica():
+            yield from csv_lines(iter_rows(queryset))
+    
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    filename = f'applications_{timezone.localtime():%Y%m%d%H%M}.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def metrics_endpoint(request):
+    """
+    運用メトリクス（Prometheus のテキスト形式）
+    
+    METRICS_TOKEN を設定した場合は Bearer トークン、それ以外は METRICS_ALLOWED_IPS で取得元を制限する。
+    """
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        allowed = hmac.compare_digest(authorization, f'Bearer {settings.METRICS_TOKEN}')
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    
+    # このプロセスの未反映分を含める
+    registry.flush()
+    return HttpResponse(render_text(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@method_decorator(replica_reads, name='dispatch')
+class MyApplicationsView(ApplicationRowsMixin, LoginRequiredMixin, ListView):
     """自分の申請一覧"""
     model = Application
     template_name = 'workflow/my_applications.html'
@@ -651,10 +744,11 @@ class MyApplicationsView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        return Application.objects.filter(applicant=self.request.user).order_by('-created_at')
+        return application_rows(get_my_applications_queryset(self.request.user))
 
 
-class PendingReceiveView(LoginRequiredMixin, RoleRequiredMixin, ListView):
+@method_decorator(replica_reads, name='dispatch')
+class PendingReceiveView(ApplicationRowsMixin, LoginRequiredMixin, RoleRequiredMixin, ListView):
     """受付待ち一覧（ロールベース）"""
     model = Application
     template_name = 'workflow/pending_receive.html'
@@ -663,39 +757,17 @@ class PendingReceiveView(LoginRequiredMixin, RoleRequiredMixin, ListView):
     required_roles = ['receiver', 'admin']
     
     def get_queryset(self):
-        user = self.request.user
-        queryset = Application.objects.filter(status='submitted').order_by('submitted_at')
-        
-        # 管理者以外はロールベースでフィルタリング
-        if hasattr(user, 'profile') and user.profile.role != 'admin':
-            # ユーザーが受付可能な申請種別のみ表示
-            receivable_types = self._get_user_receivable_types(user)
-            queryset = queryset.filter(application_type__in=receivable_types)
-        
-        return queryset
+        return application_rows(get_pending_receive_queryset(self.request.user))
     
-    def _get_user_receivable_types(self, user):
-        """ユーザーが受付可能な申請種別のリストを取得"""
-        cache_key = f'user_receivable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            user_roles = user.workflow_roles.filter(role__role_type='receiver', role__is_active=True)
-            configs = ApplicationTypeConfig.objects.filter(
-                receiver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)
-        
-        return types
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # 同じ作業場所・期間に受付済・承認済の申請がある場合に表示
+        attach_conflicts(context['applications'])
+        return context
 
 
-class PendingApproveView(LoginRequiredMixin, RoleRequiredMixin, ListView):
+@method_decorator(replica_reads, name='dispatch')
+class PendingApproveView(ApplicationRowsMixin, LoginRequiredMixin, RoleRequiredMixin, ListView):
     """承認待ち一覧（ロールベース）"""
     model = Application
     template_name = 'workflow/pending_approve.html'
@@ -704,36 +776,194 @@ class PendingApproveView(LoginRequiredMixin, RoleRequiredMixin, ListView):
     required_roles = ['approver', 'admin']
     
     def get_queryset(self):
-        user = self.request.user
-        queryset = Application.objects.filter(status='received').order_by('received_at')
-        
-        # 管理者以外はロールベースでフィルタリング
-        if hasattr(user, 'profile') and user.profile.role != 'admin':
-            # ユーザーが承認可能な申請種別のみ表示
-            approvable_types = self._get_user_approvable_types(user)
-            queryset = queryset.filter(application_type__in=approvable_types)
-        
-        return queryset
+        return application_rows(get_pending_approve_queryset(self.request.user))
+
+
+@method_decorator(replica_reads, name='dispatch')
+class OccupancyCalendarView(LoginRequiredMixin, RoleRequiredMixin, TemplateView):
+    """作業場所の占有カレンダー（受付済・承認済の作業申請・工事申請）"""
+    template_name = 'workflow/occupancy_calendar.html'
+    required_roles = ['receiver', 'approver', 'admin']
     
-    def _get_user_approvable_types(self, user):
-        """ユーザーが承認可能な申請種別のリストを取得"""
-        cache_key = f'user_approvable_types_{user.id}'
-        types = cache.get(cache_key)
-        
-        if types is None:
-            user_roles = user.workflow_roles.filter(role__role_type='approver', role__is_active=True)
-            configs = ApplicationTypeConfig.objects.filter(
-                approver_role__in=[rm.role for rm in user_roles],
-                is_active=True
-            )
-            types = [config.application_type for config in configs]
-            
-            if not types:
-                types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
-            
-            cache.set(cache_key, types, 3600)
-        
-        return types
+    # 候補として表示する作業場所（直近に使用されたもの）
+    RECENT_LOCATION_DAYS = 90
+    RECENT_LOCATION_LIMIT = 100
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        today = timezone.localdate()
+        location = self.request.GET.get('location', '').strip()
+        
+        try:
+            year, month = (int(value) for value in self.request.GET.get('month', '').split('-'))
+            month_start = date(year, month, 1)
+        except ValueError:
+            month_start = today.replace(day=1)
+        
+        previous_month = (month_start - timedelta(days=1)).replace(day=1)
+        next_month = (month_start + timedelta(days=31)).replace(day=1)
+        
+        context.update({
+            'location': location,
+            'month_start': month_start,
+            'previous_month': previous_month,
+            'next_month': next_month,
+            'weeks': occupancy_calendar(location, month_start.year, month_start.month) if location else [],
+            'recent_locations': Application.objects.filter(
+                application_type__in=OCCUPANCY_TYPES,
+                status__in=OCCUPYING_STATUSES,
+                work_end_date__gte=today - timedelta(days=self.RECENT_LOCATION_DAYS),
+            ).exclude(work_location='').order_by('work_location').values_list(
+                'work_location', flat=True
+            ).distinct()[:self.RECENT_LOCATION_LIMIT],
+        })
+        return context
+
+
+@method_decorator(replica_reads, name='dispatch')
+class ReportView(LoginRequiredMixin, RoleRequiredMixin, TemplateView):
+    """リードタイム・滞留のレポート（refresh_reports コマンドで作成した日次集計のみを読む）"""
+    template_name = 'workflow/reports.html'
+    required_roles = ['approver', 'admin']
+    
+    DEFAULT_PERIOD_DAYS = 30
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        today = timezone.localdate()
+        date_to = self._parse_date('to') or today
+        date_from = self._parse_date('from') or date_to - timedelta(days=self.DEFAULT_PERIOD_DAYS - 1)
+        group_by = self.request.GET.get('group')
+        if group_by not in GROUP_FIELDS:
+            group_by = 'application_type'
+        
+        backlog_date, backlog_rows = backlog_report(group_by)
+        context.update({
+            'date_from': date_from,
+            'date_to': date_to,
+            'group_by': group_by,
+            'group_fields': GROUP_FIELDS,
+            'group_label': GROUP_FIELDS[group_by],
+            'bucket_labels': [label for _, label in DURATION_BUCKETS],
+            'lead_time_rows': lead_time_report(date_from, date_to, group_by),
+            'backlog_date': backlog_date,
+            'backlog_rows': backlog_rows,
+        })
+        return context
+    
+    def _parse_date(self, name):
+        try:
+            return date.fromisoformat(self.request.GET.get(name, ''))
+        except ValueError:
+            return None
+
+
+def _get_queue_subscription(user):
+    """ユーザーが購読するキューのチャネルと現在の件数を返す"""
+    profile_role = get_user_context(user).role
+    all_types = [choice[0] for choice in Application.APPLICATION_TYPE_CHOICES]
+    
+    queues = {}
+    if profile_role in ['receiver', 'admin']:
+        queues[RECEIVE_QUEUE] = ('submitted', all_types if profile_role == 'admin' else get_user_receivable_types(user))
+    if profile_role in ['approver', 'admin']:
+        queues[APPROVE_QUEUE] = ('received', all_types if profile_role == 'admin' else get_user_approvable_types(user))
+    
+    channels = []
+    counts = {}
+    for queue, (status, types) in queues.items():
+        channels.extend(channel_name(queue, application_type) for application_type in types)
+        counts[queue] = Application.objects.filter(
+            status=status,
+            application_type__in=types
+        ).exclude(applicant=user).count()
+    
+    return channels, counts
+
+
+async def queue_events(request):
+    """受付・承認キューの新着と件数の増減をServer-Sent Eventsで配信（ASGI専用）"""
+    # WSGIではストリームを同期的に読み切ろうとしてワーカーを占有するため配信しない
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return HttpResponse(status=401)
+    
+    channels, counts = await sync_to_async(_get_queue_subscription)(user)
+    if not channels:
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(
+        stream_queue_events(user.pk, channels, counts),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # リバースプロキシでのバッファリングを無効化
+    return response
+
+
+@login_required
+def notification_settings(request):
+    """メール通知の受け取り方（すぐに通知・まとめ通知）の設定"""
+    profile = UserProfile.objects.filter(user=request.user).first()
+    if profile is None:
+        messages.error(request, 'ユーザープロファイルが設定されていません。管理者にお問い合わせください。')
+        return redirect('workflow:dashboard')
+    
+    if request.method == 'POST':
+        form = NotificationSettingsForm(request.POST, instance=profile)
+        if form.is_valid():
+            # 役割などは変わらないため、ユーザーコンテキストのキャッシュを無効化しない
+            form.save(commit=False).save(update_fields=NotificationSettingsForm.Meta.fields)
+            messages.success(request, '通知設定を保存しました。')
+            return redirect('workflow:notification_settings')
+    else:
+        form = NotificationSettingsForm(instance=profile)
+    
+    return render(request, 'workflow/notification_settings.html', {
+        'form': form,
+        'pending_count': request.user.pending_notifications.count(),
+    })
+
+
+class InboxView(LoginRequiredMixin, ListView):
+    """受信箱（画面上の通知）"""
+    model = InboxNotification
+    template_name = 'workflow/inbox.html'
+    context_object_name = 'notifications'
+    paginate_by = 20
+    
+    def get_queryset(self):
+        queryset = InboxNotification.objects.filter(user=self.request.user)
+        if self.request.GET.get('unread'):
+            queryset = queryset.filter(is_read=False)
+        return queryset.order_by('-created_at')
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['unread_only'] = bool(self.request.GET.get('unread'))
+        return context
+
+
+@login_required
+def open_notification(request, pk):
+    """通知を既読にしてリンク先へ移動"""
+    notification = get_object_or_404(InboxNotification, pk=pk, user=request.user)
+    if not notification.is_read:
+        mark_read(request.user, pk)
+    return redirect(notification.url or 'workflow:inbox')
+
+
+@login_required
+def mark_all_notifications_read(request):
+    """受信箱の通知をすべて既読にする"""
+    if request.method == 'POST':
+        updated = mark_read(request.user)
+        if updated:
+            messages.success(request, f'{updated}件の通知を既読にしました。')
+    return redirect('workflow:inbox')
 
 
 @login_required